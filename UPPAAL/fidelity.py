@@ -0,0 +1,129 @@
+import copy
+import os
+from UPPAAL.uppaalAPI import prepare_model, run_model, VERIFYTA, XML_FILE, Q_FILE
+
+# Amounts a configuration is evaluated at by default, when extrapolating its time for the full amounts
+FIDELITY_AMOUNTS = (1, 2, 4)
+
+
+def full_amount(recipes):
+    """
+    :return: The largest amount of any recipe, which is what the amounts of a multi-fidelity evaluation stand in for
+    """
+    return max(r.amount for r in recipes)
+
+
+def total_amount(recipes):
+    """
+    :return: How many units of all recipes together are produced, which is what times are extrapolated along
+    """
+    return sum(r.amount for r in recipes)
+
+
+def reduced_recipes(recipes, amount):
+    """
+    :param recipes: A list of recipes
+    :param amount: The amount standing in for full_amount(recipes)
+    :return: Copies of the recipes with their amount scaled by amount / full_amount(recipes), rounded up, so recipes
+    of different amounts keep their proportions
+    """
+    full = full_amount(recipes)
+    result = []
+    for r in recipes:
+        reduced = copy.copy(r)
+        reduced.amount = min(r.amount, (r.amount * amount + full - 1) // full)
+        result.append(reduced)
+    return result
+
+
+def fidelity_levels(recipes, amounts=FIDELITY_AMOUNTS):
+    """
+    :param recipes: A list of recipes
+    :param amounts: The amounts to evaluate at
+    :return: The sorted amounts below the full amount. Empty if there are none, i.e. if the recipes are small enough
+    to be evaluated as they are.
+    """
+    return sorted({a for a in amounts if 0 < a < full_amount(recipes)})
+
+
+def extrapolate(points, amount):
+    """ Extrapolates the time of producing amount units from the steady state, i.e. from how much the time grew
+    between the two largest amounts evaluated. Once the line is full, each further unit should add about the same
+    time, as long as the recipes grow in proportion.
+    :param points: A list of (units, time) tuples, sorted by units, see total_amount
+    :param amount: The units to extrapolate to
+    :return: The extrapolated time
+    """
+    last_amount, last_time = points[-1]
+    if len(points) == 1:
+        return int(round(last_time * amount / last_amount))
+    previous_amount, previous_time = points[-2]
+    increment = (last_time - previous_time) / (last_amount - previous_amount)
+    return int(round(last_time + max(increment, 0) * (amount - last_amount)))
+
+
+def level_files(xml_file, q_file, amount):
+    """
+    :return: The model and query file of a level, next to xml_file and q_file
+    """
+    xml_base, xml_ext = os.path.splitext(xml_file)
+    q_base, q_ext = os.path.splitext(q_file)
+    suffix = '_amount' + str(amount)
+    return xml_base + suffix + xml_ext, q_base + suffix + q_ext
+
+
+def prepare_models(recipes, modules, levels, template_file, xml_file, q_file, instrumentation=None, canonical=False):
+    """ Writes a model and query of a configuration for each level, like prepare_model does for the full amounts.
+    :param recipes: A list of recipes
+    :param modules: A list of modules
+    :param levels: The amounts to write models for, see fidelity_levels
+    :param template_file: A path to a template UPPAAL CORA XML file, or its parts from split_template
+    :param xml_file: Path the models are written next to
+    :param q_file: Path the queries are written next to
+    :param instrumentation: If given, an Instrumentation that times the writing of the models
+    :param canonical: See prepare_model
+    :return: A list of (units, xml file, query file, maps) tuples, needed by run_models, units being the total_amount
+    of the level
+    """
+    prepared = []
+    for amount in levels:
+        level_xml, level_q = level_files(xml_file, q_file, amount)
+        reduced = reduced_recipes(recipes, amount)
+        maps = prepare_model(reduced, modules, template_file, level_xml, level_q, instrumentation, canonical)
+        prepared.append((total_amount(reduced), level_xml, level_q, maps))
+    return prepared
+
+
+def run_models(prepared, amount, verifyta=VERIFYTA, instrumentation=None, runner=None, model_cache=None):
+    """ Runs verifyta on the models written by prepare_models, and extrapolates the time of the full amount.
+    :param prepared: As returned by prepare_models
+    :param amount: The units of the full amounts, see total_amount
+    :param verifyta: A path to an instance of UPPAAL CORAs verifyta
+    :param instrumentation: If given, an Instrumentation that times verifyta and the parsing of its traces
+    :param runner: If given, runs verifyta instead of run_verifyta, see run_model
+    :param model_cache: If given, a ModelCache that is looked in before running verifyta
+    :return: Like run_model, but with the extrapolated time. Worked on, transported through, active works and the
+    profile are those of the largest level, as they show which modules are used and where the time goes but not how
+    much of it.
+    """
+    points = []
+    result = None
+    for units, level_xml, level_q, maps in prepared:
+        result = run_model(level_xml, level_q, maps, verifyta, instrumentation, runner, model_cache)
+        points.append((units, result[0]))
+
+    if instrumentation is not None:
+        instrumentation.count('fidelity/extrapolated')
+    return (extrapolate(points, amount),) + tuple(result[1:])
+
+
+def get_extrapolated_time(recipes, modules, levels, template_file, verifyta=VERIFYTA, xml_file=XML_FILE,
+                          q_file=Q_FILE, instrumentation=None, runner=None, model_cache=None):
+    """ Like get_best_time, but evaluates the configuration at reduced amounts and extrapolates the time of the full
+    amounts, which is much cheaper when they are large.
+    :param levels: The amounts to evaluate at, see fidelity_levels
+    :return: The extrapolated time along with the worked on, transported through and active works dicts
+    """
+    prepared = prepare_models(recipes, modules, levels, template_file, xml_file, q_file, instrumentation,
+                              canonical=model_cache is not None)
+    return run_models(prepared, total_amount(recipes), verifyta, instrumentation, runner, model_cache)
@@ -0,0 +1,103 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+from collections import deque
+
+
+def model_key(xml_file, q_file):
+    """
+    :param xml_file: Path to a model written by prepare_model
+    :param q_file: Path to its query
+    :return: A hash of the content of both files
+    """
+    h = hashlib.sha256()
+    with open(xml_file, 'rb') as f:
+        h.update(f.read())
+    h.update(b'\0')
+    with open(q_file, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def canonical_modules(recipes, modules):
+    """ Orders modules by a breadth first search from the start modules of the recipes, following connections in the
+    order up, right, down, left. When a model cache is used, prepare_model numbers modules in this order, so layouts
+    that only differ in which of several alike modules sits where give the same model. Modules no recipe can reach
+    come last, in the order they were given.
+    :param recipes: A list of recipes
+    :param modules: A list of the modules in a configuration
+    :return: All of modules, the reachable ones in canonical order first
+    """
+    by_id = {m.m_id: m for m in modules}
+    visited = set()
+    queue = deque()
+    for r in recipes:
+        start = by_id.get(r.start_module)
+        if start is not None and start not in visited:
+            visited.add(start)
+            queue.append(start)
+
+    result = []
+    while queue:
+        m = queue.popleft()
+        result.append(m)
+        for c in m.connections:
+            if c is not None and c.m_id in by_id and c not in visited:
+                visited.add(c)
+                queue.append(c)
+    return result + [m for m in modules if m not in visited]
+
+
+class ModelCache:
+    """ Results of verifyta stored by the content of the model and query it was run on, see model_key. Many
+    configurations give the same model, so this finds repeated work that the configuration strings can not show.
+    Results are stored with the ids of the model, and run_model maps them back to the modules of each configuration.
+    Safe to use from several threads. If given a path, results are also kept in a SQLite file, so later runs can use
+    them.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: Path of a SQLite file to keep results in, None to only keep them in memory
+        """
+        self.results = {}
+        self.lock = threading.Lock()
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS models (key TEXT PRIMARY KEY, result BLOB)')
+            self.connection.commit()
+
+    def get(self, key):
+        """
+        :param key: A key from model_key
+        :return: The result stored for the model, None if there is none
+        """
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+            if self.connection is None:
+                return None
+            row = self.connection.execute('SELECT result FROM models WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            result = pickle.loads(row[0])
+            self.results[key] = result
+            return result
+
+    def put(self, key, result):
+        """
+        :param key: A key from model_key
+        :param result: (time, worked on, transported through, active works) with the ids of the model
+        """
+        with self.lock:
+            self.results[key] = result
+            if self.connection is not None:
+                self.connection.execute('INSERT OR IGNORE INTO models VALUES (?, ?)', (key, pickle.dumps(result)))
+                self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
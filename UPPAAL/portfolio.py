@@ -0,0 +1,169 @@
+import subprocess
+import threading
+from queue import Queue
+from UPPAAL.verifytaAPI import property_satisfied, trace_time
+
+# Option sets raced by default. They only differ in search order, so they all find the fastest trace.
+PORTFOLIO_OPTIONS = [("-t 2", "-o 3", "-u", "-y"),
+                     ("-t 2", "-o 0", "-u", "-y"),
+                     ("-t 2", "-o 1", "-u", "-y")]
+
+
+def instance_class(maps):
+    """
+    :param maps: The id maps returned by prepare_model
+    :return: The class of a model used for the statistics of a Portfolio: its number of modules, work types and
+    recipe instances
+    """
+    m_map, w_map, r_map = maps
+    return len(m_map), len(w_map), len(r_map)
+
+
+def valid_result(returncode, stdout, stderr):
+    """
+    :return: Whether a run of verifyta gave a result that can be used, i.e. it exited normally, the property is
+    satisfied and the trace has a time. verifyta also exits with 0 when the property is not satisfied.
+    """
+    if returncode != 0 or not property_satisfied(stdout):
+        return False
+    try:
+        trace_time(stderr)
+    except RuntimeError:
+        return False
+    return True
+
+
+class Portfolio:
+    """ Runs verifyta with several option sets at once on the same model, takes the first valid result and kills the
+    rest. It keeps count of which option set wins for each class of model, and once one of them clearly wins a class,
+    only that one is run for it. Every recheck_every runs of a decided class are raced again, in case it changes.
+    An instance is called like run_verifyta, and can be given as the runner of run_model. It is safe to use from the
+    worker threads of an EvaluationPipeline, but note that each of them then runs len(option_sets) processes.
+    """
+    def __init__(self, option_sets=PORTFOLIO_OPTIONS, min_races=10, dominance=0.7, recheck_every=50):
+        """
+        :param option_sets: A list of tuples of verifyta options
+        :param min_races: How many races of a class must be run before an option set can be picked for it
+        :param dominance: The share of the races of a class an option set must have won to be picked for it
+        :param recheck_every: How often a decided class is raced again, None to never do so
+        """
+        self.option_sets = [tuple(o) for o in option_sets]
+        self.min_races = min_races
+        self.dominance = dominance
+        self.recheck_every = recheck_every
+
+        self.lock = threading.Lock()
+        self.wins = {}  # class -> list of wins per option set
+        self.decided = {}  # class -> index of the option set picked for it
+        self.runs = {}  # class -> runs since it was decided
+
+    def __call__(self, xml, queries, verifyta, maps=None, instrumentation=None):
+        """
+        :param xml: string giving the path to a uppaal project XML file
+        :param queries: string giving the path to a uppaal query file
+        :param verifyta: string giving the path to verifyta
+        :param maps: The id maps of the model, used for finding its class. If None, all models are one class.
+        :param instrumentation: If given, the winners and the exit status and output sizes of verifyta are counted in it
+        :return 0: Returns the standard output, i.e. if the queries were satisfied
+        :return 1: Returns the trace(s) of the queries.
+        """
+        key = instance_class(maps) if maps is not None else None
+        indices = self.candidates(key)
+        if len(indices) == 1:
+            returncode, stdout, stderr = self.run_single(xml, queries, verifyta, indices[0])
+            winner = indices[0]
+            if not valid_result(returncode, stdout, stderr):
+                # The option set picked for the class failed on this model, so the others are raced on it
+                others = [i for i in range(len(self.option_sets)) if i != winner]
+                winner = None
+                if others:
+                    if instrumentation is not None:
+                        instrumentation.count('portfolio/fallback')
+                    winner, returncode, stdout, stderr = self.race(xml, queries, verifyta, others)
+                    if winner is not None:
+                        self.record(key, winner)
+        else:
+            winner, returncode, stdout, stderr = self.race(xml, queries, verifyta, indices)
+            if winner is not None:
+                self.record(key, winner)
+
+        if instrumentation is not None:
+            instrumentation.count('verifyta/exit_' + str(returncode))
+            instrumentation.count('verifyta/stdout_bytes', len(stdout))
+            instrumentation.count('verifyta/trace_bytes', len(stderr))
+            instrumentation.count('portfolio/' + ('race' if len(indices) > 1 else 'single'))
+            if winner is not None:
+                instrumentation.count('portfolio/win_' + ' '.join(self.option_sets[winner]))
+        return stdout, stderr
+
+    def candidates(self, key):
+        """
+        :return: The indices of the option sets to run for a class
+        """
+        with self.lock:
+            if key in self.decided:
+                self.runs[key] += 1
+                if self.recheck_every is None or self.runs[key] % self.recheck_every:
+                    return [self.decided[key]]
+        return list(range(len(self.option_sets)))
+
+    def record(self, key, winner):
+        with self.lock:
+            wins = self.wins.setdefault(key, [0] * len(self.option_sets))
+            wins[winner] += 1
+            total = sum(wins)
+            best = max(range(len(wins)), key=lambda i: wins[i])
+            if total >= self.min_races and wins[best] >= self.dominance * total:
+                if self.decided.get(key) != best:
+                    self.runs[key] = 0
+                self.decided[key] = best
+            elif key in self.decided:
+                del self.decided[key]
+
+    def run_single(self, xml, queries, verifyta, index):
+        res = subprocess.run([verifyta, xml, queries] + list(self.option_sets[index]), stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        return res.returncode, res.stdout, res.stderr
+
+    def race(self, xml, queries, verifyta, indices):
+        """ Starts an option set for each of indices, and waits for the first to give a valid result, see valid_result.
+        :return: (index of the winner, exit status, stdout, stderr). If none are valid, the winner is None and the
+        output is that of the last one to finish.
+        """
+        results = Queue()
+
+        def wait_for(index, process):
+            stdout, stderr = process.communicate()
+            results.put((index, process.returncode, stdout, stderr))
+
+        processes = []
+        threads = []
+        for index in indices:
+            process = subprocess.Popen([verifyta, xml, queries] + list(self.option_sets[index]),
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            thread = threading.Thread(target=wait_for, args=(index, process), daemon=True)
+            thread.start()
+            processes.append(process)
+            threads.append(thread)
+
+        try:
+            for _ in indices:
+                index, returncode, stdout, stderr = results.get()
+                if valid_result(returncode, stdout, stderr):
+                    return index, returncode, stdout, stderr
+            return None, returncode, stdout, stderr
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+            for thread in threads:
+                thread.join()
+
+    def statistics(self):
+        """
+        :return: A dict from each class to a dict with the wins of each option set and the option set picked for it
+        """
+        with self.lock:
+            return {key: {'wins': {' '.join(o): w for o, w in zip(self.option_sets, wins)},
+                          'decided': ' '.join(self.option_sets[self.decided[key]]) if key in self.decided else None}
+                    for key, wins in self.wins.items()}
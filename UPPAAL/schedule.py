@@ -0,0 +1,148 @@
+from array import array
+
+# Kinds of events in a schedule
+ARRIVE = 0  # A recipe arrived at a module, put there by the transporter of another
+START = 1  # The worker of a module took a recipe
+WORK = 2  # The worker of a module started a work on a recipe
+EVENT_NAMES = ('arrive', 'start', 'work')
+
+
+class Schedule:
+    """ The production schedule of a configuration, as a table of events in columns: time, recipe, module, kind and
+    work. Recipes, modules and works are stored as indices into name tables, so the table takes a few bytes per event
+    and renaming the ids, e.g. from those of the model to those of the configuration, only touches the names.
+    Recipes are numbered per unit produced, i.e. recipe_names has a name for each unit, and works are -1 for events
+    other than WORK.
+    """
+    def __init__(self):
+        self.times = array('q')
+        self.recipes = array('i')
+        self.modules = array('i')
+        self.kinds = array('b')
+        self.works = array('i')
+        self.recipe_names = []
+        self.module_names = []
+        self.work_names = []
+        self.makespan = 0
+
+        self._indices = ({}, {}, {})  # recipe, module and work name -> index, only used while adding events
+
+    def add(self, time, kind, recipe, module, work=None):
+        """ Adds an event. Events are expected in the order of time, as they are in a trace.
+        :param time: When it happened
+        :param kind: ARRIVE, START or WORK
+        :param recipe: Id of the unit of a recipe
+        :param module: Id of the module
+        :param work: Id of the work, for WORK events
+        """
+        self.times.append(time)
+        self.recipes.append(self._index(0, self.recipe_names, recipe))
+        self.modules.append(self._index(1, self.module_names, module))
+        self.kinds.append(kind)
+        self.works.append(self._index(2, self.work_names, work) if work is not None else -1)
+
+    def _index(self, table, names, name):
+        indices = self._indices[table]
+        if name not in indices:
+            indices[name] = len(names)
+            names.append(name)
+        return indices[name]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getstate__(self):
+        state = dict(vars(self))
+        state['_indices'] = None  # Rebuilt from the names when needed
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._indices = tuple({name: i for i, name in enumerate(names)}
+                              for names in (self.recipe_names, self.module_names, self.work_names))
+
+    def relabel(self, module_map, recipe_map, work_map):
+        """
+        :param module_map: A mapping from the module ids of the schedule to new ones
+        :param recipe_map: A mapping from the recipe ids to new ones, several units may get the same name
+        :param work_map: A mapping from the work ids to new ones
+        :return: A copy of the schedule with the new ids. The columns are shared with this schedule.
+        """
+        copy = Schedule.__new__(Schedule)
+        vars(copy).update(vars(self))
+        copy.recipe_names = [recipe_map[r] for r in self.recipe_names]
+        copy.module_names = [module_map[m] for m in self.module_names]
+        copy.work_names = [work_map[w] for w in self.work_names]
+        copy._indices = None
+        return copy
+
+    def events(self, kind=None):
+        """
+        :param kind: If given, only events of this kind
+        :return: A generator of (time, kind name, recipe name, module id, work) tuples, work being None for events other
+        than WORK
+        """
+        for i in range(len(self.times)):
+            if kind is None or self.kinds[i] == kind:
+                w = self.works[i]
+                yield (self.times[i], EVENT_NAMES[self.kinds[i]], self.recipe_names[self.recipes[i]],
+                       self.module_names[self.modules[i]], self.work_names[w] if w >= 0 else None)
+
+    def busy_times(self, modules):
+        """
+        :param modules: A dict from m_id to module, e.g. module_dictionary of a config_string_handler, for the
+        processing times, which are not in the schedule
+        :return: A dict from m_id to how long its worker worked
+        """
+        busy = [0] * len(self.module_names)
+        p_times = [modules[m].p_time for m in self.module_names]
+        for kind, m, w in zip(self.kinds, self.modules, self.works):
+            if kind == WORK:
+                busy[m] += p_times[m][self.work_names[w]]
+        return dict(zip(self.module_names, busy))
+
+    def utilisation(self, modules):
+        """
+        :param modules: A dict from m_id to module, see busy_times
+        :return: A dict from m_id to the share of the makespan its worker worked
+        """
+        busy = self.busy_times(modules)
+        return {m: t / self.makespan if self.makespan else 0.0 for m, t in busy.items()}
+
+    def throughput(self):
+        """
+        :return: Units of recipes produced per unit of time
+        """
+        return len(self.recipe_names) / self.makespan if self.makespan else 0.0
+
+    def makespan_breakdown(self, modules):
+        """ Splits up the time of the unit done last, which is what sets the makespan.
+        :param modules: A dict from m_id to module, see busy_times
+        :return: A dict with the recipe name of the unit, and how much of its time it was worked on, waited for workers
+        and spent otherwise, i.e. being transported or waiting to be released. None if nothing was worked on.
+        """
+        finish = {}  # unit -> when its last work ended
+        processing = {}
+        waiting = {}
+        arrived = {}
+        for time, kind, r, m, w in zip(self.times, self.kinds, self.recipes, self.modules, self.works):
+            if kind == ARRIVE:
+                arrived[r] = time
+            elif kind == START:
+                # As in trace_profile, only the wait after arriving or being released is known
+                if r in arrived or r not in processing:
+                    waiting[r] = waiting.get(r, 0) + time - arrived.pop(r, 0)
+                    processing.setdefault(r, 0)
+            else:
+                p = modules[self.module_names[m]].p_time[self.work_names[w]]
+                processing[r] = processing.get(r, 0) + p
+                finish[r] = max(finish.get(r, 0), time + p)
+        if not finish:
+            return None
+
+        last = max(finish, key=lambda r: finish[r])
+        return {'recipe': self.recipe_names[last],
+                'finish': finish[last],
+                'processing': processing[last],
+                'waiting': waiting.get(last, 0),
+                'other': finish[last] - processing[last] - waiting.get(last, 0)}
@@ -0,0 +1,206 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from UPPAAL.portfolio import instance_class
+from UPPAAL.uppaalAPI import VERIFYTA_OPTIONS
+
+DEFAULT_MEMORY_SHARE = 0.8  # Share of the physical memory the running verifytas may use together by default
+OUT_OF_MEMORY_MESSAGES = (b'bad_alloc', b'out of memory', b'Out of memory', b'Cannot allocate memory')
+
+
+class VerifytaLimitExceeded(RuntimeError):
+    """ verifyta was stopped by a limit of the VerifytaScheduler. Unlike other RuntimeErrors from evaluating, running it
+    again will most likely fail the same way.
+    """
+
+
+class VerifytaTimeout(VerifytaLimitExceeded):
+    pass
+
+
+class VerifytaOutOfMemory(VerifytaLimitExceeded):
+    pass
+
+
+def physical_memory():
+    """
+    :return: Bytes of physical memory, None if it can not be found
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class VerifytaScheduler:
+    """ Runs verifyta with a wall clock limit and an address space limit (RLIMIT_AS), and only starts a run when the
+    memory it is expected to use fits next to the runs already going. The expected memory of a run is the largest peak
+    seen for its class of model, see portfolio.instance_class. Runs that hit a limit raise a VerifytaLimitExceeded.
+    An instance is called like run_verifyta, and can be given as the runner of run_model. POSIX only.
+    """
+    def __init__(self, timeout=None, memory_limit=None, max_memory=None, headroom=1.25, options=VERIFYTA_OPTIONS):
+        """
+        :param timeout: Seconds a run may take, None for no limit
+        :param memory_limit: Bytes of address space a run may use, None for no limit
+        :param max_memory: Bytes all running verifytas may use together, by default DEFAULT_MEMORY_SHARE of the
+        physical memory
+        :param headroom: Factor the peak of a class is multiplied by, to get the memory expected by its runs
+        :param options: The verifyta options
+        """
+        if max_memory is None:
+            memory = physical_memory()
+            max_memory = int(memory * DEFAULT_MEMORY_SHARE) if memory else None
+
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_memory = max_memory
+        self.headroom = headroom
+        self.options = tuple(options)
+
+        self.condition = threading.Condition()
+        self.running = 0
+        self.reserved = 0  # Expected memory of the running verifytas
+        self.peaks = {}  # class -> largest peak memory in bytes
+        self.counts = {'runs': 0, 'timeouts': 0, 'out_of_memory': 0, 'admission_waits': 0}
+
+    def __call__(self, xml, queries, verifyta, maps=None, instrumentation=None):
+        """
+        :param xml: string giving the path to a uppaal project XML file
+        :param queries: string giving the path to a uppaal query file
+        :param verifyta: string giving the path to verifyta
+        :param maps: The id maps of the model, used for finding its class. If None, all models are one class.
+        :param instrumentation: If given, admission waits, limits hit and the exit status and output sizes of verifyta
+        are counted in it
+        :return 0: Returns the standard output, i.e. if the queries were satisfied
+        :return 1: Returns the trace(s) of the queries.
+        """
+        key = instance_class(maps) if maps is not None else None
+        estimate = self.estimate(key)
+
+        started = time.perf_counter()
+        self.admit(estimate)
+        if instrumentation is not None:
+            instrumentation.add_time('scheduler/admission', time.perf_counter() - started)
+
+        try:
+            returncode, stdout, stderr, peak, timed_out = self.run([verifyta, xml, queries] + list(self.options))
+        finally:
+            self.release(estimate)
+
+        out_of_memory = not timed_out and returncode != 0 and \
+            ((self.memory_limit and returncode < 0) or any(m in stdout + stderr for m in OUT_OF_MEMORY_MESSAGES))
+
+        with self.condition:
+            self.counts['runs'] += 1
+            self.counts['timeouts'] += timed_out
+            self.counts['out_of_memory'] += out_of_memory
+            if peak is not None:
+                self.peaks[key] = max(peak, self.peaks.get(key, 0))
+
+        if instrumentation is not None:
+            instrumentation.count('verifyta/exit_' + str(returncode))
+            instrumentation.count('verifyta/stdout_bytes', len(stdout))
+            instrumentation.count('verifyta/trace_bytes', len(stderr))
+
+        if timed_out:
+            if instrumentation is not None:
+                instrumentation.count('scheduler/timeout')
+            raise VerifytaTimeout('verifyta ran for more than ' + str(self.timeout) + ' seconds on ' + xml)
+        if out_of_memory:
+            if instrumentation is not None:
+                instrumentation.count('scheduler/out_of_memory')
+            raise VerifytaOutOfMemory('verifyta ran out of memory on ' + xml)
+        return stdout, stderr
+
+    def estimate(self, key):
+        """
+        :return: Bytes a run of a class is expected to use. Before anything is known, it is the memory limit if there is
+        one, and otherwise the largest peak of any class.
+        """
+        with self.condition:
+            if key in self.peaks:
+                peak = self.peaks[key]
+            elif self.memory_limit:
+                return self.memory_limit
+            else:
+                peak = max(self.peaks.values(), default=0)
+        return int(peak * self.headroom)
+
+    def admit(self, estimate):
+        """ Waits until estimate fits next to the running verifytas. A run is always admitted when nothing is running.
+        """
+        with self.condition:
+            if self.max_memory is not None and self.running and self.reserved + estimate > self.max_memory:
+                self.counts['admission_waits'] += 1
+                while self.running and self.reserved + estimate > self.max_memory:
+                    self.condition.wait()
+            self.running += 1
+            self.reserved += estimate
+
+    def release(self, estimate):
+        with self.condition:
+            self.running -= 1
+            self.reserved -= estimate
+            self.condition.notify_all()
+
+    def limited(self, args):
+        """ The limit on the address space is set by a shell that then execs verifyta, instead of in a preexec_fn,
+        which is not safe while other threads run, as the threads of the evaluators do. The shell is replaced by
+        verifyta, so the process is still the one that is waited for.
+        :return: args, wrapped so the command runs under memory_limit
+        """
+        if not self.memory_limit:
+            return args
+        return ['/bin/sh', '-c', 'ulimit -v ' + str(self.memory_limit // 1024) + ' && exec "$@"', args[0]] + args
+
+    def run(self, args):
+        """ Runs a process, reaping it ourselves so its peak memory is known.
+        :return: (exit status, stdout, stderr, peak memory in bytes or None, True if it was killed for taking too long)
+        """
+        process = subprocess.Popen(self.limited(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = {}
+        usage = []
+
+        def read(name, stream):
+            output[name] = stream.read()
+            stream.close()
+
+        def reap():
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            usage.append(rusage)
+
+        threads = [threading.Thread(target=read, args=('stdout', process.stdout), daemon=True),
+                   threading.Thread(target=read, args=('stderr', process.stderr), daemon=True)]
+        for thread in threads:
+            thread.start()
+        reaper = threading.Thread(target=reap, daemon=True)
+        reaper.start()
+
+        reaper.join(self.timeout)
+        timed_out = reaper.is_alive()
+        if timed_out:
+            # Not process.kill, as it may reap the process before wait4 does. Until reaped the pid can not be reused.
+            os.kill(process.pid, signal.SIGKILL)
+            reaper.join()
+        for thread in threads:
+            thread.join()
+
+        peak = None
+        if usage:
+            # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+            peak = usage[0].ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        return process.returncode, output.get('stdout', b''), output.get('stderr', b''), peak, timed_out
+
+    def statistics(self):
+        """
+        :return: A dict with the number of runs, timeouts, runs out of memory and admission waits, and the peak memory
+        of each class in bytes
+        """
+        with self.condition:
+            result = dict(self.counts)
+            result['peaks'] = dict(self.peaks)
+            return result
@@ -1,6 +1,9 @@
 from UPPAAL.verifytaAPI import run_verifyta, trace_time, property_satisfied, pprint
 from UPPAAL.xml_generator import generate_xml
+from UPPAAL.model_cache import canonical_modules, model_key
+from UPPAAL.schedule import Schedule, ARRIVE, START, WORK
 import re
+from contextlib import nullcontext
 
 XML_FILE = 'temp.xml'
 Q_FILE = 'temp.q'
@@ -8,31 +11,136 @@ Q_FILE = 'temp.q'
 VERIFYTA = '../UPPAAL/verifyta'
 XML_TEMPLATE = "../../Modeler/iter3.4.2.xml"
 
-def get_best_time(recipes, modules, template_file=XML_TEMPLATE, verifyta=VERIFYTA):
+VERIFYTA_OPTIONS = ("-t 2", "-o 3", "-u", "-y")
+
+
+def get_best_time(recipes, modules, template_file=XML_TEMPLATE, verifyta=VERIFYTA, xml_file=XML_FILE, q_file=Q_FILE,
+                  instrumentation=None, runner=None, model_cache=None):
     """
     Gets the best cost of a given configuration, modules and recipes
     :param configuration: A configuraion of modules
     :param modules: A list of modules
     :param recipes: A list of recipes
-    :param template_file: A path to a template UPPAAL CORA XML file
+    :param template_file: A path to a template UPPAAL CORA XML file, or its parts from split_template
     :param verifyta: A path to an instance of UPPAAL CORAs verifyta
+    :param xml_file: Path the model is written to
+    :param q_file: Path the query is written to
+    :param instrumentation: If given, an Instrumentation that times the phases of the evaluation
+    :param runner: If given, runs verifyta instead of run_verifyta, see run_model
+    :param model_cache: If given, a ModelCache that is looked in before running verifyta
     :return: The best cost of the configuration
     """
-    m_map, w_map, r_map =\
-        generate_xml(template_file=template_file, modules=modules.copy(), recipes=recipes.copy(), xml_name=XML_FILE, q_name=Q_FILE)
+    maps = prepare_model(recipes, modules, template_file, xml_file, q_file, instrumentation,
+                         canonical=model_cache is not None)
+    return run_model(xml_file, q_file, maps, verifyta, instrumentation, runner, model_cache)
+
+
+def _phase(instrumentation, name):
+    return instrumentation.phase(name) if instrumentation is not None else nullcontext()
+
+
+def prepare_model(recipes, modules, template_file, xml_file, q_file, instrumentation=None, canonical=False):
+    """
+    Writes the UPPAAL model and query of a configuration. This reads the connections of the module objects, so it has to
+    happen before they are changed, while run_model can happen later and in another thread.
+    :param recipes: A list of recipes
+    :param modules: A list of modules
+    :param template_file: A path to a template UPPAAL CORA XML file, or its parts from split_template
+    :param xml_file: Path the model is written to
+    :param q_file: Path the query is written to
+    :param instrumentation: If given, an Instrumentation that times the writing of the model
+    :param canonical: If true, modules are numbered in the order of canonical_modules, so alike configurations give
+    byte-identical models and share their results in a model cache. Otherwise they are numbered in the order given.
+    :return: The module, work and recipe id maps needed by run_model
+    """
+    with _phase(instrumentation, 'generate_xml'):
+        ordered = canonical_modules(recipes, modules) if canonical else modules.copy()
+        return generate_xml(template_file=template_file, modules=ordered, recipes=recipes.copy(),
+                            xml_name=xml_file, q_name=q_file)
+
+
+def run_model(xml_file, q_file, maps, verifyta=VERIFYTA, instrumentation=None, runner=None, model_cache=None):
+    """
+    Runs verifyta on a model written by prepare_model
+    :param xml_file: Path to the model
+    :param q_file: Path to the query
+    :param maps: The id maps returned by prepare_model
+    :param verifyta: A path to an instance of UPPAAL CORAs verifyta
+    :param instrumentation: If given, an Instrumentation that times verifyta and the parsing of its trace
+    :param runner: If given, it is called with (xml_file, q_file, verifyta, maps, instrumentation) and returns the
+    output of verifyta like run_verifyta does, e.g. a Portfolio. Otherwise run_verifyta is used with VERIFYTA_OPTIONS.
+    :param model_cache: If given, a ModelCache. If it has a result for the content of the model and query, verifyta is
+    not run. Otherwise the result is added to it.
+    :return: The best time along with the worked on, transported through and active works dicts and the profile of
+    the schedule, see trace_profile
+    """
+    key = None
+    if model_cache is not None:
+        with _phase(instrumentation, 'model_cache'):
+            key = model_key(xml_file, q_file)
+            cached = model_cache.get(key)
+        if cached is not None:
+            if instrumentation is not None:
+                instrumentation.count('model_cache/hit')
+            return remap_result(cached, maps)
+        if instrumentation is not None:
+            instrumentation.count('model_cache/miss')
 
-    result, trace = run_verifyta(XML_FILE, Q_FILE, "-t 2", "-o 3", "-u", "-y", verifyta=verifyta)
+    with _phase(instrumentation, 'verifyta'):
+        if runner is None:
+            result, trace = run_verifyta(xml_file, q_file, *VERIFYTA_OPTIONS, verifyta=verifyta,
+                                         instrumentation=instrumentation)
+        else:
+            result, trace = runner(xml_file, q_file, verifyta, maps, instrumentation)
 
     if property_satisfied(result):
-        time = trace_time(trace)
-        trace_iter = iter((trace.decode('utf-8')).splitlines())
-        worked_on, transported_through, active_works = get_travsersal_info(trace_iter, m_map, r_map, w_map)
+        with _phase(instrumentation, 'parse_trace'):
+            time = trace_time(trace)
+            trace_iter = iter((trace.decode('utf-8')).splitlines())
+            identity = IdentityMap()
+            model_result = (time,) + get_travsersal_info(trace_iter, identity, identity, identity)
 
-        return time, worked_on, transported_through, active_works
+        if model_cache is not None:
+            model_cache.put(key, model_result)
+        return remap_result(model_result, maps)
     else:
         raise RuntimeError("Could not verify the properties, see the temp files")
 
 
+class IdentityMap(dict):
+    """ Maps every id to itself, for parsing a trace without leaving the ids of the model.
+    """
+    def __missing__(self, key):
+        return key
+
+
+def remap_result(model_result, maps):
+    """
+    :param model_result: (time, worked on, transported through, active works, profile) with the ids of the model
+    :param maps: The id maps returned by prepare_model
+    :return: The same result with the ids of the modules, works and recipes of the configuration
+    """
+    m_map, w_map, r_map = maps
+    time, worked_on, transported_through, active_works = model_result[:4]
+    # Results cached before profiles were kept have none
+    profile = model_result[4] if len(model_result) > 4 else None
+    if profile is not None:
+        waits = {}
+        for r, wait in profile['recipe_wait'].items():
+            waits[r_map[r]] = waits.get(r_map[r], 0) + wait
+        profile = trace_profile({m_map[m]: {w_map[w]: n for w, n in ws.items()} for m, ws in profile['works'].items()},
+                                {m_map[m]: t for m, t in profile['queue_time'].items()},
+                                waits,
+                                [m_map[m] for m in profile['critical']],
+                                profile['schedule'].relabel(m_map, r_map, w_map)
+                                if profile.get('schedule') is not None else None)
+    return (time,
+            {m_map[m]: {r_map[r] for r in rs} for m, rs in worked_on.items()},
+            {m_map[m]: {r_map[r] for r in rs} for m, rs in transported_through.items()},
+            {m_map[m]: {w_map[w] for w in ws} for m, ws in active_works.items()},
+            profile)
+
+
 
 def get_travsersal_info(trace_iter, module_map, recipe_map, work_map):
     """
@@ -41,14 +149,29 @@ def get_travsersal_info(trace_iter, module_map, recipe_map, work_map):
     :param recipe_map: A mapping from UPPAAL r_ids to the originals
     :return: worked on: dict telling us for each module, what recipe types have been worked by it
              transported_through: dict telling us for each module, what recipe types have been transorted through it.
+             active_works: dict telling us for each module, what works it has done
+             profile: how the time was spent, see trace_profile
     """
 
     worked_on = {}
     transported_through = {}
     active_works = {}
 
+    # Timing, followed through the delays and clock values of the trace
+    now = 0
+    works = {}  # m_id -> {w_id: how many times it was done}
+    queue_time = {}  # m_id -> time recipes waited in it for its worker
+    recipe_wait = {}  # r_id -> time it waited for workers
+    arrived = {}  # r_id -> when it arrived at the module it is on
+    last_work = {}  # r_id -> (when it last started work, modules it was worked on by in order)
+    schedule = Schedule()  # In the ids of the trace, renamed at the end
+
     for line in trace_iter:
-        if line == "Transitions:":
+        if line.startswith("Delay:"):
+            now += int(re.findall("\d+", line)[0])
+        elif "global_c=" in line:
+            now = int(re.findall("global_c=(\d+)", line)[0])
+        elif line == "Transitions:":
                 lines = []
                 counter = 0
 
@@ -64,8 +187,21 @@ def get_travsersal_info(trace_iter, module_map, recipe_map, work_map):
                     r_id = int(re.findall("\d+", lines[0])[0])
 
                     m_id = int(re.findall("\d+", lines[1])[0])
+                    schedule.add(now, START, r_id, m_id)
                     m_id = module_map[m_id]
 
+                    # The recipe waited from arriving at the module, or from being released, until the worker took
+                    # it. Later works on the same module are not counted, as the trace does not say when the one
+                    # before them ended.
+                    if r_id in arrived or r_id not in last_work:
+                        wait = now - arrived.pop(r_id, 0)
+                        queue_time[m_id] = queue_time.get(m_id, 0) + wait
+                        recipe_wait[r_id] = recipe_wait.get(r_id, 0) + wait
+                    visited = last_work.get(r_id, (0, []))[1]
+                    if m_id not in visited:
+                        visited.append(m_id)
+                    last_work[r_id] = (now, visited)
+
                     if m_id not in worked_on:
                         worked_on[m_id] = set()
 
@@ -74,15 +210,17 @@ def get_travsersal_info(trace_iter, module_map, recipe_map, work_map):
 
                 if "work" in lines[0] and 'Handshaking' in lines[0]:
                     m_id = int(re.findall("\d+", lines[0])[0])
-                    m_id = module_map[m_id]
-
                     w_id = int(re.findall('\[(.*?)\]', lines[1])[0])
+                    schedule.add(now, WORK, int(re.findall("\d+", lines[1])[0]), m_id, w_id)
+                    m_id = module_map[m_id]
                     w_id = work_map[w_id]
 
                     if m_id not in active_works:
                         active_works[m_id] = set()
 
                     active_works[m_id].add(w_id)
+                    module_works = works.setdefault(m_id, {})
+                    module_works[w_id] = module_works.get(w_id, 0) + 1
 
                 # If the transition is an enqueue using a transporter. Transportation is being performed.
                 elif "enqueue" in lines[0] and "mtransporter" in lines[0]:
@@ -100,6 +238,8 @@ def get_travsersal_info(trace_iter, module_map, recipe_map, work_map):
 
                     # Gets the id of the recipe, lying in the global var
                     r_id = int(re.findall("var=(\d+)", state_line)[0])
+                    arrived[r_id] = now
+                    schedule.add(now, ARRIVE, r_id, int(re.findall("\d+", lines[1])[0]))
 
                     if m_id not in transported_through:
                         transported_through[m_id] = set()
@@ -107,4 +247,23 @@ def get_travsersal_info(trace_iter, module_map, recipe_map, work_map):
                     # Adds recipe type to the given module
                     transported_through[m_id].add(recipe_map[r_id])
 
-    return worked_on, transported_through, active_works
\ No newline at end of file
+    waits = {}
+    for r_id, wait in recipe_wait.items():
+        waits[recipe_map[r_id]] = waits.get(recipe_map[r_id], 0) + wait
+    critical = max(last_work.values(), key=lambda x: x[0])[1] if last_work else []
+    schedule.makespan = now
+    schedule = schedule.relabel(module_map, recipe_map, work_map)
+    return worked_on, transported_through, active_works, trace_profile(works, queue_time, waits, critical, schedule)
+
+
+def trace_profile(works, queue_time, recipe_wait, critical, schedule=None):
+    """ How the time of a schedule was spent, which shows where its bottlenecks are, see configuration.bottlenecks.
+    :param works: A dict from m_id to a dict from each work it did to how many times it did it
+    :param queue_time: A dict from m_id to the total time recipes waited in its queue for its worker
+    :param recipe_wait: A dict from recipe name to the total time its recipes waited for workers
+    :param critical: The m_ids that worked on the recipe that was done last, in the order they did
+    :param schedule: The Schedule the profile was found from
+    :return: A dict of the above
+    """
+    return {'works': works, 'queue_time': queue_time, 'recipe_wait': recipe_wait, 'critical': critical,
+            'schedule': schedule}
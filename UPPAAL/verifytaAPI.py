@@ -2,16 +2,21 @@ import subprocess
 import re
 
 
-def run_verifyta(xml, queries, *args, verifyta):
+def run_verifyta(xml, queries, *args, verifyta, instrumentation=None):
     """
     :param xml: string giving the path to a uppaal project XML file
     :param queries: string giving the path to a uppaal query file
     :param *args: other args giving to verifyta, e.g. -t 2 for getting the fastest trace.
     :param verifyta: string giving the path to verifyta
+    :param instrumentation: If given, the exit status and output sizes of verifyta are counted in it
     :return 0: Returns the standard output, i.e. if the queries were satisfied
     :return 1: Returns the trace(s) of the queries.
     """
     res = subprocess.run([verifyta, xml, queries] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if instrumentation is not None:
+        instrumentation.count('verifyta/exit_' + str(res.returncode))
+        instrumentation.count('verifyta/stdout_bytes', len(res.stdout))
+        instrumentation.count('verifyta/trace_bytes', len(res.stderr))
     return res.stdout, res.stderr   # ResultBin, Trace
 
 def trace_time(trace, clock_name='global_c'):
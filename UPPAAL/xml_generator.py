@@ -1,4 +1,7 @@
+import io
+import os
 from xml.etree.ElementTree import parse
+from xml.sax.saxutils import escape
 
 # GLOBALS DECLS
 # String decls put here for the sake of easier reconfiguration
@@ -33,6 +36,10 @@ STR_MODULE_TRANSPORTER = "mtransporter"
 
 STR_RECIPE_NAME = "recipe"
 
+# Stands in for the declaration and system while a base file is split, see split_template
+TEMPLATE_MARKER = "\x00split\x00"
+_split_templates = {}  # path -> (modification time, parts)
+
 
 def const_int_decl(variable_name, init_value):
     """
@@ -86,26 +93,57 @@ def chan_decl(chan_name, size="", urgent=False):
     return s + "chan " + chan_name + size_string + ";\n"
 
 
+def split_template(file):
+    """
+    Splits a base UPPAAL xml file around its global declaration and system, so a model is written by joining strings
+    instead of parsing the base file every time. Serializes like ElementTree, so the models are the same bytes as
+    when the base file is parsed and written.
+    :param file: Path to base file
+    :return: A tuple (head, middle, tail) of strings, the model being head + declaration + middle + system + tail
+    """
+    tree = parse(file)
+    tree.find("declaration").text = TEMPLATE_MARKER
+    tree.find("system").text = TEMPLATE_MARKER
+    stream = io.BytesIO()
+    tree.write(stream)
+    parts = stream.getvalue().decode('ascii').split(TEMPLATE_MARKER)
+    if len(parts) != 3:
+        raise ValueError(file + " can not be split around its declaration and system")
+    return tuple(parts)
+
+
+def template_parts(file):
+    """
+    :param file: Path to base file, or parts already returned by split_template
+    :return: The parts of file as returned by split_template, which are kept as long as the file is not modified
+    """
+    if isinstance(file, tuple):
+        return file
+    modified = os.stat(file).st_mtime_ns
+    cached = _split_templates.get(file)
+    if cached is None or cached[0] != modified:
+        cached = modified, split_template(file)
+        _split_templates[file] = cached
+    return cached[1]
+
+
 def create_model_xml(file, global_decl_string, system_string, new_file):
     """
     Updates base UPPAAL xml file using input strings as replacement
-    :param file: Path to base file
+    :param file: Path to base file, or parts of it from split_template
     :param global_decl_string: String to replace global declaration
     :param recipe_strings: String to create new recipe templates
     :param system_string: String to replace system
     :param new_file: Path to new file
     """
-    tree = parse(file)
-
-    # Overwrite text in the global declaration
-    global_decl = tree.find("declaration")
-    global_decl.text = global_decl_string
+    head, middle, tail = template_parts(file)
+    with open(new_file, 'wb') as f:
+        f.write((head + _escape_text(global_decl_string) + middle + _escape_text(system_string) + tail).encode('ascii'))
 
-    # Remove system node
-    system_decl = tree.find("system")
-    system_decl.text = system_string
 
-    tree.write(new_file)
+def _escape_text(text):
+    # As ElementTree escapes text when writing with its default encoding
+    return escape(text).encode('ascii', 'xmlcharrefreplace').decode('ascii')
 
 
 def generate_xml(template_file, modules, recipes, xml_name="test.xml", q_name="test.q"):
@@ -134,10 +172,10 @@ def generate_xml(template_file, modules, recipes, xml_name="test.xml", q_name="t
         S.update(m.w_type)
     number_of_worktypes = len(S)
 
-    # Work id mapping
+    # Work id mapping, sorted so the same modules always give the same model
     w_id = 0
     w_id_dict = {}
-    for w in S:
+    for w in sorted(S):
         w_id_dict[w] = w_id
         w_id += 1
 
@@ -0,0 +1,114 @@
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import tempfile
+import time
+from benchmark.instances import generate_instance, INSTANCE_SIZES
+from benchmark.run_benchmark import FAKE_VERIFYTA, TEMPLATE
+from benchmark.validate_fidelity import sample_configurations
+from configuration.config_string_handler import ConfigStringHandler
+from configuration.simulator import simulate
+from configuration.surrogate import rank_correlation
+from UPPAAL.uppaalAPI import get_best_time
+
+
+def compare_instance(size, seed=0, count=20, verifyta=FAKE_VERIFYTA, template=TEMPLATE):
+    """ Evaluates sampled configurations of an instance with both verifyta and the simulator.
+    :param size: (modules, work types, recipes, amount) of the instance
+    :param seed: Seeds both the instance and the sampling
+    :param count: How many configurations to sample
+    :param verifyta: A path to verifyta
+    :param template: A path to the template of the models
+    :return: A dict of statistics of how the simulated times compare to those of verifyta
+    """
+    recipes, modules, transport_module = generate_instance(*size, seed=seed)
+    csh = ConfigStringHandler(recipes, modules, transport_module)
+    directory = tempfile.mkdtemp(prefix='simulator')
+    xml_file = os.path.join(directory, 'model.xml')
+    q_file = os.path.join(directory, 'model.q')
+
+    verified_times = []
+    simulated_times = []
+    same_active = 0
+    failures = 0
+    verifyta_seconds = simulator_seconds = 0.0
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            configs = sample_configurations(recipes, modules, csh, random.Random(seed), count, verifyta, template,
+                                            xml_file, q_file)
+        for config in configs:
+            csh.make_configuration(config)
+            modules_in_config = csh.modules_in_config(config)
+
+            started = time.perf_counter()
+            verified = get_best_time(recipes, modules_in_config, template, verifyta, xml_file, q_file)
+            verifyta_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            try:
+                simulated = simulate(recipes, modules_in_config)
+            except RuntimeError:
+                failures += 1
+                continue
+            finally:
+                simulator_seconds += time.perf_counter() - started
+
+            verified_times.append(verified[0])
+            simulated_times.append(simulated[0])
+            same_active += verified[3] == simulated[3]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    evaluated = len(configs)
+    differences = [(s - v) / v for v, s in zip(verified_times, simulated_times) if v]
+    best = min(range(len(verified_times)), key=lambda i: verified_times[i]) if verified_times else None
+    return {'size': list(size),
+            'seed': seed,
+            'configurations': evaluated,
+            'failures': failures,
+            'mean_difference': sum(differences) / len(differences) if differences else 0.0,
+            'max_difference': max((abs(d) for d in differences), default=0.0),
+            'rank_correlation': rank_correlation(verified_times, simulated_times) if verified_times else None,
+            'best_kept': best is not None and simulated_times[best] == min(simulated_times),
+            'same_active': same_active,
+            'verifyta_ms': 1000 * verifyta_seconds / evaluated if evaluated else 0.0,
+            'simulator_ms': 1000 * simulator_seconds / evaluated if evaluated else 0.0}
+
+
+def format_results(results):
+    """
+    :param results: Statistics as returned by compare_instance
+    :return: A table of the results
+    """
+    lines = ['%-14s %5s %8s %6s %8s %8s %8s %9s %7s %11s %8s' % (
+        'Size', 'Seed', 'Configs', 'Fails', 'Mean %', 'Max %', 'Spearman', 'Best kept', 'Active', 'Verifyta ms',
+        'Sim. ms')]
+    for r in results:
+        lines.append('%-14s %5d %8d %6d %8.1f %8.1f %8s %9s %7d %11.2f %8.3f' % (
+            ','.join(map(str, r['size'])), r['seed'], r['configurations'], r['failures'], 100 * r['mean_difference'],
+            100 * r['max_difference'], '-' if r['rank_correlation'] is None else '%.3f' % r['rank_correlation'],
+            r['best_kept'], r['same_active'], r['verifyta_ms'], r['simulator_ms']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the times of the simulator to those of verifyta, on '
+                                                 'generated instances.')
+    parser.add_argument('--sizes', nargs='+', metavar='M,W,R,A',
+                        help='Instance sizes as modules,work types,recipes,amount')
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--configs', type=int, default=20, help='Configurations sampled per instance')
+    parser.add_argument('--verifyta', default=FAKE_VERIFYTA)
+    parser.add_argument('--template', default=TEMPLATE)
+    args = parser.parse_args()
+
+    sizes = [tuple(int(x) for x in s.split(',')) for s in args.sizes] if args.sizes else INSTANCE_SIZES
+    results = [compare_instance(size, seed, args.configs, args.verifyta, args.template)
+               for size in sizes for seed in args.seeds]
+    print(format_results(results))
+
+
+if __name__ == '__main__':
+    main()
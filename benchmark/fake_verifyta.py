@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+""" A deterministic stand-in for UPPAAL CORAs verifyta, so the search can be run and benchmarked without UPPAAL.
+It reads the system declaration written by generate_xml, simulates the recipes greedily through the layout and prints
+a fastest trace in the format get_travsersal_info and trace_time parse. It is not optimal like verifyta, but the same
+model always gives the same time, and better layouts give better times.
+
+Usage: fake_verifyta.py model.xml query.q [verifyta options, which are ignored]
+If the environment variable FAKE_VERIFYTA_DELAY is set, it sleeps that many seconds first, to mimic verifyta.
+"""
+import os
+import re
+import sys
+import time
+from collections import deque
+from xml.etree.ElementTree import parse
+
+DELAY_VARIABLE = 'FAKE_VERIFYTA_DELAY'
+
+ARRAY_PATTERN = re.compile(r'const \w+ (work_array|ptime_array|next_array|ttime_array)(\d+)\[[^=]*= \{(.*?)\};')
+NODE_PATTERN = re.compile(r'const node (\w+) = \{(-?\d+), (-?\d+), \{([^}]*)\}, (-?\d+)\};')
+FUNC_DEP_PATTERN = re.compile(r'node (\w+)\[\w+\] = \{([^}]*)\};')
+NUMBER_OF_NODES_PATTERN = re.compile(r'const int (\w+) = (\d+);')
+RECIPE_PATTERN = re.compile(r'(\w+) = Recipe\((\d+), (\d+), (\w+), (\w+), (\d+)\);')
+
+
+def numbers(s):
+    return [int(x) for x in re.findall(r'-?\d+', s)]
+
+
+def parse_system(system):
+    """
+    :param system: The system declaration of a model written by generate_xml
+    :return: modules: dict from UPPAAL m_id to a dict with its work, ptime, next and ttime arrays
+             recipes: list of (r_id, start m_id, start direction, nodes), where nodes is a list of (w_id, number of
+             parents, children indices)
+    """
+    modules = {}
+    for kind, m_id, values in ARRAY_PATTERN.findall(system):
+        module = modules.setdefault(int(m_id), {})
+        if kind == 'work_array':
+            module['work'] = [x.strip() == 'true' for x in values.split(',')]
+        elif kind == 'ttime_array':
+            flat = numbers(values)
+            module['ttime'] = [flat[i * 4:i * 4 + 4] for i in range(4)]
+        else:
+            module[kind[:kind.index('_')]] = numbers(values)
+
+    nodes = {name: (int(w), int(parents), [c for c in numbers(children) if c != -1])
+             for name, w, parents, children, _ in NODE_PATTERN.findall(system)}
+    func_deps = {name: [n.strip() for n in names.split(',')] for name, names in FUNC_DEP_PATTERN.findall(system)}
+    number_of_nodes = {name: int(n) for name, n in NUMBER_OF_NODES_PATTERN.findall(system)}
+
+    recipes = []
+    for _, r_id, start, func_dep, n, direction in RECIPE_PATTERN.findall(system):
+        recipe_nodes = [nodes[name] for name in func_deps[func_dep][:number_of_nodes[n]]]
+        recipes.append((int(r_id), int(start), int(direction), recipe_nodes))
+    recipes.sort()
+    return modules, recipes
+
+
+def first_step(modules, source, targets):
+    """ Breadth first search through the next arrays.
+    :return: (direction, module) of the first step on a shortest path from source to a module in targets, None if no
+    such module can be reached
+    """
+    visited = {source}
+    queue = deque()
+    for d, n in enumerate(modules[source]['next']):
+        if n != -1 and n not in visited:
+            visited.add(n)
+            queue.append((n, (d, n)))
+
+    while queue:
+        m, step = queue.popleft()
+        if m in targets:
+            return step
+        for n in modules[m]['next']:
+            if n != -1 and n not in visited:
+                visited.add(n)
+                queue.append((n, step))
+    return None
+
+
+def simulate(modules, recipes):
+    """ Runs the recipes one after another, each doing any ready work at the module it is on and otherwise moving
+    towards the nearest module that can do some. Workers are shared, so later recipes wait for earlier ones.
+    :return: (makespan, events) where events are (time, transition lines, var) tuples, None if a recipe gets stuck
+    """
+    worker_free = {m: 0 for m in modules}
+    events = []
+    makespan = 0
+
+    for r_id, m, entry, nodes in recipes:
+        t = 0
+        parents = [n[1] for n in nodes]
+        done = [False] * len(nodes)
+
+        while not all(done):
+            ready = [i for i, n in enumerate(nodes) if not done[i] and parents[i] == 0]
+            workable = [i for i in ready if modules[m]['work'][nodes[i][0]]]
+
+            if workable:
+                i = workable[0]
+                w = nodes[i][0]
+                t = max(t, worker_free[m])
+                events.append((t, ('recipe%d.Waiting->recipe%d.Working { 1, handshake[%d]!, 1 }' % (r_id, r_id, r_id),
+                                   'mworker%d.Idle->mworker%d.Handshaking { 1, handshake[%d]?, 1 }' % (m, m, r_id)),
+                               r_id))
+                events.append((t, ('mworker%d.Handshaking->mworker%d.Working { 1, work[%d]!, 1 }' % (m, m, w),
+                                   'recipe%d.Working->recipe%d.Working { 1, work[%d]?, 1 }' % (r_id, r_id, w)),
+                               r_id))
+                t += modules[m]['ptime'][w]
+                worker_free[m] = t
+                done[i] = True
+                for c in nodes[i][2]:
+                    parents[c] -= 1
+                continue
+
+            works = {nodes[i][0] for i in ready}
+            targets = {n for n, module in modules.items() if any(module['work'][w] for w in works)}
+            step = first_step(modules, m, targets)
+            if step is None:
+                return None
+            d, n = step
+            t += modules[m]['ttime'][entry][d]
+            events.append((t, ('mtransporter%d.Moving->mtransporter%d.Idle { 1, enqueue[%d]!, 1 }' % (m, m, n),
+                               'mqueue%d.Idle->mqueue%d.Enqueued { 1, enqueue[%d]?, 1 }' % (n, n, n)),
+                           r_id))
+            m = n
+            entry = (d + 2) % 4
+
+        makespan = max(makespan, t)
+
+    events.sort(key=lambda e: e[0])
+    return makespan, events
+
+
+def write_trace(out, makespan, events):
+    """ Writes a trace in the format of verifyta -t 2, ending in a state with the final value of global_c.
+    """
+    now = 0
+    out.write('State:\n( initer.Idle rqueue.Idle )\nglobal_c=0\nvar=-1 var2=-1\n\n')
+    for t, (first, second), var in events:
+        if t > now:
+            out.write('Delay: %d\n\n' % (t - now))
+            now = t
+        out.write('Transitions:\n  %s\n  %s\n\n' % (first, second))
+        out.write('State:\n( %s )\nglobal_c=%d\nvar=%d var2=-1\n\n' % (first.split('.')[0], now, var))
+    if makespan > now:
+        out.write('Delay: %d\n\n' % (makespan - now))
+    out.write('State:\n( rem.Idle )\nvar=-1 var2=-1 global_c=%d\n' % makespan)
+
+
+def main(argv):
+    if len(argv) < 3:
+        sys.stderr.write('Usage: ' + argv[0] + ' model.xml query.q [options]\n')
+        return 1
+
+    delay = os.environ.get(DELAY_VARIABLE)
+    if delay:
+        time.sleep(float(delay))
+
+    system = parse(argv[1]).find('system').text
+    modules, recipes = parse_system(system)
+
+    sys.stdout.write('Options for the verification:\n  Generating fastest trace\n\n')
+    sys.stdout.write('Verifying formula 1 at ' + argv[2] + ':1\n')
+    result = simulate(modules, recipes) if modules and recipes else None
+    if result is None:
+        sys.stdout.write(' -- Formula is NOT satisfied.\n')
+        return 0
+
+    sys.stdout.write(' -- Formula is satisfied.\n')
+    write_trace(sys.stderr, *result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,96 @@
+import random
+from module import SquareModule
+from recipe import Recipe
+
+# Sizes used by the benchmark when none are given: (modules, work types, recipes, amount)
+INSTANCE_SIZES = [(8, 4, 2, 2), (12, 6, 3, 2), (16, 8, 4, 3)]
+
+MIN_P_TIME = 1
+MAX_P_TIME = 9
+MIN_T_TIME = 1
+MAX_T_TIME = 3
+
+
+def work_name(index):
+    return 'w' + str(index)
+
+
+def t_time_array(rng):
+    """
+    :param rng: A random.Random
+    :return: A 4x4 travel time array, where going straight through a module is the fastest
+    """
+    straight = rng.randint(MIN_T_TIME, MAX_T_TIME)
+    return [[straight if (i + 2) % 4 == j else straight + 1 for j in range(4)] for i in range(4)]
+
+
+def generate_modules(number_of_modules, number_of_worktypes, rng, works_per_module=2):
+    """ Generates a catalog of modules, where every work type can be done by at least one module.
+    :param number_of_modules: How many modules to make
+    :param number_of_worktypes: How many work types there are
+    :param rng: A random.Random
+    :param works_per_module: How many work types each module can do at most
+    :return: A list of SquareModule objects with m_ids m0, m1, ...
+    """
+    works = [work_name(i) for i in range(number_of_worktypes)]
+
+    # The first modules cover the work types in turn, the rest get random ones
+    capabilities = []
+    for i in range(number_of_modules):
+        w_types = set(rng.sample(works, min(works_per_module, len(works))))
+        if i < len(works):
+            w_types.add(works[i])
+        capabilities.append(sorted(w_types))
+    for i in range(number_of_modules, len(works)):
+        capabilities[i % number_of_modules].append(works[i])
+
+    modules = []
+    for i, w_types in enumerate(capabilities):
+        wp_time = {w: rng.randint(MIN_P_TIME, MAX_P_TIME) for w in w_types}
+        modules.append(SquareModule('m' + str(i), wp_time, t_time_array(rng), rng.randint(1, 3)))
+    return modules
+
+
+def generate_recipes(number_of_recipes, number_of_worktypes, amount, rng, works_per_recipe=None):
+    """ Generates recipes whose dependency graphs are DAGs. All recipes respect the same order of work types, so the
+    graph combining them, as made by the initial configurations, stays acyclic. They all start with the first work type,
+    as recipes_to_graph loses the start of a recipe if its first work is not also first in the recipes after it.
+    :param number_of_recipes: How many recipes to make
+    :param number_of_worktypes: How many work types there are
+    :param amount: How many of each recipe are to be produced. If a list, the amounts of the recipes in turn.
+    :param rng: A random.Random
+    :param works_per_recipe: How many work types each recipe needs, defaults to about half of them
+    :return: A list of Recipe objects named r0, r1, ...
+    """
+    if works_per_recipe is None:
+        works_per_recipe = max(2, number_of_worktypes // 2)
+
+    amounts = list(amount) if isinstance(amount, (list, tuple)) else [amount]
+    recipes = []
+    for i in range(number_of_recipes):
+        works = [work_name(0)] + [work_name(w) for w in sorted(rng.sample(range(1, number_of_worktypes),
+                                                                          works_per_recipe - 1))]
+        dependencies = {works[0]: []}
+        for j in range(1, len(works)):
+            dependencies[works[j]] = sorted(rng.sample(works[:j], rng.randint(1, min(2, j))))
+        recipes.append(Recipe('r' + str(i), dependencies, None, 3, amounts[i % len(amounts)]))
+    return recipes
+
+
+def generate_instance(number_of_modules=8, number_of_worktypes=4, number_of_recipes=2, amount=2, seed=0):
+    """ Generates a factory instance. Modules are registered by m_id in SquareModule.modules_dictionary, so this clears
+    it first, and any earlier instance must not be used afterwards.
+    :param number_of_modules: How many modules are in the catalog
+    :param number_of_worktypes: How many work types there are
+    :param number_of_recipes: How many recipes there are
+    :param amount: How many of each recipe are to be produced. If a list, the amounts of the recipes in turn.
+    :param seed: The same seed always gives the same instance
+    :return: (recipes, modules, transport_module), as taken by tabu_search
+    """
+    rng = random.Random(seed)
+    SquareModule.modules_dictionary.clear()
+
+    modules = generate_modules(number_of_modules, number_of_worktypes, rng)
+    recipes = generate_recipes(number_of_recipes, number_of_worktypes, amount, rng)
+    transport_module = SquareModule('transport', {}, t_time_array(rng), 2)
+    return recipes, modules, transport_module
@@ -0,0 +1,136 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import configuration.tabu_search as tabu_search
+from benchmark.fake_verifyta import DELAY_VARIABLE
+from benchmark.instances import generate_instance, INSTANCE_SIZES
+from configuration.instrumentation import Instrumentation
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_VERIFYTA = os.path.join(BENCHMARK_DIR, 'fake_verifyta.py')
+TEMPLATE = os.path.join(BENCHMARK_DIR, 'template.xml')
+
+
+def run_instance(size, seed=0, target=None, quiet=True, **kwargs):
+    """ Runs tabu_search_iter on a generated instance, with the fake verifyta and template.
+    :param size: (modules, work types, recipes, amount) of the instance
+    :param seed: Seeds both the instance and the search
+    :param target: If given, the time it takes to reach this fitness is reported
+    :param quiet: Hides the progress printed by the search
+    :param kwargs: Any other keyword arguments of tabu_search_iter
+    :return: A dict of statistics for the run
+    """
+    recipes, modules, transport_module = generate_instance(*size, seed=seed)
+    tabu_search.VERIFYTA = FAKE_VERIFYTA
+    tabu_search.XML_TEMPLATE = TEMPLATE
+
+    directory = tempfile.mkdtemp(prefix='benchmark')
+    instrumentation = Instrumentation()
+    curve = []  # (seconds, fitness) of each new best, taken the moment it is evaluated
+
+    def callback(config, fitness):
+        curve.append((time.perf_counter() - started, fitness))
+
+    output = open(os.devnull, 'w') if quiet else None
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            for _ in tabu_search.tabu_search_iter(recipes, modules, transport_module, target=target,
+                                                  callback=callback, instrumentation=instrumentation, rng=seed,
+                                                  xml_file=os.path.join(directory, 'model.xml'),
+                                                  q_file=os.path.join(directory, 'model.q'), **kwargs):
+                pass
+    finally:
+        seconds = time.perf_counter() - started
+        if output:
+            output.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    counters = instrumentation.counters
+    evaluations = sum(v for k, v in counters.items() if k.startswith('verifyta/exit_'))
+    neighbours = sum(v for k, v in counters.items() if k.startswith('neighbours/'))
+    best = curve[-1][1] if curve else None
+    reached = [t for t, fitness in curve if fitness <= (target if target is not None else best)]
+
+    return {'size': list(size),
+            'seed': seed,
+            'seconds': seconds,
+            'evaluations': evaluations,
+            'evaluations_per_second': evaluations / seconds,
+            'neighbours': neighbours,
+            'neighbours_per_second': neighbours / seconds,
+            'cache_hits': counters['cache/hit'] + counters['cache/shared_hit'],
+            'model_cache_hits': counters['model_cache/hit'],
+            'invalid_layouts': counters['layout/invalid'],
+            'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'best_fitness': best,
+            'time_to_target': reached[0] if reached else None,
+            'surrogate': kwargs['surrogate'].statistics() if kwargs.get('surrogate') is not None else None,
+            'curve': curve}
+
+
+def run_benchmark(sizes=INSTANCE_SIZES, seeds=(0,), **kwargs):
+    """ Runs every instance size with every seed, each in a fresh process so its peak memory is its own.
+    :param sizes: A list of (modules, work types, recipes, amount) tuples
+    :param seeds: The seeds to run each size with
+    :param kwargs: Any other keyword arguments of run_instance
+    :return: A list of the statistics of each run
+    """
+    context = multiprocessing.get_context('fork')
+    results = []
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for size in sizes:
+            for seed in seeds:
+                results.append(pool.apply(run_instance, (size, seed), kwargs))
+    return results
+
+
+def format_results(results):
+    """
+    :param results: Statistics as returned by run_benchmark
+    :return: A table of the results
+    """
+    lines = ['%-14s %5s %8s %7s %9s %12s %9s %8s %8s' % ('Size', 'Seed', 'Seconds', 'Evals', 'Evals/s', 'Neighbours/s',
+                                                          'Peak MB', 'Best', 'To best')]
+    for r in results:
+        lines.append('%-14s %5d %8.2f %7d %9.2f %12.2f %9.1f %8s %8s' % (
+            ','.join(map(str, r['size'])), r['seed'], r['seconds'], r['evaluations'], r['evaluations_per_second'],
+            r['neighbours_per_second'], r['peak_memory_mb'], r['best_fitness'],
+            '-' if r['time_to_target'] is None else '%.2f' % r['time_to_target']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the tabu search on generated instances, using a fake '
+                                                 'verifyta.')
+    parser.add_argument('--sizes', nargs='+', metavar='M,W,R,A',
+                        help='Instance sizes as modules,work types,recipes,amount')
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument('--time-limit', type=float)
+    parser.add_argument('--target', type=int)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--delay', type=float, help='Seconds the fake verifyta sleeps per evaluation')
+    parser.add_argument('--json', help='Also write the results, with time to target curves, to this file')
+    args = parser.parse_args()
+
+    if args.delay is not None:
+        os.environ[DELAY_VARIABLE] = str(args.delay)
+    sizes = [tuple(int(x) for x in s.split(',')) for s in args.sizes] if args.sizes else INSTANCE_SIZES
+
+    results = run_benchmark(sizes, args.seeds, iters=args.iters, time_limit=args.time_limit, target=args.target,
+                            workers=args.workers)
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import contextlib
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from benchmark.instances import generate_instance
+from benchmark.run_benchmark import FAKE_VERIFYTA, TEMPLATE
+from configuration.config_string_handler import ConfigStringHandler
+from configuration.initial_config import initial_configuration_generator
+from configuration.neighbour_functions.anti_serialize import iter_neighbours_anti_serialized
+from configuration.neighbour_functions.parallelize import iter_neighbours_parallelize
+from configuration.neighbour_functions.swap import iter_neighbours_swap
+from configuration.surrogate import rank_correlation
+from UPPAAL.fidelity import FIDELITY_AMOUNTS, fidelity_levels, get_extrapolated_time
+from UPPAAL.uppaalAPI import get_best_time, XML_FILE, Q_FILE
+
+# Sizes validated when none are given. The amounts are larger than those of the benchmark, so there is something to
+# extrapolate. The last has recipes of different amounts, given in turn.
+VALIDATION_SIZES = [(8, 4, 2, 8), (12, 6, 3, 8), (16, 8, 4, 12), (12, 6, 2, (6, 10))]
+
+
+def parse_size(text):
+    """
+    :param text: modules,work types,recipes,amount, where the amount may be amounts separated by /, e.g. 12,6,2,6/10
+    :return: A size as taken by validate_instance
+    """
+    fields = text.split(',')
+    amounts = tuple(int(a) for a in fields[3].split('/'))
+    return tuple(int(x) for x in fields[:3]) + (amounts if len(amounts) > 1 else amounts[0],)
+
+
+def format_size(size):
+    """
+    :return: size as parse_size takes it
+    """
+    return ','.join('/'.join(map(str, x)) if isinstance(x, (list, tuple)) else str(x) for x in size)
+
+
+def sample_configurations(recipes, modules, csh, rng, count, verifyta=FAKE_VERIFYTA, template=TEMPLATE,
+                          xml_file=XML_FILE, q_file=Q_FILE):
+    """ Samples configurations like those a search sees: initial configurations and their neighbours.
+    :param count: How many configurations to sample at most
+    :param verifyta: The verifyta finding the active works the neighbours are made from
+    :param template: The template of its models
+    :param xml_file: Path the models are written to
+    :param q_file: Path the queries are written to
+    :return: A list of configuration strings
+    """
+    configs = list(itertools.islice(initial_configuration_generator(recipes, modules, csh, rng), 5))
+    funcs = [iter_neighbours_anti_serialized, iter_neighbours_parallelize, iter_neighbours_swap]
+    for config in list(configs):
+        csh.make_configuration(config)
+        active = get_best_time(recipes, csh.modules_in_config(config), template, verifyta, xml_file,
+                               q_file)[3]
+        for func in funcs:
+            try:
+                configs.extend(itertools.islice(func(config, csh, active, skip=lambda c: c in configs, rng=rng), 3))
+            except (RecursionError, KeyError):
+                continue
+    return configs[:count]
+
+
+def validate_instance(size, seed=0, amounts=FIDELITY_AMOUNTS, count=20, verifyta=FAKE_VERIFYTA, template=TEMPLATE):
+    """ Evaluates sampled configurations of an instance both exactly and by extrapolation. As the fake verifyta
+    simulates greedily, its times grow linearly and extrapolate perfectly, so give the real verifyta and a template
+    for it to get the error that matters.
+    :param size: (modules, work types, recipes, amount) of the instance, the amount being one or a tuple of amounts
+    :param seed: Seeds both the instance and the sampling
+    :param amounts: The amounts extrapolated from
+    :param count: How many configurations to sample
+    :param verifyta: A path to verifyta
+    :param template: A path to the template of the models
+    :return: A dict of statistics of the extrapolation error
+    """
+    recipes, modules, transport_module = generate_instance(*size, seed=seed)
+    csh = ConfigStringHandler(recipes, modules, transport_module)
+    levels = fidelity_levels(recipes, amounts)
+    directory = tempfile.mkdtemp(prefix='fidelity')
+    xml_file = os.path.join(directory, 'model.xml')
+    q_file = os.path.join(directory, 'model.q')
+
+    exact_times = []
+    extrapolated_times = []
+    exact_seconds = extrapolated_seconds = 0.0
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            configs = sample_configurations(recipes, modules, csh, random.Random(seed), count, verifyta,
+                                            template, xml_file, q_file)
+        for config in configs:
+            csh.make_configuration(config)
+            modules_in_config = csh.modules_in_config(config)
+
+            started = time.perf_counter()
+            exact_times.append(get_best_time(recipes, modules_in_config, template, verifyta, xml_file,
+                                             q_file)[0])
+            exact_seconds += time.perf_counter() - started
+
+            started = time.perf_counter()
+            extrapolated_times.append(get_extrapolated_time(recipes, modules_in_config, levels, template,
+                                                            verifyta, xml_file, q_file)[0])
+            extrapolated_seconds += time.perf_counter() - started
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    errors = [abs(e - x) / e for e, x in zip(exact_times, extrapolated_times) if e]
+    best = min(range(len(exact_times)), key=lambda i: exact_times[i])
+    return {'size': list(size),
+            'seed': seed,
+            'levels': levels,
+            'configurations': len(exact_times),
+            'mean_error': sum(errors) / len(errors) if errors else 0.0,
+            'max_error': max(errors, default=0.0),
+            'rank_correlation': rank_correlation(exact_times, extrapolated_times),
+            'best_kept': extrapolated_times[best] == min(extrapolated_times),
+            'exact_seconds': exact_seconds,
+            'extrapolated_seconds': extrapolated_seconds}
+
+
+def format_results(results):
+    """
+    :param results: Statistics as returned by validate_instance
+    :return: A table of the results
+    """
+    lines = ['%-14s %5s %8s %8s %8s %8s %9s %10s %10s' % ('Size', 'Seed', 'Configs', 'Mean %', 'Max %', 'Spearman',
+                                                          'Best kept', 'Exact s', 'Extrap. s')]
+    for r in results:
+        lines.append('%-14s %5d %8d %8.1f %8.1f %8s %9s %10.2f %10.2f' % (
+            format_size(r['size']), r['seed'], r['configurations'], 100 * r['mean_error'],
+            100 * r['max_error'], '-' if r['rank_correlation'] is None else '%.3f' % r['rank_correlation'],
+            r['best_kept'], r['exact_seconds'],
+            r['extrapolated_seconds']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reports the error of extrapolating the time of a configuration from '
+                                                 'reduced amounts, on generated instances.')
+    parser.add_argument('--sizes', nargs='+', metavar='M,W,R,A',
+                        help='Instance sizes as modules,work types,recipes,amount. Recipes of different amounts are '
+                             'given as amounts separated by /, e.g. 12,6,2,6/10')
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--amounts', nargs='+', type=int, default=list(FIDELITY_AMOUNTS))
+    parser.add_argument('--configs', type=int, default=20, help='Configurations sampled per instance')
+    parser.add_argument('--verifyta', default=FAKE_VERIFYTA)
+    parser.add_argument('--template', default=TEMPLATE)
+    args = parser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes] if args.sizes else VALIDATION_SIZES
+    results = [validate_instance(size, seed, args.amounts, args.configs, args.verifyta, args.template)
+               for size in sizes for seed in args.seeds]
+    print(format_results(results))
+
+
+if __name__ == '__main__':
+    main()
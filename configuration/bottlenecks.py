@@ -0,0 +1,58 @@
+""" Where the time of a configuration goes, read from the profile of its schedule, see uppaalAPI.trace_profile. The
+neighbour functions use it to aim their moves at the modules that hold production up, instead of trying every move
+alike.
+"""
+
+# A module is saturated if its load, see module_loads, is at least this share of the largest load
+SATURATION = 0.8
+
+
+def module_loads(profile, csh):
+    """
+    :param profile: The profile of a configuration
+    :param csh: config_string_handler object, for the processing times of the modules
+    :return: A dict from m_id to how long its worker worked plus how long recipes waited in its queue for it
+    """
+    loads = {}
+    for m_id, works in profile['works'].items():
+        p_time = csh.module_dictionary[m_id].p_time
+        loads[m_id] = sum(p_time.get(w, 0) * n for w, n in works.items())
+    for m_id, wait in profile['queue_time'].items():
+        loads[m_id] = loads.get(m_id, 0) + wait
+    return loads
+
+
+def saturated_modules(profile, csh, share=SATURATION):
+    """
+    :param profile: The profile of a configuration, or None
+    :param csh: config_string_handler object
+    :param share: See SATURATION
+    :return: The set of m_ids of the saturated modules, empty if there is no profile
+    """
+    if not profile:
+        return set()
+    loads = module_loads(profile, csh)
+    most = max(loads.values(), default=0)
+    return {m_id for m_id, t in loads.items() if most and t >= share * most}
+
+
+def slow_critical_modules(profile, csh):
+    """
+    :param profile: The profile of a configuration, or None
+    :param csh: config_string_handler object
+    :return: The m_ids of the modules on the critical path, i.e. those that worked on the recipe done last, that
+    have about the largest load of any module on it, empty if there is no profile
+    """
+    if not profile:
+        return set()
+    loads = module_loads(profile, csh)
+    critical = [m_id for m_id in profile['critical'] if m_id in loads]
+    most = max((loads[m_id] for m_id in critical), default=0)
+    return {m_id for m_id in critical if most and loads[m_id] >= SATURATION * most}
+
+
+def processing_time(module, works):
+    """
+    :return: How long module takes to do each of works once
+    """
+    return sum(module.p_time[w] for w in works)
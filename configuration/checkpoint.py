@@ -0,0 +1,89 @@
+import os
+import pickle
+import threading
+import zlib
+
+CHECKPOINT_VERSION = 5
+
+
+class CheckpointWriter:
+    """ Writes checkpoints of the search in a background thread, so the search loop is not stalled by compression or
+    disk. The state is pickled in the calling thread, so later changes to it do not leak into the checkpoint. If the
+    thread is still busy when a new checkpoint arrives, only the newest one is kept.
+    """
+    def __init__(self, path):
+        """
+        :param path: File the checkpoints are written to. It is replaced atomically, so it always holds a whole one.
+        """
+        self.path = path
+        self.pending = None
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, state):
+        """
+        :param state: A picklable dict describing the search
+        """
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.condition:
+            if self.error:
+                raise self.error
+            self.pending = data
+            self.condition.notify()
+
+    def close(self):
+        """ Waits for the last checkpoint to be written.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                data = self.pending
+                self.pending = None
+
+            try:
+                save_checkpoint_bytes(self.path, data)
+            except OSError as e:
+                with self.condition:
+                    self.error = e
+
+
+def save_checkpoint_bytes(path, data):
+    """ Compresses a pickled state and writes it to path, going through a temporary file so a crash never leaves half a
+    checkpoint behind.
+    :param path: File to write
+    :param data: A pickled state
+    """
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(zlib.compress(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def load_checkpoint(path):
+    """
+    :param path: File written by a CheckpointWriter
+    :return: The state dict that was checkpointed
+    """
+    with open(path, 'rb') as f:
+        state = pickle.loads(zlib.decompress(f.read()))
+
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('Checkpoint ' + path + ' has version ' + str(state.get('version')) + ', expected ' +
+                         str(CHECKPOINT_VERSION))
+    return state
@@ -1,6 +1,113 @@
 import re
 from copy import deepcopy
 
+# Where the module connected up, right, down and left of a module is on the grid, as in SquareModule.make_grid
+DIRECTION_OFFSETS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+
+def parse_configuration(configuration_str):
+    """ Splits a configuration string into its parts without touching any module objects.
+    :param configuration_str: A string representing a configuration, retrived by the configuration_str method
+    :return: A tuple (recipes, modules, main_line). recipes is a list of [name, start_module, start_direction],
+    modules is a dict from m_id to [active_w_types, connections, booleans] and main_line is a list of m_ids. All values
+    are kept as the strings they were in configuration_str.
+    """
+    if not isinstance(configuration_str, str):
+        raise ValueError("configuration_str should be a string!")
+    S = configuration_str.split(sep='|')
+
+    recipes = []
+    for rs in S[0].split(sep='$'):
+        split1 = rs.find('@')
+        split2 = rs.find('&')
+        recipes.append([rs[:split1], rs[split1 + 1:split2], rs[split2 + 1:]])
+
+    modules = {}
+    for ms in S[1].split(sep=':'):
+        split1 = ms.rfind('{')
+        split2 = ms.find('}[', split1)
+        split3 = ms.find(']', split2)
+        modules[ms[:split1]] = [ms[split1 + 1:split2], ms[split2 + 2:split3].split(sep=','), ms[split3 + 1:]]
+
+    main_line = S[2].split(sep=',') if S[2] else []
+
+    return recipes, modules, main_line
+
+
+def format_configuration(recipes, modules, main_line):
+    """ The inverse of parse_configuration. Gives the same string as ConfigStringHandler.configuration_str would.
+    :param recipes: A list of [name, start_module, start_direction]
+    :param modules: A dict from m_id to [active_w_types, connections, booleans]
+    :param main_line: A list of m_ids
+    :return: A string representing the configuration
+    """
+    R = [name + '@' + start + '&' + direction for name, start, direction in recipes]
+    M = [m_id + '{' + active + '}[' + ','.join(connections) + ']' + booleans
+         for m_id, (active, connections, booleans) in sorted(modules.items())]
+    return '$'.join(R) + '|' + ':'.join(M) + '|' + ','.join(main_line)
+
+
+def relabel_configuration(recipes, modules, main_line, mapping):
+    """ Renames modules in a parsed configuration. Everything tied to the position of a module, i.e. its active works,
+    connections and booleans, stays where it is, so {m0: m1, m1: m0} swaps the places of m0 and m1.
+    :param recipes: A list of [name, start_module, start_direction]
+    :param modules: A dict from m_id to [active_w_types, connections, booleans]
+    :param main_line: A list of m_ids
+    :param mapping: A dict from old m_id to new m_id, ids not in it are kept
+    :return: A string representing the relabelled configuration
+    """
+    get = mapping.get
+    R = [[name, get(start, start), direction] for name, start, direction in recipes]
+    M = {get(m_id, m_id): [active, [get(c, c) for c in connections], booleans]
+         for m_id, (active, connections, booleans) in modules.items()}
+    ML = [get(m_id, m_id) for m_id in main_line]
+    return format_configuration(R, M, ML)
+
+
+def layout_conflicts(configuration_str):
+    """ Places the modules of a configuration on the grid by following their connections, without touching any module
+    objects, and finds where the layout is physically impossible: cells holding more than one module, and connections
+    that would put a module in a second cell.
+    :param configuration_str: A string representing a configuration
+    :return: A dict from each conflicting cell (x, y) to the set of m_ids placed in it. Empty if the layout is valid.
+    """
+    _, modules, _ = parse_configuration(configuration_str)
+
+    # Connections go both ways when placing, so it does not matter which module a line is reached from
+    adjacent = {m_id: [] for m_id in modules}
+    for m_id, (_, connections, _) in modules.items():
+        for (dx, dy), c in zip(DIRECTION_OFFSETS, connections):
+            if c in adjacent:
+                adjacent[m_id].append((c, dx, dy))
+                adjacent[c].append((m_id, -dx, -dy))
+
+    positions = {}
+    conflicts = {}
+    for root in sorted(modules):
+        if root in positions:
+            continue
+        occupancy = {(0, 0): {root}}  # Each connected part is placed on a grid of its own
+        positions[root] = (0, 0)
+        queue = [root]
+        while queue:
+            m_id = queue.pop()
+            x, y = positions[m_id]
+            for c, dx, dy in adjacent[m_id]:
+                cell = (x + dx, y + dy)
+                if positions.get(c, cell) != cell:
+                    conflicts.setdefault(cell, set(occupancy.get(cell, ()))).add(c)
+                    continue
+                if c in positions:
+                    continue
+                positions[c] = cell
+                occupants = occupancy.setdefault(cell, set())
+                occupants.add(c)
+                if len(occupants) > 1:
+                    conflicts.setdefault(cell, set()).update(occupants)
+                queue.append(c)
+    return conflicts
+
+
 class ConfigStringHandler:
     def __init__(self, recipes, all_modules, transport_module, initial_configuration=""):
         self.all_modules = all_modules
@@ -132,17 +239,13 @@ class ConfigStringHandler:
 
 
     def grid_conflicts(self):
-
-        def invert_dict(d):
-            res = {}
-            for k in d:
-                res.setdefault(d[k], set()).add(k)
-            return res
-
-        grid = self.make_grid()
-        inverted_grid = invert_dict(grid)
-        conflicts = {k: v for k, v in inverted_grid.items() if len(v) > 1}
-        return conflicts
+        """ See layout_conflicts.
+        :return: A dict from each conflicting cell of the current configuration to the set of modules placed in it
+        """
+        if not self.current_modules:
+            return {}
+        conflicts = layout_conflicts(self.configuration_str())
+        return {cell: {self.module_dictionary[m_id] for m_id in m_ids} for cell, m_ids in conflicts.items()}
 
     def take_transport_module(self):
         if self.free_transporters:
@@ -165,6 +268,34 @@ class ConfigStringHandler:
         t.total_wipe()
         self.free_transporters.append(t)
 
+    def transport_state(self):
+        """ The transport modules are made on the fly, so configuration strings refer to ids only this object knows.
+        :return: A picklable description of the transport modules, for restore_transport_state
+        """
+        return {'transport_id': self.transport_id,
+                'transport_modules': [t.m_id for t in self.transport_modules],
+                'free_transporters': [t.m_id for t in self.free_transporters]}
+
+    def restore_transport_state(self, state):
+        """ Recreates the transport modules described by transport_state, so that configuration strings using them can
+        be made and new transport modules get the same ids as they would have before.
+        :param state: A dict returned by transport_state
+        """
+        for t in self.transport_modules:
+            self.all_modules.remove(t)
+        for m_id in [m_id for m_id in self.module_dictionary if m_id.startswith('transporter')]:
+            del self.module_dictionary[m_id]
+
+        for i in range(state['transport_id']):
+            t = deepcopy(self.transport_module)
+            t.m_id = "transporter" + str(i)
+            self.module_dictionary[t.m_id] = t
+        self.transport_id = state['transport_id']
+
+        self.transport_modules = [self.module_dictionary[m_id] for m_id in state['transport_modules']]
+        self.free_transporters = [self.module_dictionary[m_id] for m_id in state['free_transporters']]
+        self.all_modules.extend(self.transport_modules)
+
     def set_active_work(self, worked):
         for m, works in worked.items():
             if m in self.current_modules:
@@ -0,0 +1,359 @@
+""" Evaluation on other machines. A RemoteEvaluator listens on a TCP or Unix socket, and workers started with
+    python -m configuration.distributed HOST:PORT --authkey KEY --verifyta PATH
+connect to it. Each worker is sent the problem once, as a bundle of the modules, recipes and template, and from then on
+only configuration strings along with the handle of the bundle. Workers ask for a task whenever they are idle, so fast
+workers take more of the work instead of work being split up front, and the task of a worker that disconnects or takes
+longer than task_timeout is given to another.
+"""
+import argparse
+import copy
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener, Client
+from configuration.config_string_handler import ConfigStringHandler
+from configuration.evaluators import Evaluator
+from configuration.problem_bundle import dump_problem, load_problem, problem_handle
+from UPPAAL.fidelity import fidelity_levels, get_extrapolated_time
+from UPPAAL.uppaalAPI import get_best_time, VERIFYTA, XML_TEMPLATE
+
+# How many times a task is given to a worker before it is failed, so a task that kills workers does not kill them all
+MAX_DISPATCHES = 3
+# Seconds evaluate_many waits while no worker is connected before giving up
+WORKER_TIMEOUT = 60
+
+
+def parse_address(address):
+    """
+    :param address: 'host:port' for TCP, or a path for a Unix socket
+    :return: An address for multiprocessing.connection
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def problem_definition(csh, template_file, fidelity=None):
+    """
+    :param csh: config_string_handler object of the search
+    :param template_file: A path to a template UPPAAL CORA XML file
+    :param fidelity: If given, amounts the recipes are evaluated at, see fidelity.fidelity_levels
+    :return: The problem bundle sent to the workers, see problem_bundle
+    """
+    modules = [m for m in csh.all_modules if m not in csh.transport_modules]
+    levels = fidelity_levels(csh.recipes, fidelity) if fidelity else []
+    return dump_problem(csh.recipes, modules, csh.transport_module, template_file, levels)
+
+
+def ensure_transporters(csh, count):
+    """ Makes sure the transport modules transporter0 up to count exist, as the configuration strings of the
+    coordinator use its transport modules. They are added to all_modules like take_transport_module does, so
+    make_configuration resets their connections.
+    """
+    while csh.transport_id < count:
+        t = copy.deepcopy(csh.transport_module)
+        t.m_id = "transporter" + str(csh.transport_id)
+        csh.module_dictionary[t.m_id] = t
+        csh.transport_id += 1
+        csh.transport_modules.append(t)
+        csh.all_modules.append(t)
+
+
+class RemoteEvaluator(Evaluator):
+    """ Evaluates configurations on workers connected over sockets, see the top of this module. A batch is spread over
+    all connected workers, so batch_size is the number of workers.
+    """
+    name = 'remote'
+
+    def __init__(self, authkey, address=('localhost', 0), template_file=XML_TEMPLATE, fidelity=None,
+                 task_timeout=None, worker_timeout=WORKER_TIMEOUT, max_dispatches=MAX_DISPATCHES):
+        """
+        :param authkey: Bytes the workers must also be given, used to authenticate them
+        :param address: (host, port) or the path of a Unix socket to listen on. Port 0 picks a free port, see address.
+        :param template_file: A path to a template UPPAAL CORA XML file, sent to the workers
+        :param fidelity: If given, amounts the recipes are evaluated at, extrapolating the time of the full amounts
+        :param task_timeout: Seconds after which a task is also given to another worker, None to only do so when its
+        worker disconnects
+        :param worker_timeout: Seconds evaluate_many waits while no worker is connected and no result comes, before it
+        raises a ConnectionError
+        :param max_dispatches: How many times a task is given to a worker, after which it fails with a RuntimeError
+        """
+        super().__init__()
+        self.template_file = template_file
+        self.fidelity = fidelity
+        self.task_timeout = task_timeout
+        self.worker_timeout = worker_timeout
+        self.max_dispatches = max_dispatches
+
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.condition = threading.Condition()
+        self.problem = None
+        self.handle = None
+        self.transporters = 0
+        self.tasks = deque()  # (task_id, config) waiting for a worker
+        self.running = {}  # task_id -> (config, worker, time sent)
+        self.results = {}  # task_id -> (result, error)
+        self.awaited = set()  # Tasks evaluate_many waits for, results of others are late duplicates
+        self.dispatches = {}  # task_id -> how many times it was given to a worker
+        self.next_task = 0
+        self.workers = set()
+        self.closed = False
+
+        self.accepter = threading.Thread(target=self.accept, daemon=True)
+        self.accepter.start()
+
+    @property
+    def batch_size(self):
+        with self.condition:
+            return max(1, len(self.workers))
+
+    def attach(self, csh):
+        super().attach(csh)
+        problem = problem_definition(csh, self.template_file, self.fidelity)
+        with self.condition:
+            self.problem = problem
+            self.handle = problem_handle(problem)
+            self.condition.notify_all()
+
+    def accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError):
+                if self.closed:
+                    return
+                continue  # E.g. a client that failed to authenticate
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def serve(self, connection):
+        """ Talks to one worker. Every message from a worker means it is idle, so it is given the next task.
+        """
+        name = None
+        handle = None
+        try:
+            while True:
+                message = connection.recv()
+                if message[0] == 'hello':
+                    name = message[1]
+                    with self.condition:
+                        self.workers.add(name)
+                        self.count('connected')
+                        self.condition.notify_all()
+                elif message[0] == 'result':
+                    self.finish(message[1], message[2], message[3])
+
+                task = self.take(name, handle)
+                if task is None:
+                    connection.send(('stop',))
+                    return
+                if task[0] == 'problem':
+                    handle = task[1]
+                connection.send(task)
+        except (EOFError, OSError):
+            with self.condition:
+                self.count('disconnected')
+        finally:
+            connection.close()
+            self.lost(name)
+
+    def take(self, name, handle):
+        """ Waits for something for a worker to do.
+        :param name: Name of the worker
+        :param handle: Handle of the problem the worker has, None if it has none
+        :return: ('problem', handle, bundle) if the worker does not have the current problem, ('task', task_id,
+        handle, config, transporters) otherwise, or None when closing
+        """
+        with self.condition:
+            while not self.closed and (self.problem is None or (handle == self.handle and not self.tasks)):
+                self.condition.wait()
+            if self.closed:
+                return None
+            if handle != self.handle:
+                return 'problem', self.handle, self.problem
+            task_id, config = self.tasks.popleft()
+            self.running[task_id] = (config, name, time.monotonic())
+            self.dispatches[task_id] = self.dispatches.get(task_id, 0) + 1
+            self.count('dispatched')
+            return 'task', task_id, self.handle, config, self.transporters
+
+    def finish(self, task_id, result, error):
+        with self.condition:
+            if task_id in self.results or task_id not in self.awaited:
+                self.count('duplicates')
+                return
+            self.results[task_id] = (result, error)
+            self.running.pop(task_id, None)
+            for i, (queued_id, _) in enumerate(self.tasks):  # It may have been dispatched again in the meantime
+                if queued_id == task_id:
+                    del self.tasks[i]
+                    break
+            self.count('completed')
+            self.condition.notify_all()
+
+    def lost(self, name):
+        """ Gives the tasks of a worker that is gone to the others.
+        """
+        with self.condition:
+            self.workers.discard(name)
+            for task_id, (config, worker, _) in list(self.running.items()):
+                if worker == name:
+                    del self.running[task_id]
+                    if not self.give_up(task_id):
+                        self.tasks.appendleft((task_id, config))
+                        self.count('redispatched')
+            self.condition.notify_all()
+
+    def give_up(self, task_id):
+        """ Fails a task that has been given to max_dispatches workers already. Called with the condition held.
+        :return: True if the task was failed
+        """
+        if self.dispatches.get(task_id, 0) < self.max_dispatches:
+            return False
+        if task_id in self.awaited and task_id not in self.results:
+            self.results[task_id] = (None, RuntimeError('Task ' + str(task_id) + ' was given to ' +
+                                                        str(self.max_dispatches) + ' workers without a result'))
+            self.count('failed')
+        self.running.pop(task_id, None)
+        return True
+
+    def redispatch_slow(self):
+        """ Queues tasks that have run for longer than task_timeout again. Whichever result comes first is used.
+        """
+        now = time.monotonic()
+        for task_id, (config, worker, sent) in list(self.running.items()):
+            if now - sent > self.task_timeout and all(t != task_id for t, _ in self.tasks):
+                if self.give_up(task_id):
+                    continue
+                self.running[task_id] = (config, worker, now)
+                self.tasks.append((task_id, config))
+                self.count('redispatched')
+        self.condition.notify_all()
+
+    def evaluate(self, config):
+        result, error = self.evaluate_many([config])[0]
+        if error is not None:
+            raise error
+        return result
+
+    def evaluate_many(self, configs):
+        with self.condition:
+            self.transporters = self.csh.transport_id
+            ids = []
+            for config in configs:
+                ids.append(self.next_task)
+                self.awaited.add(self.next_task)
+                self.tasks.append((self.next_task, config))
+                self.next_task += 1
+            self.condition.notify_all()
+
+            waits = [t for t in (self.task_timeout and self.task_timeout / 2, self.worker_timeout) if t]
+            progress = time.monotonic()
+            done = 0
+            while done < len(ids):
+                self.condition.wait(min(waits) if waits else None)
+                if self.task_timeout:
+                    self.redispatch_slow()
+                finished = sum(i in self.results for i in ids)
+                if finished > done or self.workers:
+                    done = finished
+                    progress = time.monotonic()
+                elif self.worker_timeout and time.monotonic() - progress > self.worker_timeout:
+                    self.forget(ids)
+                    raise ConnectionError('No worker has been connected for ' + str(self.worker_timeout) + ' seconds')
+            results = [self.results[i] for i in ids]
+            self.forget(ids)
+            return results
+
+    def forget(self, ids):
+        """ Stops waiting for the tasks ids, dropping those not yet done and their results. Called with the condition
+        held.
+        """
+        self.awaited.difference_update(ids)
+        for i in ids:
+            self.results.pop(i, None)
+            self.dispatches.pop(i, None)
+            self.running.pop(i, None)
+        self.tasks = deque(task for task in self.tasks if task[0] in self.awaited)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.listener.close()
+
+
+def run_worker(address, authkey, verifyta=VERIFYTA, name=None, runner=None):
+    """ Connects to a RemoteEvaluator and evaluates configurations for it until it closes.
+    :param address: The address the RemoteEvaluator listens on
+    :param authkey: The authkey it was given
+    :param verifyta: A path to verifyta on this machine
+    :param name: Name of this worker, unique among the workers
+    :param runner: If given, runs verifyta instead of run_verifyta, see run_model
+    """
+    if name is None:
+        name = socket.gethostname() + ':' + str(os.getpid())
+    directory = tempfile.mkdtemp(prefix='worker')
+    xml_file = os.path.join(directory, 'model.xml')
+    q_file = os.path.join(directory, 'model.q')
+    handle = None
+    csh = template = None
+    levels = []
+
+    connection = Client(address, authkey=authkey)
+    try:
+        connection.send(('hello', name))
+        while True:
+            message = connection.recv()
+            if message[0] == 'stop':
+                return
+            if message[0] == 'problem':
+                _, handle, bundle = message
+                recipes, modules, transport_module, template, levels = load_problem(bundle)
+                csh = ConfigStringHandler(recipes, modules, transport_module)
+                connection.send(('ready',))
+                continue
+
+            _, task_id, task_handle, config, transporters = message
+            try:
+                if task_handle != handle:
+                    raise RuntimeError('Task of problem ' + task_handle + ', but the worker has ' + str(handle))
+                ensure_transporters(csh, transporters)
+                csh.make_configuration(config)
+                modules_in_config = csh.modules_in_config(config)
+                if levels:
+                    result = get_extrapolated_time(csh.recipes, modules_in_config, levels, template, verifyta,
+                                                   xml_file, q_file, runner=runner)
+                else:
+                    result = get_best_time(csh.recipes, modules_in_config, template, verifyta, xml_file, q_file,
+                                           runner=runner)
+                connection.send(('result', task_id, result, None))
+            except RuntimeError as e:
+                connection.send(('result', task_id, None, e))
+            except Exception as e:
+                # The configuration is at fault rather than the worker, so it fails like any other configuration
+                connection.send(('result', task_id, None, RuntimeError(type(e).__name__ + ': ' + str(e))))
+    except (EOFError, OSError):
+        pass
+    finally:
+        connection.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluates configurations for a RemoteEvaluator.')
+    parser.add_argument('address', help='host:port or the path of a Unix socket')
+    parser.add_argument('--authkey', required=True)
+    parser.add_argument('--verifyta', default=VERIFYTA)
+    parser.add_argument('--name')
+    args = parser.parse_args()
+    run_worker(parse_address(args.address), args.authkey.encode(), args.verifyta, args.name)
+
+
+if __name__ == '__main__':
+    main()
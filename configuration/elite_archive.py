@@ -0,0 +1,73 @@
+import heapq
+
+
+class EliteArchive:
+    """ Keeps the best configurations found by a search, updated incrementally as they are evaluated.
+    Internally a heap with the worst elite on top, so a new configuration is compared against it in constant time.
+    """
+    def __init__(self, size=10):
+        """
+        :param size: How many configurations are kept
+        """
+        self.size = size
+        self.heap = []  # (-fitness, -counter, config), the counter keeps the earliest of equal fitnesses
+        self.members = set()
+        self.counter = 0
+        self.best_config = None
+        self.best_fitness = float('inf')
+        self.tied = set()  # Every configuration added with the best fitness, also those no longer kept
+
+    def add(self, config, fitness):
+        """
+        :param config: A string representing a configuration
+        :param fitness: Its fitness, lower is better
+        :return: True if the configuration is a new best
+        """
+        if config in self.members:
+            return False
+
+        self.counter += 1
+        entry = (-fitness, -self.counter, config)
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, entry)
+            self.members.add(config)
+        elif entry > self.heap[0]:
+            removed = heapq.heapreplace(self.heap, entry)
+            self.members.discard(removed[2])
+            self.members.add(config)
+
+        if fitness < self.best_fitness:
+            self.best_config = config
+            self.best_fitness = fitness
+            self.tied = {config}
+            return True
+        if fitness == self.best_fitness:
+            self.tied.add(config)
+        return False
+
+    def best(self):
+        """
+        :return: (config, fitness) of the best configuration, or None if nothing was added
+        """
+        if self.best_config is None:
+            return None
+        return self.best_config, self.best_fitness
+
+    def elites(self):
+        """
+        :return: A list of (config, fitness) tuples, best first
+        """
+        return [(config, -fitness) for fitness, _, config in sorted(self.heap, reverse=True)]
+
+    def ties(self):
+        """
+        :return: A set of (config, fitness) tuples of all configurations added with the best fitness, including those
+        that did not fit in the archive
+        """
+        return {(config, self.best_fitness) for config in self.tied}
+
+    def __contains__(self, config):
+        return config in self.members
+
+    def __len__(self):
+        return len(self.heap)
@@ -0,0 +1,425 @@
+import math
+from UPPAAL.fidelity import fidelity_levels, get_extrapolated_time
+from UPPAAL.scheduler import VerifytaLimitExceeded
+from UPPAAL.uppaalAPI import get_best_time, VERIFYTA, XML_TEMPLATE, XML_FILE, Q_FILE
+from configuration.pipeline import EvaluationPipeline
+from configuration.simulator import simulate
+
+
+class PrunedError(RuntimeError):
+    """ A configuration was not evaluated, as it was shown that it can not beat the best one found.
+    """
+
+
+class Evaluator:
+    """ Evaluates configuration strings for tabu_search_iter, whose evaluator argument takes one. An evaluator either
+    evaluates configurations itself or is a layer in front of an inner evaluator, so layers can be stacked, e.g.
+    MemoEvaluator(BoundEvaluator(ScreeningEvaluator(SimulatorEvaluator(), VerifytaEvaluator(...)))).
+    A result is a (time, worked on, transported through, active works) tuple like get_best_time returns, and a
+    configuration that can not be evaluated raises a RuntimeError.
+    """
+    name = 'evaluator'
+
+    def __init__(self, inner=None):
+        """
+        :param inner: The evaluator this layer is in front of, None for one that evaluates by itself
+        """
+        self.inner = inner
+        self.csh = None
+        self.counts = {}
+
+    @property
+    def batch_size(self):
+        """ How many configurations evaluate_many can work on at once.
+        """
+        return self.inner.batch_size if self.inner is not None else 1
+
+    def attach(self, csh):
+        """ Called by the search before anything is evaluated.
+        :param csh: The config_string_handler object of the search, which all layers share
+        """
+        self.csh = csh
+        if self.inner is not None:
+            self.inner.attach(csh)
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def evaluate(self, config):
+        """
+        :param config: A string representing a configuration
+        :return: The result of the configuration
+        """
+        return self.inner.evaluate(config)
+
+    def evaluate_many(self, configs):
+        """
+        :param configs: A list of configuration strings
+        :return: A list with a (result, error) tuple for each of configs, in the same order. Either result or error is
+        None.
+        """
+        results = []
+        for config in configs:
+            try:
+                results.append((self.evaluate(config), None))
+            except RuntimeError as e:
+                results.append((None, e))
+        return results
+
+    def statistics(self):
+        """
+        :return: A dict from the name of each layer, outermost first, to a dict of its counts
+        """
+        stats = {self.name: dict(self.counts)}
+        if self.inner is not None:
+            stats.update(self.inner.statistics())
+        return stats
+
+    def report(self):
+        return '\n'.join(name + ': ' + ', '.join(k + ' ' + str(v) for k, v in sorted(counts.items()))
+                         for name, counts in self.statistics().items())
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+class VerifytaEvaluator(Evaluator):
+    """ Evaluates configurations with verifyta, as tabu_search_iter does without an evaluator.
+    """
+    name = 'verifyta'
+
+    def __init__(self, template_file=XML_TEMPLATE, verifyta=VERIFYTA, xml_file=XML_FILE, q_file=Q_FILE,
+                 instrumentation=None, runner=None, model_cache=None, fidelity=None):
+        """
+        :param template_file: A path to a template UPPAAL CORA XML file
+        :param verifyta: A path to an instance of UPPAAL CORAs verifyta
+        :param xml_file: Path the model is written to
+        :param q_file: Path the query is written to
+        :param instrumentation: If given, an Instrumentation that times the phases of the evaluation
+        :param runner: If given, runs verifyta instead of run_verifyta, see run_model
+        :param model_cache: If given, a ModelCache that is looked in before running verifyta
+        :param fidelity: If given, amounts the recipes are evaluated at, extrapolating the time of the full amounts
+        """
+        super().__init__()
+        self.template_file = template_file
+        self.verifyta = verifyta
+        self.xml_file = xml_file
+        self.q_file = q_file
+        self.instrumentation = instrumentation
+        self.runner = runner
+        self.model_cache = model_cache
+        self.fidelity = fidelity
+        self.levels = []
+
+    def attach(self, csh):
+        super().attach(csh)
+        self.levels = fidelity_levels(csh.recipes, self.fidelity) if self.fidelity else []
+
+    def evaluate(self, config):
+        self.csh.make_configuration(config)  # SIDE EFFECT: Makes loads of changes to modules
+        modules_in_config = self.csh.modules_in_config(config)
+        try:
+            if self.levels:
+                result = get_extrapolated_time(self.csh.recipes, modules_in_config, self.levels, self.template_file,
+                                               self.verifyta, self.xml_file, self.q_file, self.instrumentation,
+                                               self.runner, self.model_cache)
+            else:
+                result = get_best_time(self.csh.recipes, modules_in_config, self.template_file, self.verifyta,
+                                       self.xml_file, self.q_file, self.instrumentation, self.runner,
+                                       self.model_cache)
+        except VerifytaLimitExceeded:
+            self.count('limit_exceeded')
+            raise
+        except RuntimeError:
+            self.count('failed')
+            raise
+        self.count('evaluated')
+        return result
+
+
+class PoolEvaluator(Evaluator):
+    """ Evaluates batches of configurations with several verifyta processes at once, through an EvaluationPipeline.
+    """
+    name = 'pool'
+
+    def __init__(self, workers, template_file=XML_TEMPLATE, verifyta=VERIFYTA, instrumentation=None, runner=None,
+                 model_cache=None, fidelity=None):
+        """
+        :param workers: How many verifyta processes may run at once
+        :param template_file: A path to a template UPPAAL CORA XML file
+        :param verifyta: A path to an instance of UPPAAL CORAs verifyta
+        :param instrumentation: If given, an Instrumentation that times the phases of the evaluations
+        :param runner: If given, runs verifyta instead of run_verifyta, see run_model
+        :param model_cache: If given, a ModelCache that is looked in before running verifyta
+        :param fidelity: If given, amounts the recipes are evaluated at, extrapolating the time of the full amounts
+        """
+        super().__init__()
+        self.workers = workers
+        self.template_file = template_file
+        self.verifyta = verifyta
+        self.instrumentation = instrumentation
+        self.runner = runner
+        self.model_cache = model_cache
+        self.fidelity = fidelity
+        self.pipeline = None
+
+    @property
+    def batch_size(self):
+        return self.workers
+
+    def attach(self, csh):
+        super().attach(csh)
+        if self.pipeline is not None:
+            self.pipeline.close()
+        levels = fidelity_levels(csh.recipes, self.fidelity) if self.fidelity else []
+        self.pipeline = EvaluationPipeline(csh, csh.recipes, self.template_file, self.verifyta, self.workers,
+                                           self.instrumentation, self.runner, self.model_cache, levels)
+
+    def evaluate(self, config):
+        result, error = self.evaluate_many([config])[0]
+        if error is not None:
+            raise error
+        return result
+
+    def evaluate_many(self, configs):
+        outcomes = {}
+        queue = list(configs)
+        while queue or self.pipeline.busy():
+            while queue and self.pipeline.has_capacity():
+                config = queue.pop(0)
+                try:
+                    self.pipeline.submit(config)
+                except RuntimeError as e:
+                    outcomes[config] = (None, e)
+            for config, _, result, error in self.pipeline.completed():
+                outcomes[config] = (result, error)
+                self.count('failed' if error is not None else 'evaluated')
+        return [outcomes[config] for config in configs]
+
+    def close(self):
+        if self.pipeline is not None:
+            self.pipeline.close()
+            self.pipeline = None
+
+
+class SimulatorEvaluator(Evaluator):
+    """ Evaluates configurations in milliseconds with simulator.simulate, whose greedy schedules are not optimal.
+    """
+    name = 'simulator'
+
+    def evaluate(self, config):
+        self.csh.make_configuration(config)  # SIDE EFFECT: Makes loads of changes to modules
+        try:
+            result = simulate(self.csh.recipes, self.csh.modules_in_config(config))
+        except RuntimeError:
+            self.count('failed')
+            raise
+        self.count('simulated')
+        return result
+
+
+class ScreeningEvaluator(Evaluator):
+    """ Evaluates configurations with a cheap screen, e.g. a SimulatorEvaluator or a VerifytaEvaluator at reduced
+    amounts, and only evaluates those whose screened time would be a new best with the inner evaluator, so the best
+    time seen is never only screened. If the inner evaluator hits a limit, the screened result is kept.
+    """
+    name = 'screening'
+
+    def __init__(self, screen, inner):
+        """
+        :param screen: The cheap evaluator
+        :param inner: The exact evaluator
+        """
+        super().__init__(inner)
+        self.screen = screen
+        self.best = math.inf
+
+    def attach(self, csh):
+        super().attach(csh)
+        self.screen.attach(csh)
+
+    def evaluate(self, config):
+        screened = self.screen.evaluate(config)
+        self.count('screened')
+        if screened[0] >= self.best:
+            return screened
+
+        try:
+            result = self.inner.evaluate(config)
+        except VerifytaLimitExceeded:
+            self.count('unconfirmed')
+            return screened
+        self.count('confirmed')
+        self.count('absolute_error', abs(result[0] - screened[0]))
+        self.best = min(self.best, result[0])
+        return result
+
+    def statistics(self):
+        stats = {self.name: dict(self.counts)}
+        stats.update(self.screen.statistics())
+        stats.update(self.inner.statistics())
+        return stats
+
+    def close(self):
+        self.screen.close()
+        super().close()
+
+
+class MemoEvaluator(Evaluator):
+    """ Remembers the result of every configuration evaluated through it, in memory.
+    """
+    name = 'memo'
+
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.results = {}
+
+    def evaluate(self, config):
+        if config in self.results:
+            self.count('hit')
+            return self.results[config]
+        self.count('miss')
+        result = self.inner.evaluate(config)
+        self.results[config] = result
+        return result
+
+    def evaluate_many(self, configs):
+        missing = [c for c in dict.fromkeys(configs) if c not in self.results]
+        self.count('hit', len(configs) - len(missing))
+        self.count('miss', len(missing))
+        outcomes = dict(zip(missing, self.inner.evaluate_many(missing)))
+        for config, (result, error) in outcomes.items():
+            if error is None:
+                self.results[config] = result
+        return [(self.results[c], None) if c in self.results else outcomes[c] for c in configs]
+
+
+class PersistentEvaluator(Evaluator):
+    """ Looks configurations up in a FitnessStore before evaluating them, and stores every result in it, so results
+    outlive the search and are shared with other searches using the same file. The store does not keep which modules
+    transported what, so results found in it have None for it.
+    """
+    name = 'persistent'
+
+    def __init__(self, inner, store):
+        """
+        :param inner: The evaluator used for configurations not in the store
+        :param store: A FitnessStore
+        """
+        super().__init__(inner)
+        self.store = store
+
+    def lookup(self, config):
+        cached = self.store.get(config)
+        if cached is None:
+            self.count('miss')
+            return None
+        self.count('hit')
+        fitness, worked, active = cached
+        return fitness, worked, None, active, None
+
+    def evaluate(self, config):
+        result = self.lookup(config)
+        if result is None:
+            result = self.inner.evaluate(config)
+            self.store.put(config, result[0], result[1], result[3])
+        return result
+
+    def evaluate_many(self, configs):
+        found = {c: self.lookup(c) for c in dict.fromkeys(configs)}
+        missing = [c for c, result in found.items() if result is None]
+        outcomes = dict(zip(missing, self.inner.evaluate_many(missing)))
+        for config, (result, error) in outcomes.items():
+            if error is None:
+                self.store.put(config, result[0], result[1], result[3])
+        return [(found[c], None) if found[c] is not None else outcomes[c] for c in configs]
+
+
+def lower_bound(config, csh):
+    """ A time no schedule of the configuration can beat, ignoring transport. Every recipe has to go through its longest
+    chain of works, each taking at least the shortest p_time of the modules that can do it, and all the work has to be
+    shared between the workers of the modules.
+    :param config: A string representing a configuration
+    :param csh: config_string_handler object
+    :return: The bound, infinite if some work can not be done by any module of the configuration
+    """
+    modules = csh.modules_in_config(config)
+    fastest = {}
+    for m in modules:
+        for w in m.w_type:
+            fastest[w] = min(fastest.get(w, math.inf), m.p_time[w])
+
+    chain = 0
+    total = 0
+    for r in csh.recipes:
+        finish = {}
+        for w in topological_order(r):
+            finish[w] = max((finish[p] for p in r[w]), default=0) + fastest.get(w, math.inf)
+            total += r.amount * fastest.get(w, math.inf)
+        chain = max(chain, max(finish.values(), default=0))
+
+    workers = sum(1 for m in modules if m.w_type)
+    return max(chain, total / workers if workers else math.inf)
+
+
+def topological_order(recipe):
+    """
+    :return: The works of recipe, each after all of the works it depends on
+    """
+    order = []
+    placed = set()
+    remaining = list(recipe.keys())
+    while remaining:
+        ready = [w for w in remaining if all(p in placed for p in recipe[w])]
+        if not ready:
+            raise ValueError('Recipe ' + recipe.name + ' has cyclic dependencies')
+        for w in ready:
+            order.append(w)
+            placed.add(w)
+        remaining = [w for w in remaining if w not in placed]
+    return order
+
+
+class BoundEvaluator(Evaluator):
+    """ Skips configurations whose lower_bound shows they can not beat the best time that has come through it, raising
+    a PrunedError for them. The search treats these like configurations that could not be evaluated, so they are
+    never moved to.
+    """
+    name = 'bound'
+
+    def __init__(self, inner, bound=lower_bound, slack=0.0):
+        """
+        :param inner: The evaluator used for configurations that are not pruned
+        :param bound: A function from (config, csh) to a time the configuration can not beat
+        :param slack: Configurations are only pruned if their bound is more than this share above the best time, so
+        some worse ones are still evaluated for the search to move through
+        """
+        super().__init__(inner)
+        self.bound = bound
+        self.slack = slack
+        self.best = math.inf
+
+    def prune(self, config):
+        if self.bound(config, self.csh) > self.best * (1 + self.slack):
+            self.count('pruned')
+            return PrunedError('The lower bound of ' + config + ' is above the best time ' + str(self.best))
+        self.count('passed')
+        return None
+
+    def evaluate(self, config):
+        pruned = self.prune(config)
+        if pruned is not None:
+            raise pruned
+        result = self.inner.evaluate(config)
+        self.best = min(self.best, result[0])
+        return result
+
+    def evaluate_many(self, configs):
+        pruned = {c: self.prune(c) for c in configs}
+        kept = [c for c in configs if pruned[c] is None]
+        outcomes = dict(zip(kept, self.inner.evaluate_many(kept)))
+        for result, error in outcomes.values():
+            if error is None:
+                self.best = min(self.best, result[0])
+        return [(None, pruned[c]) if pruned[c] is not None else outcomes[c] for c in configs]
@@ -0,0 +1,85 @@
+import pickle
+import sqlite3
+
+
+class FitnessStore:
+    """ A fitness cache in a local SQLite file, so several searches, also in other processes, can reuse each others
+    verifyta results. It also holds the elite configurations each search has published, for migration between them.
+    The connection is opened on first use, so a store can be handed to a forked process before it is used.
+    """
+    def __init__(self, path):
+        """
+        :param path: Path of the SQLite file, it is created if it does not exist
+        """
+        self.path = path
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS evaluations '
+                                    '(config TEXT PRIMARY KEY, fitness, worked BLOB, active BLOB)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS elites '
+                                    '(island INTEGER, config TEXT, fitness, PRIMARY KEY (island, config))')
+            self.connection.commit()
+        return self.connection
+
+    def get(self, config):
+        """
+        :param config: A string representing a configuration
+        :return: (fitness, worked, active) if config has been evaluated by anyone, None otherwise
+        """
+        row = self.connect().execute('SELECT fitness, worked, active FROM evaluations WHERE config = ?',
+                                     (config,)).fetchone()
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1]), pickle.loads(row[2])
+
+    def put(self, config, fitness, worked, active):
+        """ Stores an evaluation. Evaluations already in the store are kept as they are.
+        :param config: A string representing a configuration
+        :param fitness: Its fitness
+        :param worked: The worked on dict of the evaluation
+        :param active: The active works dict of the evaluation
+        """
+        connection = self.connect()
+        connection.execute('INSERT OR IGNORE INTO evaluations VALUES (?, ?, ?, ?)',
+                           (config, fitness, pickle.dumps(worked), pickle.dumps(active)))
+        connection.commit()
+
+    def publish_elites(self, island, elites):
+        """ Replaces the published elites of an island.
+        :param island: Index of the island
+        :param elites: A list of (config, fitness) tuples
+        """
+        connection = self.connect()
+        connection.execute('DELETE FROM elites WHERE island = ?', (island,))
+        connection.executemany('INSERT OR REPLACE INTO elites VALUES (?, ?, ?)',
+                               [(island, config, fitness) for config, fitness in elites])
+        connection.commit()
+
+    def foreign_elites(self, island, limit):
+        """
+        :param island: Index of the island asking
+        :param limit: How many elites to return at most
+        :return: A list of (config, fitness) tuples of the best elites published by other islands, best first
+        """
+        return self.connect().execute('SELECT config, MIN(fitness) FROM elites WHERE island != ? '
+                                      'GROUP BY config ORDER BY MIN(fitness), config LIMIT ?',
+                                      (island, limit)).fetchall()
+
+    def count(self):
+        """
+        :return: The number of evaluations in the store
+        """
+        return self.connect().execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __getstate__(self):
+        # Connections can not be pickled, the copy connects on its own
+        return {'path': self.path, 'connection': None}
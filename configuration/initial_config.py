@@ -1,5 +1,5 @@
 from networkx import nx
-from random import shuffle
+import random
 
 def get_top_nodes(G):
     """
@@ -17,7 +17,7 @@ def get_top_nodes(G):
 
 # THIS IS THE POLICE SPEAKING
 # THIS IS A GENERATOR NOT A FUNCTION, BE WARY CITIZEN
-def initial_configurations(G, modules, csh, setup, recipe_starters, active_works):
+def initial_configurations(G, modules, csh, setup, recipe_starters, active_works, rng=None):
     """
     If possible creates a linear configuration.
     :param G: Graph describing recipes
@@ -25,12 +25,16 @@ def initial_configurations(G, modules, csh, setup, recipe_starters, active_works
     :param setup:  linear configuration setup up till now
     :param recipe_starters: dict describing which module each recipe starts at
     :param active_works: dict describing what works a module performs
+    :param rng: A random.Random used for shuffling the branches, the random module if None
     :param branches: A list, where each element is a list of arguments,
            which called on this function lets us explore a new branch
     :return:  Empty list if no branches are left
 
     """
 
+    if rng is None:
+        rng = random
+
     # Creates copies to get around referential integrity :-)
     G_copy = G.copy()
     recipe_starters_copy = recipe_starters.copy()
@@ -94,13 +98,14 @@ def initial_configurations(G, modules, csh, setup, recipe_starters, active_works
         for node in top_nodes:
             work = node[0]
             mods = [m for m in modules if work in m.w_type]
-            shuffle(mods) # Makes sure we yield random branches
+            rng.shuffle(mods) # Makes sure we yield random branches
             # Places down a module and constructs a new branch from this choice
             for m in mods:
                 update_mods = modules.copy()
                 update_mods.remove(m)
                 new_setup = setup + [m]
-                yield from initial_configurations(G_copy, update_mods, csh, new_setup, recipe_starters_copy, active_works_copy)
+                yield from initial_configurations(G_copy, update_mods, csh, new_setup, recipe_starters_copy,
+                                                  active_works_copy, rng)
 
 
 
@@ -139,6 +144,6 @@ def recipes_to_graph(recipes):
     return result_graph
 
 
-def initial_configuration_generator(recipes, modules, csh):
+def initial_configuration_generator(recipes, modules, csh, rng=None):
     G = recipes_to_graph(recipes)
-    return initial_configurations(G, modules, csh, [], {}, {})
\ No newline at end of file
+    return initial_configurations(G, modules, csh, [], {}, {}, rng)
\ No newline at end of file
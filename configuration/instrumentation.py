@@ -0,0 +1,176 @@
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+class Instrumentation:
+    """ Timers and counters for the phases of a search. Phases are named with slashes, e.g. 'neighbours/iter_swap', and
+    their times are inclusive, so a phase running inside another counts towards both. It is safe to use from the
+    worker threads of an EvaluationPipeline, whose times are summed, so phases run by workers can exceed 100%.
+    """
+    def __init__(self, events_file=None, profile_iteration=None, profile_file='iteration.prof'):
+        """
+        :param events_file: If given, a JSON object describing each iteration is written to this file, one per line
+        :param profile_iteration: If given, this iteration is run under cProfile and tracemalloc
+        :param profile_file: Where the cProfile statistics of profile_iteration are dumped, readable by pstats
+        """
+        self.lock = threading.Lock()
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.started = time.perf_counter()
+
+        self.events = open(events_file, 'w') if events_file else None
+        self.profile_iteration = profile_iteration
+        self.profile_file = profile_file
+        self.profiler = None
+        self.memory_top = []
+
+        # Totals at the start of the current iteration, so events can hold what happened during it
+        self.iteration_started = None
+        self.iteration_times = {}
+        self.iteration_counters = {}
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.times[name] += seconds
+            self.calls[name] += 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def phase(self, name):
+        """ Times the body of a with statement as phase name.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def timed_iter(self, iterable, name):
+        """ Times every step of an iterator as phase name, e.g. the lazy work of a generator. The items it gives are
+        counted under the same name.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - started)
+                return
+            self.add_time(name, time.perf_counter() - started)
+            self.count(name)
+            yield item
+
+    def wrap_method(self, obj, method_name, name=None):
+        """ Times every call of a method of obj, by shadowing it on the instance.
+        """
+        method = getattr(obj, method_name)
+        phase = name or method_name
+
+        @wraps(method)
+        def timed(*args, **kwargs):
+            with self.phase(phase):
+                return method(*args, **kwargs)
+
+        setattr(obj, method_name, timed)
+
+    def begin_iteration(self, iteration):
+        with self.lock:
+            self.iteration_times = dict(self.times)
+            self.iteration_counters = dict(self.counters)
+        self.iteration_started = time.perf_counter()
+
+        if iteration == self.profile_iteration:
+            tracemalloc.start()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def end_iteration(self, iteration, **fields):
+        """ Ends an iteration, writing an event with fields and the phases and counters of the iteration.
+        """
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+            self.profiler = None
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.memory_top = [(str(stat.traceback), stat.size, stat.count)
+                               for stat in snapshot.statistics('lineno')[:10]]
+
+        if self.events:
+            with self.lock:
+                phases = {k: v - self.iteration_times.get(k, 0.0) for k, v in self.times.items()
+                          if v != self.iteration_times.get(k, 0.0)}
+                counters = {k: v - self.iteration_counters.get(k, 0) for k, v in self.counters.items()
+                            if v != self.iteration_counters.get(k, 0)}
+            event = {'iteration': iteration, 'seconds': time.perf_counter() - self.iteration_started,
+                     'phases': phases, 'counters': counters}
+            event.update(fields)
+            self.events.write(json.dumps(event, default=str) + '\n')
+            self.events.flush()
+
+    def report(self):
+        """
+        :return: A string with the time and calls of each phase, the counters and, if an iteration was profiled, the
+        lines that allocated the most memory in it
+        """
+        total = time.perf_counter() - self.started
+        lines = ['Total: %.3fs' % total, '', '%-50s %10s %8s %10s' % ('Phase', 'Seconds', 'Share', 'Calls')]
+        with self.lock:
+            for name, seconds in sorted(self.times.items(), key=lambda x: -x[1]):
+                lines.append('%-50s %10.3f %7.1f%% %10d' % (name, seconds, 100 * seconds / total, self.calls[name]))
+            lines += ['', '%-50s %10s' % ('Counter', 'Value')]
+            for name, value in sorted(self.counters.items()):
+                lines.append('%-50s %10d' % (name, value))
+
+        if self.memory_top:
+            lines += ['', 'Largest allocations of iteration ' + str(self.profile_iteration) + ':']
+            for where, size, count in self.memory_top:
+                lines.append('%-50s %10d B %8d blocks' % (where, size, count))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self.events:
+            self.events.close()
+            self.events = None
+
+
+class NullInstrumentation(Instrumentation):
+    """ Does nothing, used when no instrumentation is asked for.
+    """
+    def __init__(self):
+        super().__init__()
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def phase(self, name):
+        return nullcontext()
+
+    def timed_iter(self, iterable, name):
+        return iterable
+
+    def wrap_method(self, obj, method_name, name=None):
+        pass
+
+    def begin_iteration(self, iteration):
+        pass
+
+    def end_iteration(self, iteration, **fields):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
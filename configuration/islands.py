@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import queue as queue_module
+import random
+import shutil
+import tempfile
+from configuration.config_string_handler import ConfigStringHandler
+from configuration.elite_archive import EliteArchive
+from configuration.fitness_store import FitnessStore
+from configuration.initial_config import initial_configuration_generator
+from configuration.tabu_search import tabu_search
+
+# Seconds between checks that the islands are still alive while waiting for their results
+ISLAND_POLL = 1.0
+
+
+def island_search(recipes, modules, transport_module, islands=4, store_file=None, migrants=3, migration_every=5,
+                  seed=None, **kwargs):
+    """ Runs several tabu searches in separate processes, each starting from its own initial configuration.
+    The islands share a fitness cache in a SQLite file, so none of them evaluates a configuration another has already
+    evaluated, and every migration_every iterations they publish their elites and take in the best of the others.
+    :param recipes: A list of Recipe objects
+    :param modules: A list of module objects
+    :param transport_module: The module that transport modules are copied from
+    :param islands: Number of processes
+    :param store_file: Path of the shared SQLite file. If None, a temporary one is used and removed afterwards.
+    :param migrants: How many elites an island takes in at each migration
+    :param migration_every: How many iterations there are between migrations
+    :param seed: If given, the initial configurations are drawn with it, and island i seeds its random number generator
+    from seed and i
+    :param kwargs: Any other keyword arguments of tabu_search_iter, used by every island
+    :return: The best configurations found by any island, as a set of (config, fitness) tuples
+    """
+    # The model files of the islands, and the store unless one is given, are kept in a directory removed afterwards
+    directory = tempfile.mkdtemp(prefix='islands')
+    if store_file is None:
+        store_file = os.path.join(directory, 'fitness.sqlite')
+
+    # Island i starts from the i'th initial configuration, wrapping around if there are fewer than islands
+    csh = ConfigStringHandler(recipes, modules, transport_module)
+    generator = initial_configuration_generator(recipes, modules, csh, random.Random(seed))
+    initial = [config for _, config in zip(range(islands), generator)]
+    if not initial:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise RuntimeError('No initial configuration could be made')
+
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    processes = []
+    for index in range(islands):
+        args = (index, recipes, modules, transport_module, initial[index % len(initial)], store_file, directory,
+                migrants, migration_every, seed, kwargs, queue)
+        process = context.Process(target=_run_island, args=args)
+        process.start()
+        processes.append(process)
+
+    try:
+        archive = EliteArchive()
+        reported = set()
+        dead = set()  # Islands found dead without a result, given one more poll as their result may still be coming
+        while len(reported) < len(processes):
+            try:
+                index, elites = queue.get(timeout=ISLAND_POLL)
+            except queue_module.Empty:
+                # An island that is killed, e.g. by the OOM killer, never puts anything on the queue
+                for index, process in enumerate(processes):
+                    if index not in reported and not process.is_alive():
+                        if index in dead:
+                            raise RuntimeError('Island ' + str(index) + ' died with exit code ' +
+                                               str(process.exitcode))
+                        dead.add(index)
+                continue
+            if elites is None:
+                raise RuntimeError('Island ' + str(index) + ' failed')
+            reported.add(index)
+            for config, fitness in elites:
+                archive.add(config, fitness)
+    except BaseException:
+        # The other islands are not waited for, as they would go on with their whole search
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return archive.ties()
+
+
+def _run_island(index, recipes, modules, transport_module, initial_config, store_file, directory, migrants,
+                migration_every, seed, kwargs, queue):
+    """ The body of an island process. Puts (index, elites) on the queue when done, with elites None on failure.
+    """
+    try:
+        rng = random.Random(None if seed is None else str(seed) + '/' + str(index))
+        store = FitnessStore(store_file)
+
+        def migration(elites):
+            store.publish_elites(index, elites)
+            result = []
+            for config, _ in store.foreign_elites(index, migrants):
+                cached = store.get(config)
+                if cached:
+                    fitness, worked, active = cached
+                    result.append((config, (fitness, worked, None, active, None)))
+            return result
+
+        archive = EliteArchive()
+        tabu_search(recipes, modules, transport_module, initial_configs=[initial_config], shared_cache=store,
+                    migration=migration, migration_every=migration_every, archive=archive, rng=rng,
+                    xml_file=os.path.join(directory, 'island' + str(index) + '.xml'),
+                    q_file=os.path.join(directory, 'island' + str(index) + '.q'), **kwargs)
+        store.publish_elites(index, archive.elites())
+        store.close()
+        queue.put((index, archive.elites()))
+    except BaseException:
+        queue.put((index, None))
+        raise
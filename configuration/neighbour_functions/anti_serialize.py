@@ -1,5 +1,5 @@
 from configuration.path_placers import connect_module_list, push_around, push_underneath
-from random import choice
+import random
 
 
 def anti_serialize(start, path, end, csh):
@@ -93,25 +93,47 @@ def anti_serialize(start, path, end, csh):
     return csh.configuration_str()
 
 
-def neighbours_anti_serialized(frontier, csh, active):
+def neighbours_anti_serialized(frontier, csh, active, rng=None):
     """
     Gets all possible anti_serializations, when trying to split out a random recipe from main line
     :param frontier: Configuration string, which we wish to find neighbours for
     :param csh: config_string_handler object
     :param active: active dict
+    :param rng: A random.Random used for choosing the recipe, the random module if None
     :return: A list of strings, each representing a neighbouring configuration
     """
+    return list(iter_neighbours_anti_serialized(frontier, csh, active, rng=rng))
 
-    csh.make_configuration(frontier)
-    for m in csh.modules_in_config(frontier):
-        if m.m_id in active:
-            m.active_w_type = active[m.m_id]
+
+def iter_neighbours_anti_serialized(frontier, csh, active, skip=None, rng=None, profile=None):
+    """
+    Generator version of neighbours_anti_serialized. Neighbours are only made when asked for, so the caller can stop
+    early. The state of csh is restored from frontier before each neighbour, as the caller may use csh in between.
+    :param frontier: Configuration string, which we wish to find neighbours for
+    :param csh: config_string_handler object
+    :param active: active dict
+    :param skip: Optional predicate. Neighbours for which it is true are not yielded.
+    :param rng: A random.Random used for choosing the recipe, the random module if None
+    :param profile: Not used, as every recipe is made to take its own path. Taken so all neighbour functions are called
+    alike.
+    :return: A generator of strings, each representing a neighbouring configuration
+    """
+    if rng is None:
+        rng = random
+
+    def make_frontier():
+        csh.make_configuration(frontier)
+        for m in csh.modules_in_config(frontier):
+            if m.m_id in active:
+                m.active_w_type = active[m.m_id]
+
+    make_frontier()
 
     # Get Main line
     main_line, _, _ = csh.find_lines()
 
     # Choose random recipe to anti-serialize
-    recipe = choice(csh.recipes)
+    recipe = rng.choice(csh.recipes)
     r = set(recipe.keys())
     r_bar = set()
     for rec in csh.recipes:
@@ -125,12 +147,12 @@ def neighbours_anti_serialized(frontier, csh, active):
     S = None
     E = None
     B = []
-    
+
     for mod in main_line:
         if mod in K and not E:
             E = mod
             if B:
-                neighbour_args.append([S, B, E, csh])
+                neighbour_args.append([S, B, E])
             S = E
             B = []
             E = None
@@ -138,13 +160,17 @@ def neighbours_anti_serialized(frontier, csh, active):
             B.append(mod)
 
     if S and B:
-        neighbour_args.append([S, B, E, csh])
-            
-    neighbours = []
-    for n in neighbour_args:
-        # Only call neighbours, where we do not remove starts and ends of other branches
-        path = n[1]
-        if not any(x.is_start or x.is_end for x in path):
-            neighbours.append(anti_serialize(*n))
-
-    return neighbours
\ No newline at end of file
+        neighbour_args.append([S, B, E])
+
+    # Only call neighbours, where we do not remove starts and ends of other branches
+    neighbour_args = [n for n in neighbour_args if not any(x.is_start or x.is_end for x in n[1])]
+
+    seen = set()
+    for i, (start, path, end) in enumerate(neighbour_args):
+        if i:
+            make_frontier()
+        neighbour = anti_serialize(start, list(path), end, csh)
+        if neighbour in seen or (skip and skip(neighbour)):
+            continue
+        seen.add(neighbour)
+        yield neighbour
@@ -1,3 +1,4 @@
+from configuration.bottlenecks import saturated_modules
 from configuration.path_placers import  push_underneath
 import random
 
@@ -5,7 +6,7 @@ def parallel_args(line, free_modules, csh):
     temp = []
     for split, m in enumerate(line):
         cm = capable_modules(m.active_w_type, free_modules)
-        free_modules = list(set(free_modules) - set(csh.transport_modules))
+        free_modules = [f for f in free_modules if f not in csh.transport_modules]
         temp.append((m, parallel_args_helper(cm, line[split + 1:], free_modules)))
 
     # Check whether or not we can attach this path to a start and end and that the path has an actual length
@@ -47,7 +48,7 @@ def parallel_args_helper(capable, remaining, free_modules):
 
 
         """
-        for c in capable:
+        for c in sorted(capable, key=lambda x: x.m_id):  # Sets of modules are in hash order, which varies between runs
             fm = free_modules.copy()
             fm.remove(c)
             temp = []
@@ -63,6 +64,29 @@ def parallel_args_helper(capable, remaining, free_modules):
 
 
 def neighbours_parallelize(frontier, csh, active):
+    """
+    Gets all neighbours where a part of a line is put in parallel with free modules
+    :param frontier: Configuration string, which we wish to find neighbours for
+    :param csh: config_string_handler object
+    :param active: active dict
+    :return: A list of strings, each representing a neighbouring configuration
+    """
+    return list(iter_neighbours_parallelize(frontier, csh, active))
+
+
+def iter_neighbours_parallelize(frontier, csh, active, skip=None, rng=None, profile=None):
+    """
+    Generator version of neighbours_parallelize. All arguments are found up front, but each neighbour is only made
+    when asked for.
+    :param frontier: Configuration string, which we wish to find neighbours for
+    :param csh: config_string_handler object
+    :param active: active dict
+    :param skip: Optional predicate. Neighbours for which it is true are not yielded.
+    :param rng: Not used, as all neighbours are found. Taken so all neighbour functions are called alike.
+    :param profile: If given, the profile of the schedule of frontier. Only parts of lines with a saturated module are
+    then put in parallel, unless no part has one.
+    :return: A generator of strings, each representing a neighbouring configuration
+    """
     def parallel_config_string(frontier, start, path, end, csh, direction):
         csh.make_configuration(frontier)
         t0 = csh.take_transport_module()
@@ -91,28 +115,33 @@ def neighbours_parallelize(frontier, csh, active):
 
     main_line, up_lines, down_lines = csh.find_lines()
 
-    main_args_list = parallel_args(main_line, csh.free_modules, csh)
-    main_configs = []
-    for args in main_args_list:
-        main_configs.append(parallel_config_string(frontier, *args, csh, 'up'))
-        main_configs.append(parallel_config_string(frontier, *args, csh, 'down'))
+    # The arguments depend on the state of csh, so all of them are found before the first neighbour is made
+    config_args = []
+    for args in parallel_args(main_line, csh.free_modules, csh):
+        config_args.append((args, 'up'))
+        config_args.append((args, 'down'))
 
-    up_configs = []
     for up in up_lines:
-        args_list = parallel_args(up, csh.free_modules, csh)
-        for args in args_list:
-            config = parallel_config_string(frontier, *args, csh, 'up')
-            up_configs.append(config)
+        for args in parallel_args(up, csh.free_modules, csh):
+            config_args.append((args, 'up'))
 
-    down_configs = []
     for down in down_lines:
-        args_list = parallel_args(down, csh.free_modules, csh)
-        for args in args_list:
-            config = parallel_config_string(frontier, *args, csh, 'down')
-            down_configs.append(config)
-
-
-    return list(set(main_configs + up_configs + down_configs))
+        for args in parallel_args(down, csh.free_modules, csh):
+            config_args.append((args, 'down'))
+
+    saturated = saturated_modules(profile, csh)
+    guided = [(args, direction) for args, direction in config_args
+              if any(m.m_id in saturated for m in args[0].traverse_right(args[2])[1:-1])]
+    if guided:
+        config_args = guided
+
+    seen = set()
+    for args, direction in config_args:
+        config = parallel_config_string(frontier, *args, csh, direction)
+        if config in seen or (skip and skip(config)):
+            continue
+        seen.add(config)
+        yield config
 
 
 def modules_by_worktype(modules):
@@ -1,59 +1,84 @@
+from configuration.bottlenecks import slow_critical_modules, processing_time
+from configuration.config_string_handler import parse_configuration, relabel_configuration
+
+
 def neighbours_swap(frontier, csh, active):
-    """ Finds all neighbours where we can swap modules out, but still retain the same active works
+    """ Finds all neighbours where we can swap modules out, but still retain the same active works.
     :param frontier: The config that the tabu search is currently finding neighbours for
-    :param recipes: A list of Recipe objects
-    :return:
+    :param csh: config_string_handler object
+    :param active: active dict
+    :return: A list of strings, each representing a neighbouring configuration
     """
+    return list(iter_neighbours_swap(frontier, csh, active))
+
+
+def iter_neighbours_swap(frontier, csh, active, skip=None, rng=None, profile=None):
+    """ Generator version of neighbours_swap.
+    A swap is only a relabelling of two modules, so it is done directly on the parsed configuration string without
+    rewiring any module objects.
+    :param frontier: The config that the tabu search is currently finding neighbours for
+    :param csh: config_string_handler object
+    :param active: active dict
+    :param skip: Optional predicate. Neighbours for which it is true are not yielded.
+    :param rng: Not used, as all swaps are found. Taken so all neighbour functions are called alike.
+    :param profile: If given, the profile of the schedule of frontier. Only the slow modules on its critical path are
+    then swapped, for free modules that do their works faster or with each other, unless there is no such swap.
+    :return: A generator of strings, each representing a neighbouring configuration
+    """
+
+    def external_swaps(config_ids, free_ids):
+        # Free modules with the same characteristics give the same neighbour, so only one of each is tried
+        representatives = {}
+        for m_id in free_ids:
+            representatives.setdefault(characteristics[m_id], m_id)
+        free_ids = sorted(representatives.values())
+
+        for old in config_ids:
+            if not modules[old][0]:
+                continue
+            old_active = set(modules[old][0].split(sep=','))
+            for new in free_ids:
+                if old_active <= csh.module_dictionary[new].w_type and characteristics[old] != characteristics[new]:
+                    yield {old: new}
+
+    def internal_swaps(config_ids):
+        for i, m0 in enumerate(config_ids):
+            if not modules[m0][0]:
+                continue
+            for m1 in config_ids[i + 1:]:
+                if modules[m0][0] == modules[m1][0] and characteristics[m0] != characteristics[m1]:
+                    yield {m0: m1, m1: m0}
+
+    recipes, modules, main_line = parse_configuration(frontier)
+    for m_id, entry in modules.items():
+        if m_id in active:
+            entry[0] = ','.join(sorted(active[m_id]))
+
+    transport_ids = {t.m_id for t in csh.transport_modules}
+    config_ids = sorted(m_id for m_id in modules if m_id not in transport_ids)
+    free_ids = sorted(m_id for m_id in csh.module_dictionary if m_id not in modules and m_id not in transport_ids)
+    characteristics = {m_id: csh.module_dictionary[m_id].characteristics() for m_id in config_ids + free_ids}
+
+    def is_guided(mapping):
+        for old, new in mapping.items():
+            if old in slow:
+                works = modules[old][0].split(sep=',')
+                if new in modules or processing_time(csh.module_dictionary[new], works) < \
+                        processing_time(csh.module_dictionary[old], works):
+                    return True
+        return False
+
+    mappings = [mapping for swaps in (external_swaps(config_ids, free_ids), internal_swaps(config_ids))
+                for mapping in swaps]
+    slow = slow_critical_modules(profile, csh)
+    guided = [mapping for mapping in mappings if is_guided(mapping)]
+    if guided:
+        mappings = guided
 
-    def swap(frontier, csh, m0, m1):
-        """
-        :param frontier:
-        :param csh:
-        :param m0:
-        :param m1:
-        :return:
-        """
-        csh.make_configuration(frontier)
-        csh.swap_modules(m0, m1)
-        return csh.configuration_str()
-
-    def internal_swap_neighbours(frontier, csh, config_modules):
-        neighbours = []
-        for m0 in config_modules:
-            csh.make_configuration(frontier)
-            if m0.active_w_type:
-                swappable = [m1 for m1 in config_modules if m0.active_w_type == m1.active_w_type
-                                                         and m0 != m1
-                                                         and m1.active_w_type]
-                for m1 in swappable:
-                    neighbours.append(swap(frontier, csh, m1, m0))
-        return neighbours
-
-    def external_swap_neighbours(frontier, csh, config_modules, free_modules):
-        neighbours = []
-        for old in config_modules:
-            csh.make_configuration(frontier)
-            if old.active_w_type:
-                swappable = [new for new in free_modules if old.active_w_type <= new.w_type
-                                                         and old != new
-                                                         and new.active_w_type]
-                for new in swappable:
-                    neighbours.append(swap(frontier, csh, old, new))
-        return neighbours
-
-
-    csh.make_configuration(frontier)
-    for m in csh.modules_in_config(frontier):
-        if m.m_id in active:
-            m.active_w_type = active[m.m_id]
-
-    config_str = csh.configuration_str()
-
-
-    config_modules = list(set(csh.modules_in_config(config_str)) - set(csh.transport_modules))
-    free_modules = list(set(csh.modules_not_in_config(config_str)) - set(csh.transport_modules))
-
-    external_neighbours = external_swap_neighbours(frontier, csh, config_modules, free_modules)
-    internal_neighbours = internal_swap_neighbours(frontier, csh, config_modules)
-
-    return list(set(external_neighbours + internal_neighbours))
\ No newline at end of file
+    seen = set()
+    for mapping in mappings:
+        neighbour = relabel_configuration(recipes, modules, main_line, mapping)
+        if neighbour in seen or (skip and skip(neighbour)):
+            continue
+        seen.add(neighbour)
+        yield neighbour
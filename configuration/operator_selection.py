@@ -0,0 +1,84 @@
+import math
+from collections import deque
+from configuration.neighbour_functions.anti_serialize import iter_neighbours_anti_serialized
+from configuration.neighbour_functions.parallelize import iter_neighbours_parallelize
+from configuration.neighbour_functions.swap import iter_neighbours_swap
+
+OPERATORS = [iter_neighbours_anti_serialized, iter_neighbours_parallelize, iter_neighbours_swap]
+
+
+class OperatorSelector:
+    """ Picks neighbour functions with a multi-armed bandit, instead of the fixed weight schedule of tabu_search.
+    The reward of an operator is the fitness improvement it gave, per second spent generating and evaluating its
+    neighbourhood. Rewards are scaled by the best average reward, so the exploration term does not depend on the size
+    of the makespans of the factory.
+    """
+    def __init__(self, operators=None, policy='ucb', exploration=1.0, window=30):
+        """
+        :param operators: A list of neighbour functions, defaults to all of them
+        :param policy: 'ucb' uses UCB1 over all uses of each operator. 'window' uses UCB1 over only the latest uses, so
+        the selection can follow operators whose payoff changes during the search.
+        :param exploration: Weight of the exploration term of UCB1
+        :param window: How many of the latest uses the 'window' policy looks at
+        """
+        if policy not in ('ucb', 'window'):
+            raise ValueError("policy must be 'ucb' or 'window'")
+
+        self.operators = list(operators) if operators else list(OPERATORS)
+        self.policy = policy
+        self.exploration = exploration
+
+        # Totals for each operator over the whole search
+        self.uses = {op: 0 for op in self.operators}
+        self.improvement = {op: 0 for op in self.operators}
+        self.seconds = {op: 0.0 for op in self.operators}
+
+        # The latest (operator, reward) pairs
+        self.history = deque(maxlen=window if policy == 'window' else None)
+
+    def choose(self):
+        """
+        :return: The neighbour function to use in the next iteration
+        """
+        uses = {op: 0 for op in self.operators}
+        rewards = {op: 0.0 for op in self.operators}
+        for op, reward in self.history:
+            uses[op] += 1
+            rewards[op] += reward
+
+        # Every operator is tried once before any comparison is made
+        for op in self.operators:
+            if not uses[op]:
+                return op
+
+        means = {op: rewards[op] / uses[op] for op in self.operators}
+        scale = max(means.values()) or 1.0
+        total = sum(uses.values())
+
+        def score(op):
+            return means[op] / scale + self.exploration * math.sqrt(2 * math.log(total) / uses[op])
+
+        return max(self.operators, key=score)
+
+    def update(self, operator, improvement, seconds):
+        """ Credits an operator with the result of an iteration.
+        :param operator: The neighbour function that was used
+        :param improvement: How much better the new frontier is than the old one, negative values count as zero
+        :param seconds: Wall-clock time spent generating and evaluating the neighbourhood
+        """
+        improvement = max(improvement, 0)
+        self.uses[operator] += 1
+        self.improvement[operator] += improvement
+        self.seconds[operator] += seconds
+        self.history.append((operator, improvement / max(seconds, 1e-6)))
+
+    def statistics(self):
+        """
+        :return: A dict from operator name to a dict of its uses, total improvement, seconds spent and improvement per
+        second
+        """
+        return {op.__name__: {'uses': self.uses[op],
+                              'improvement': self.improvement[op],
+                              'seconds': self.seconds[op],
+                              'rate': self.improvement[op] / self.seconds[op] if self.seconds[op] else 0.0}
+                for op in self.operators}
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from UPPAAL.uppaalAPI import prepare_model, run_model
+from UPPAAL.fidelity import prepare_models, run_models, total_amount
+
+
+class EvaluationPipeline:
+    """ Evaluates several configurations at once. Building a model reads the module objects, which the search is
+    constantly rewiring, so models are built in the calling thread. Only verifyta and the parsing of its trace run in
+    the worker threads, which leaves the calling thread free to generate neighbours in the meantime.
+    """
+    def __init__(self, csh, recipes, template_file, verifyta, workers, instrumentation=None, runner=None,
+                 model_cache=None, levels=None):
+        """
+        :param csh: config_string_handler object, shared with the search
+        :param recipes: A list of Recipe objects
+        :param template_file: A path to a template UPPAAL CORA XML file
+        :param verifyta: A path to an instance of UPPAAL CORAs verifyta
+        :param workers: How many verifyta processes may run at once
+        :param instrumentation: If given, an Instrumentation that times the phases of the evaluations
+        :param runner: If given, runs verifyta instead of run_verifyta, see run_model
+        :param model_cache: If given, a ModelCache that is looked in before running verifyta
+        :param levels: If given, configurations are evaluated at these reduced amounts and their time is extrapolated,
+        see fidelity.run_models
+        """
+        self.csh = csh
+        self.recipes = recipes
+        self.template_file = template_file
+        self.verifyta = verifyta
+        self.instrumentation = instrumentation
+        self.runner = runner
+        self.model_cache = model_cache
+        self.levels = levels
+
+        self.directory = tempfile.mkdtemp(prefix='tabu_pipeline')
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.free_slots = list(range(workers))  # Each running evaluation needs its own model files
+        self.pending = {}  # future -> (config, slot, speculative)
+
+    def has_capacity(self):
+        return bool(self.free_slots)
+
+    def busy(self):
+        return bool(self.pending)
+
+    def submit(self, config, speculative=False):
+        """ Builds the model for config and starts verifyta on it.
+        :param config: A string representing a configuration
+        :param speculative: Marks evaluations that were not asked for by the current iteration
+        """
+        slot = self.free_slots.pop()
+        xml_file = os.path.join(self.directory, 'model' + str(slot) + '.xml')
+        q_file = os.path.join(self.directory, 'model' + str(slot) + '.q')
+
+        self.csh.make_configuration(config)  # SIDE EFFECT: Makes loads of changes to modules
+        modules_in_config = self.csh.modules_in_config(config)
+        if self.levels:
+            prepared = prepare_models(self.recipes, modules_in_config, self.levels, self.template_file, xml_file,
+                                      q_file, self.instrumentation, canonical=self.model_cache is not None)
+            future = self.executor.submit(run_models, prepared, total_amount(self.recipes), self.verifyta,
+                                          self.instrumentation, self.runner, self.model_cache)
+        else:
+            maps = prepare_model(self.recipes, modules_in_config, self.template_file, xml_file, q_file,
+                                 self.instrumentation, canonical=self.model_cache is not None)
+            future = self.executor.submit(run_model, xml_file, q_file, maps, self.verifyta, self.instrumentation,
+                                          self.runner, self.model_cache)
+        self.pending[future] = (config, slot, speculative)
+
+    def completed(self, timeout=None):
+        """ Waits until at least one evaluation is done.
+        :param timeout: Seconds to wait. If None, waits until something completes.
+        :return: A list of (config, speculative, result, error) tuples. Either result or error is None.
+        """
+        if not self.pending:
+            return []
+
+        done, _ = wait(list(self.pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        finished = []
+        for future in [f for f in self.pending if f in done]:  # In the order they were submitted
+            config, slot, speculative = self.pending.pop(future)
+            self.free_slots.append(slot)
+            try:
+                finished.append((config, speculative, future.result(), None))
+            except Exception as e:
+                # Any error fails the evaluation alone, so no future is left behind for the next iteration
+                finished.append((config, speculative, None, e))
+        return finished
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
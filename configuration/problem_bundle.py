@@ -0,0 +1,98 @@
+""" A problem, i.e. the modules, the transport module, the recipes and the template, as one compact binary bundle. A
+bundle is a fixed header followed by the problem as plain lists, dicts and strings in the marshal format, so loading it
+is a single marshal.loads and building the objects skips all validation. Bundles written to a file can be memory-mapped
+by any number of processes, e.g. those of a pool, which then share its pages.
+"""
+import hashlib
+import marshal
+import mmap
+import struct
+from module import SquareModule
+from recipe import Recipe
+from UPPAAL.xml_generator import template_parts
+
+BUNDLE_MAGIC = b'TSPB'
+BUNDLE_VERSION = 1
+# Magic, version and length of the body
+BUNDLE_HEADER = struct.Struct('<4sHxxQ')
+# Pinned, so the bytes of a bundle do not change with the default of the Python version
+MARSHAL_VERSION = 4
+
+
+def module_record(module):
+    return (module.m_id, dict(module.p_time), [list(row) for row in module.t_time], module.queue_length,
+            bool(module.allow_passthrough))
+
+
+def recipe_record(recipe):
+    return (recipe.name, {w: list(deps) for w, deps in recipe.items()}, recipe.start_module, recipe.start_direction,
+            recipe.amount)
+
+
+def dump_problem(recipes, modules, transport_module, template_file, levels=()):
+    """
+    :param recipes: A list of Recipe objects
+    :param modules: A list of module objects, without transport modules
+    :param transport_module: The module that transport modules are copied from
+    :param template_file: A path to a template UPPAAL CORA XML file, or its parts from split_template
+    :param levels: Amounts the recipes are evaluated at, see fidelity.fidelity_levels
+    :return: The bundle as bytes
+    """
+    body = marshal.dumps(([recipe_record(r) for r in recipes],
+                           [module_record(m) for m in modules],
+                           module_record(transport_module),
+                           list(template_parts(template_file)),
+                           list(levels)), MARSHAL_VERSION)
+    return BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(body)) + body
+
+
+def write_problem(path, recipes, modules, transport_module, template_file, levels=()):
+    """ Writes the bundle of a problem to path, see dump_problem.
+    :return: The handle of the bundle
+    """
+    data = dump_problem(recipes, modules, transport_module, template_file, levels)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return problem_handle(data)
+
+
+def problem_handle(data):
+    """
+    :param data: A bundle
+    :return: A short string naming the bundle, the same for the same problem
+    """
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def load_problem(data):
+    """
+    :param data: A bundle, as any bytes-like object
+    :return: A tuple (recipes, modules, transport_module, template, levels), template being the parts of the template
+    as returned by split_template
+    """
+    with memoryview(data) as view:
+        if len(view) < BUNDLE_HEADER.size:
+            raise ValueError('Not a problem bundle')
+        magic, version, length = BUNDLE_HEADER.unpack_from(view)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError('Not a problem bundle')
+        if version != BUNDLE_VERSION:
+            raise ValueError('Problem bundle of version ' + str(version) + ', expected ' + str(BUNDLE_VERSION))
+        if len(view) < BUNDLE_HEADER.size + length:
+            raise ValueError('Problem bundle is truncated')
+
+        recipes, modules, transport_module, template, levels = \
+            marshal.loads(view[BUNDLE_HEADER.size:BUNDLE_HEADER.size + length])
+    return ([Recipe(*r) for r in recipes],
+            [SquareModule.restore(*m) for m in modules],
+            SquareModule.restore(*transport_module),
+            tuple(template),
+            levels)
+
+
+def open_problem(path):
+    """ Loads the bundle in the file at path by memory-mapping it, see load_problem.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return load_problem(mapped)
@@ -0,0 +1,237 @@
+import heapq
+from collections import deque
+from UPPAAL.uppaalAPI import trace_profile, IdentityMap
+from UPPAAL.schedule import Schedule, ARRIVE, START, WORK
+
+
+class SimulationError(RuntimeError):
+    """ The simulation could not finish every recipe, e.g. as no module can do a work it needs or the queues deadlocked.
+    A RuntimeError, like a property verifyta could not satisfy.
+    """
+
+
+class Product:
+    """ One unit of a recipe, moving through the configuration.
+    """
+    def __init__(self, recipe, module, entry, unit):
+        self.recipe = recipe
+        self.unit = unit  # Numbers the products, like the recipes of a trace
+        self.module = module
+        self.entry = entry
+        self.parents = {w: len(deps) for w, deps in recipe.items()}
+        self.children = {w: [c for c, deps in recipe.items() if w in deps] for w in recipe.keys()}
+        self.holds_slot = False  # Whether it takes up a place in the queue of its module
+        self.arrived = 0  # When it arrived at its module, None once a worker took it there
+        self.visited = []  # The modules that worked on it, in order
+
+    def ready(self):
+        return sorted(w for w, n in self.parents.items() if n == 0)
+
+    def finish(self, work):
+        del self.parents[work]
+        for c in self.children[work]:
+            self.parents[c] -= 1
+
+
+def simulate(recipes, modules):
+    """ Simulates producing the recipes on a configuration, directly on the wiring of the module objects. Each module
+    has a queue of queue_length places, a worker doing one work at a time and a transporter moving one product at a
+    time, taking t_time[entry][exit] to move it on to the next module. Products are released in the order of the
+    recipes, and the dispatch rule is greedy: a product does the ready work with the shortest p_time at its module, and
+    otherwise moves towards the module it can reach the fastest that can do one of its ready works. Products passing
+    through a module with allow_passthrough that has no work for them do not take up a place in its queue.
+    Unlike verifyta the schedule is not optimal, but it is found in milliseconds.
+    :param recipes: A list of Recipe objects
+    :param modules: A list of the modules in a configuration, as given by modules_in_config
+    :return: The time along with the worked on, transported through and active works dicts and the profile of the
+    schedule, like get_best_time
+    """
+    in_config = {m.m_id for m in modules}
+    worked_on = {}
+    transported_through = {}
+    active_works = {}
+    works = {}
+    queue_time = {}
+    recipe_wait = {}
+    last = None  # The product done last
+    timetable = Schedule()
+    units = []  # Recipe name of each product
+
+    events = []  # (time, counter, action, product)
+    counter = 0
+    occupied = {m.m_id: 0 for m in modules}
+    entering = {m.m_id: deque() for m in modules}  # Called in turn as places in the queue of a module free up
+    worker_free = {m.m_id: True for m in modules}
+    worker_queue = {m.m_id: deque() for m in modules}
+    transporter_free = {m.m_id: True for m in modules}
+    transporter_queue = {m.m_id: deque() for m in modules}  # (product, direction, next module)
+    blocked = set()  # Modules whose transporter waits for room in the next module
+    unfinished = 0
+    now = 0
+
+    def schedule(delay, action, product):
+        nonlocal counter
+        counter += 1
+        heapq.heappush(events, (now + delay, counter, action, product))
+
+    def workable(product, module):
+        return [w for w in product.ready() if w in module.w_type]
+
+    def needs_slot(product, module):
+        return not (module.allow_passthrough and not workable(product, module))
+
+    def has_slot(module):
+        return occupied[module.m_id] < module.queue_length
+
+    def enter(product, module, entry):
+        """ Moves product into module, taking up a place in its queue if it needs one.
+        """
+        product.module = module
+        product.entry = entry
+        product.holds_slot = needs_slot(product, module)
+        if product.holds_slot:
+            occupied[module.m_id] += 1
+        next_step(product)
+
+    def leave(module):
+        """ Frees a place in the queue of module, and lets whatever waits for it in.
+        """
+        occupied[module.m_id] -= 1
+        waiting = entering[module.m_id]
+        while waiting and has_slot(module):
+            waiting.popleft()()
+
+    def next_step(product):
+        nonlocal unfinished, last
+        module = product.module
+        ready = product.ready()
+        if not ready:
+            unfinished -= 1
+            last = product
+            if product.holds_slot:
+                leave(module)
+            return
+
+        works = workable(product, module)
+        if works:
+            work = min(works, key=lambda w: module.p_time[w])
+            worker_queue[module.m_id].append((product, work))
+            start_work(module)
+            return
+
+        step = route(module, product.entry, set(ready))
+        if step is None:
+            raise SimulationError('No module can do ' + ', '.join(ready) + ' for ' + product.recipe.name)
+        direction, target = step
+        transporter_queue[module.m_id].append((product, direction, target))
+        start_transport(module)
+
+    def start_work(module):
+        if not worker_free[module.m_id] or not worker_queue[module.m_id]:
+            return
+        product, work = worker_queue[module.m_id].popleft()
+        worker_free[module.m_id] = False
+        worked_on.setdefault(module.m_id, set()).add(product.recipe.name)
+        active_works.setdefault(module.m_id, set()).add(work)
+        module_works = works.setdefault(module.m_id, {})
+        module_works[work] = module_works.get(work, 0) + 1
+        timetable.add(now, START, product.unit, module.m_id)
+        if product.arrived is not None:
+            wait = now - product.arrived
+            queue_time[module.m_id] = queue_time.get(module.m_id, 0) + wait
+            recipe_wait[product.recipe.name] = recipe_wait.get(product.recipe.name, 0) + wait
+            product.arrived = None
+        if module.m_id not in product.visited:
+            product.visited.append(module.m_id)
+        timetable.add(now, WORK, product.unit, module.m_id, work)
+        schedule(module.p_time[work], ('worked', work), product)
+
+    def start_transport(module):
+        if not transporter_free[module.m_id] or not transporter_queue[module.m_id]:
+            return
+        product, direction, target = transporter_queue[module.m_id][0]
+        if needs_slot(product, target) and not has_slot(target):
+            # Blocked until the next module has room, which starts the transporter again
+            if module.m_id not in blocked:
+                blocked.add(module.m_id)
+                entering[target.m_id].append(lambda: unblock(module))
+            return
+        transporter_queue[module.m_id].popleft()
+        transporter_free[module.m_id] = False
+        if needs_slot(product, target):
+            occupied[target.m_id] += 1  # Reserved now, so nothing else takes it while moving
+        transported_through.setdefault(module.m_id, set()).add(product.recipe.name)
+        schedule(module.t_time[product.entry][direction], ('moved', direction, target), product)
+
+    def unblock(module):
+        blocked.discard(module.m_id)
+        start_transport(module)
+
+    def route(module, entry, works):
+        """ Dijkstra over (module, entry direction) by travel time.
+        :return: (direction, next module) of the first step towards the nearest module that can do one of works, None
+        if none can be reached
+        """
+        distances = {(module.m_id, entry): 0}
+        queue = [(0, 0, module, entry, None)]
+        tie = 0
+        while queue:
+            distance, _, m, e, first = heapq.heappop(queue)
+            if distance > distances[(m.m_id, e)]:
+                continue
+            if first is not None and works & m.w_type:
+                return first
+            for d, n in enumerate(m.connections):
+                if n is None or n.m_id not in in_config:
+                    continue
+                key = (n.m_id, (d + 2) % 4)
+                total = distance + m.t_time[e][d]
+                if total < distances.get(key, float('inf')):
+                    distances[key] = total
+                    tie += 1
+                    heapq.heappush(queue, (total, tie, n, key[1], first if first is not None else (d, n)))
+        return None
+
+    by_id = {m.m_id: m for m in modules}
+    for recipe in recipes:
+        if recipe.start_module not in by_id:
+            raise SimulationError('The start module of ' + recipe.name + ' is not in the configuration')
+        start = by_id[recipe.start_module]
+        for _ in range(recipe.amount):
+            product = Product(recipe, start, recipe.start_direction, len(units))
+            units.append(recipe.name)
+            unfinished += 1
+            if has_slot(start) and not entering[start.m_id]:
+                enter(product, start, product.entry)
+            else:
+                entering[start.m_id].append(lambda p=product, s=start: enter(p, s, p.entry))
+
+    while events:
+        now, _, action, product = heapq.heappop(events)
+        module = product.module
+        if action[0] == 'worked':
+            product.finish(action[1])
+            worker_free[module.m_id] = True
+            next_step(product)
+            start_work(module)
+        else:
+            _, direction, target = action
+            transporter_free[module.m_id] = True
+            held = product.holds_slot
+            product.module = target
+            product.entry = (direction + 2) % 4
+            product.arrived = now
+            timetable.add(now, ARRIVE, product.unit, target.m_id)
+            product.holds_slot = needs_slot(product, target)
+            if held:
+                leave(module)
+            next_step(product)
+            start_transport(module)
+
+    if unfinished:
+        raise SimulationError('The simulation deadlocked with ' + str(unfinished) + ' products unfinished')
+    critical = last.visited if last is not None else []
+    timetable.makespan = now
+    timetable = timetable.relabel(IdentityMap(), units, IdentityMap())
+    return now, worked_on, transported_through, active_works, trace_profile(works, queue_time, recipe_wait, critical,
+                                                                             timetable)
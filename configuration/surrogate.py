@@ -0,0 +1,256 @@
+import math
+from collections import deque
+from configuration.config_string_handler import parse_configuration
+
+FEATURES = ['modules', 'transporters', 'main_line_length', 'lines', 'mean_line_length', 'shadowed',
+            'path_length_sum', 'path_length_max', 'load_max', 'load_total']
+
+
+def configuration_features(config, csh):
+    """ Describes a configuration by numbers that should say something about its time, read from the configuration
+    string alone, so neighbours can be described before they are evaluated.
+    :param config: A string representing a configuration
+    :param csh: config_string_handler object, for the recipes and the processing times of the modules
+    :return: A list of floats, named by FEATURES
+    """
+    recipes, modules, main_line = parse_configuration(config)
+    connections = {m_id: [c if c != '_' else None for c in conns] for m_id, (_, conns, _) in modules.items()}
+    active = {m_id: [w for w in works.split(',') if w] for m_id, (works, _, _) in modules.items()}
+    shadowed = sum(1 for _, _, booleans in modules.values() if booleans[:1] == '1')
+    transporters = sum(1 for m_id in modules if m_id.startswith('transporter'))
+
+    # Lines run rightwards, so a line starts at each module no module has to its right
+    right_of = {conns[1] for conns in connections.values()}
+    lines = sum(1 for m_id in modules if m_id not in right_of)
+
+    # Each work is split evenly between the modules doing it
+    demand = {}
+    for r in csh.recipes:
+        for w in r.keys():
+            demand[w] = demand.get(w, 0) + r.amount
+    doers = {}
+    for m_id, works in active.items():
+        for w in works:
+            doers[w] = doers.get(w, 0) + 1
+    loads = [sum(csh.module_dictionary[m_id].p_time.get(w, 0) * demand.get(w, 0) / doers[w] for w in works)
+             for m_id, works in active.items()]
+
+    path_lengths = []
+    starts = {name: start for name, start, _ in recipes}
+    for r in csh.recipes:
+        distances = hop_distances(starts.get(r.name), connections)
+        needed = [min((distances[m_id] for m_id, works in active.items() if w in works and m_id in distances),
+                      default=len(modules)) for w in r.keys()]
+        path_lengths.append(max(needed, default=0) * r.amount)
+
+    return [float(len(modules)), float(transporters), float(len(main_line)), float(lines),
+            len(modules) / lines if lines else 0.0, float(shadowed), float(sum(path_lengths)),
+            float(max(path_lengths, default=0)), max(loads, default=0.0), sum(loads)]
+
+
+def hop_distances(start, connections):
+    """
+    :param start: The m_id to search from
+    :param connections: A dict from m_id to its outgoing connections, None where there is none
+    :return: A dict from each m_id reachable from start to how many modules away it is
+    """
+    if start not in connections:
+        return {}
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        m_id = queue.popleft()
+        for c in connections[m_id]:
+            if c is not None and c in connections and c not in distances:
+                distances[c] = distances[m_id] + 1
+                queue.append(c)
+    return distances
+
+
+def rank_correlation(xs, ys):
+    """
+    :return: Spearman's rank correlation of two lists of numbers, with ties given their average rank. None if either
+    list has no two different numbers, as it is then undefined.
+    """
+    def ranks(values):
+        order = sorted(range(len(values)), key=lambda i: values[i])
+        result = [0.0] * len(values)
+        start = 0
+        while start < len(order):
+            end = start
+            while end + 1 < len(order) and values[order[end + 1]] == values[order[start]]:
+                end += 1
+            for k in range(start, end + 1):
+                result[order[k]] = (start + end) / 2
+            start = end + 1
+        return result
+
+    rx, ry = ranks(xs), ranks(ys)
+    n = len(xs)
+    mx, my = sum(rx) / n, sum(ry) / n
+    covariance = sum((a - mx) * (b - my) for a, b in zip(rx, ry))
+    spread = (sum((a - mx) ** 2 for a in rx) * sum((b - my) ** 2 for b in ry)) ** 0.5
+    return covariance / spread if spread else None
+
+
+def solve(matrix, vector):
+    """ Solves a small linear system by Gaussian elimination with partial pivoting.
+    :return: The solution as a list, with 0 for any variable the system does not determine
+    """
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda i: abs(rows[i][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            continue
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for i in range(col + 1, n):
+            factor = rows[i][col] / rows[col][col]
+            if factor:
+                for j in range(col, n + 1):
+                    rows[i][j] -= factor * rows[col][j]
+
+    solution = [0.0] * n
+    for i in reversed(range(n)):
+        if abs(rows[i][i]) < 1e-12:
+            continue
+        solution[i] = (rows[i][n] - sum(rows[i][j] * solution[j] for j in range(i + 1, n))) / rows[i][i]
+    return solution
+
+
+class Surrogate:
+    """ A ridge regression from configuration_features to fitness, trained on every result of the search as it comes
+    in. Once it has seen min_samples results, tabu_search_iter only evaluates the fraction of each neighbourhood it
+    predicts to be best. Only sums of the features are kept, so learning a result takes constant time, and the model
+    is refitted when a prediction is needed. Predictions are compared with the fitness the configurations turn out to
+    have, which gives the rank correlation in statistics.
+    """
+    def __init__(self, fraction=0.3, min_samples=20, ridge=1.0, min_kept=1, window=20):
+        """
+        :param fraction: The share of each neighbourhood that is evaluated
+        :param min_samples: How many results are learned before neighbourhoods are cut
+        :param ridge: Strength of the ridge penalty, on standardized features
+        :param min_kept: At least this many neighbours of each window are evaluated
+        :param window: Neighbours are ranked this many at a time as they are generated, so the search can stop
+        generating once it has accepted a neighbour. None ranks each neighbourhood as a whole.
+        """
+        self.fraction = fraction
+        self.min_samples = min_samples
+        self.ridge = ridge
+        self.min_kept = min_kept
+        self.window = window
+
+        k = len(FEATURES)
+        self.n = 0
+        self.sum_x = [0.0] * k
+        self.sum_xx = [[0.0] * k for _ in range(k)]
+        self.sum_y = 0.0
+        self.sum_xy = [0.0] * k
+        self.model = None  # (coefficients, intercept), None when it must be refitted
+
+        self.pending = {}  # config -> (features, prediction) of ranked neighbours not yet evaluated
+        self.predicted = []
+        self.actual = []
+        self.ranked = 0
+        self.pruned = 0
+
+    def ready(self):
+        return self.n >= self.min_samples
+
+    def learn(self, config, fitness, csh):
+        """ Adds the result of a configuration to the model.
+        :param config: A string representing a configuration
+        :param fitness: Its fitness
+        :param csh: config_string_handler object
+        """
+        if math.isinf(fitness):
+            return
+        if config in self.pending:
+            features, prediction = self.pending.pop(config)
+            self.predicted.append(prediction)
+            self.actual.append(fitness)
+        else:
+            features = configuration_features(config, csh)
+
+        self.n += 1
+        self.sum_y += fitness
+        for i, x in enumerate(features):
+            self.sum_x[i] += x
+            self.sum_xy[i] += x * fitness
+            row = self.sum_xx[i]
+            for j, x2 in enumerate(features):
+                row[j] += x * x2
+        self.model = None
+
+    def fit(self):
+        """ Solves the ridge regression on standardized features, from the sums.
+        :return: (coefficients, intercept) on the original features
+        """
+        k = len(FEATURES)
+        n = self.n
+        mean_x = [s / n for s in self.sum_x]
+        mean_y = self.sum_y / n
+        covariance = [[self.sum_xx[i][j] - n * mean_x[i] * mean_x[j] for j in range(k)] for i in range(k)]
+        scale = [math.sqrt(covariance[i][i] / n) if covariance[i][i] > 1e-9 else 0.0 for i in range(k)]
+        used = [i for i in range(k) if scale[i]]  # Features that have not varied say nothing
+
+        matrix = [[covariance[i][j] / (scale[i] * scale[j]) + (self.ridge if i == j else 0.0) for j in used]
+                  for i in used]
+        vector = [(self.sum_xy[i] - n * mean_x[i] * mean_y) / scale[i] for i in used]
+        coefficients = [0.0] * k
+        for i, c in zip(used, solve(matrix, vector)):
+            coefficients[i] = c / scale[i]
+        intercept = mean_y - sum(c * m for c, m in zip(coefficients, mean_x))
+        return coefficients, intercept
+
+    def predict(self, features):
+        if self.model is None:
+            self.model = self.fit()
+        coefficients, intercept = self.model
+        return intercept + sum(c * x for c, x in zip(coefficients, features))
+
+    def forget_pending(self):
+        """ Drops the predictions of neighbours that were ranked but not evaluated, as they will not be by now. Called
+        when a new neighbourhood is ranked.
+        """
+        self.pending = {}
+
+    def rank(self, configs, csh):
+        """
+        :param configs: Configuration strings, e.g. a window of a neighbourhood
+        :param csh: config_string_handler object
+        :return: The fraction of configs with the best predicted fitness, best first
+        """
+        predictions = []
+        for config in configs:
+            features = configuration_features(config, csh)
+            prediction = self.predict(features)
+            self.pending[config] = (features, prediction)
+            predictions.append((prediction, config))
+        predictions.sort(key=lambda p: p[0])
+
+        kept = max(self.min_kept, int(math.ceil(self.fraction * len(predictions))))
+        self.ranked += len(predictions)
+        self.pruned += max(0, len(predictions) - kept)
+        for _, config in predictions[kept:]:
+            del self.pending[config]
+        return [config for _, config in predictions[:kept]]
+
+    def statistics(self):
+        """
+        :return: A dict with the number of results learned, neighbours ranked and pruned, and the rank correlation of
+        the predictions with the fitness found, None until it is defined
+        """
+        return {'samples': self.n,
+                'ranked': self.ranked,
+                'pruned': self.pruned,
+                'checked': len(self.actual),
+                'rank_correlation': rank_correlation(self.predicted, self.actual) if len(self.actual) > 1 else None}
+
+    def report(self):
+        stats = self.statistics()
+        correlation = stats['rank_correlation']
+        return ('Surrogate: ' + str(stats['samples']) + ' results learned, ' + str(stats['pruned']) + ' of ' +
+                str(stats['ranked']) + ' neighbours pruned, rank correlation ' +
+                ('-' if correlation is None else '%.3f' % correlation) + ' over ' + str(stats['checked']) +
+                ' predictions')
@@ -0,0 +1,112 @@
+from collections import deque
+from configuration.config_string_handler import parse_configuration
+
+
+def move_attributes(old_config, new_config, ignore=()):
+    """ Describes a move between two configurations by what happened to the modules, instead of by the configurations
+    themselves. Attributes are:
+    ('role', m_id, old_role, new_role) for modules changing between 'main', 'branch' and 'free'
+    ('swap', m_id0, m_id1) for two modules trading places on the main line
+    ('position', m_id, index) for modules moved to a new index on the main line, if more than two were moved
+    ('config', new_config) if none of the above apply
+    The attributes of the reverse move are move_attributes(new_config, old_config).
+    :param old_config: The configuration string moved from
+    :param new_config: The configuration string moved to
+    :param ignore: m_ids that are not considered, e.g. transport modules
+    :return: A set of attributes
+    """
+    def roles(config):
+        _, modules, main_line = parse_configuration(config)
+        result = {m_id: 'branch' for m_id in modules if m_id not in ignore}
+        for m_id in main_line:
+            if m_id not in ignore:
+                result[m_id] = 'main'
+        return result, [m_id for m_id in main_line if m_id not in ignore]
+
+    old_roles, old_main = roles(old_config)
+    new_roles, new_main = roles(new_config)
+
+    attributes = set()
+    for m_id in old_roles.keys() | new_roles.keys():
+        old_role = old_roles.get(m_id, 'free')
+        new_role = new_roles.get(m_id, 'free')
+        if old_role != new_role:
+            attributes.add(('role', m_id, old_role, new_role))
+
+    # Modules that only changed order on the main line
+    if old_main != new_main and sorted(old_main) == sorted(new_main):
+        moved = [(i, m_id) for i, m_id in enumerate(new_main) if old_main[i] != m_id]
+        if len(moved) == 2:
+            attributes.add(('swap',) + tuple(sorted(m_id for _, m_id in moved)))
+        else:
+            attributes.update(('position', m_id, i) for i, m_id in moved)
+
+    if not attributes:
+        attributes.add(('config', new_config))
+
+    return attributes
+
+
+class TabuMemory:
+    """ Short term memory of the tabu search. Instead of whole configurations it remembers move attributes, which are
+    tabu for a number of iterations, the tenure. The tenure adapts: it grows when the search revisits fitnesses it has
+    just seen, i.e. when it is cycling, and shrinks whenever a new best is found.
+    """
+    def __init__(self, tenure=10, min_tenure=2, max_tenure=50):
+        """
+        :param tenure: The initial number of iterations an attribute stays tabu
+        :param min_tenure: Lower bound of the adaptive tenure
+        :param max_tenure: Upper bound of the adaptive tenure
+        """
+        self.tenure = tenure
+        self.min_tenure = min_tenure
+        self.max_tenure = max_tenure
+
+        self.expiry = {}        # attribute -> iteration at which it is no longer tabu
+        self.queue = deque()    # (iteration, attribute) in the order attributes were made tabu
+        self.recent = deque()   # Fitnesses of the latest frontiers, used to detect cycling
+
+    def is_tabu(self, attributes, iteration):
+        """
+        :param attributes: The attributes of a move
+        :param iteration: The current iteration
+        :return: True if any of the attributes is tabu
+        """
+        return any(self.expiry.get(a, iteration) > iteration for a in attributes)
+
+    def make_move(self, old_config, new_config, fitness, best_fitness, iteration, ignore=()):
+        """ Makes the reverse of a move tabu and adapts the tenure.
+        :param old_config: The configuration string moved from
+        :param new_config: The configuration string moved to
+        :param fitness: Fitness of new_config
+        :param best_fitness: The best fitness found before this move
+        :param iteration: The current iteration
+        :param ignore: m_ids that are not considered, e.g. transport modules
+        """
+        self.expire(iteration)
+
+        if fitness < best_fitness:
+            self.tenure = max(self.min_tenure, self.tenure - 1)
+        elif fitness in self.recent:
+            self.tenure = min(self.max_tenure, self.tenure + 1)
+
+        self.recent.append(fitness)
+        while len(self.recent) > self.tenure:
+            self.recent.popleft()
+
+        until = iteration + self.tenure
+        for a in move_attributes(new_config, old_config, ignore):
+            self.expiry[a] = until
+            self.queue.append((until, a))
+
+    def expire(self, iteration):
+        """ Forgets attributes that are no longer tabu.
+        :param iteration: The current iteration
+        """
+        while self.queue and self.queue[0][0] <= iteration:
+            until, a = self.queue.popleft()
+            if self.expiry.get(a) == until:
+                del self.expiry[a]
+
+    def __len__(self):
+        return len(self.expiry)
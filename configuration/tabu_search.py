@@ -1,16 +1,26 @@
+import itertools
 import re
+import time
 from queue import Queue
 import random
 import bisect
-from random import choice
 from module import SquareModule
-from UPPAAL.uppaalAPI import get_best_time
-from configuration.config_string_handler import ConfigStringHandler
+from UPPAAL.uppaalAPI import get_best_time, XML_FILE, Q_FILE
+from UPPAAL.fidelity import get_extrapolated_time, fidelity_levels
+from UPPAAL.scheduler import VerifytaLimitExceeded
+from configuration.checkpoint import CheckpointWriter, load_checkpoint, CHECKPOINT_VERSION
+from configuration.config_string_handler import ConfigStringHandler, layout_conflicts
+from configuration.elite_archive import EliteArchive
+from configuration.evaluators import PrunedError
+from configuration.pipeline import EvaluationPipeline
+from configuration.simulator import simulate
+from configuration.tabu_memory import TabuMemory, move_attributes
 from configuration.initial_config import initial_configuration_generator
+from configuration.instrumentation import NULL_INSTRUMENTATION
 from configuration.path_placers import connect_module_list, push_around, push_underneath
-from configuration.neighbour_functions.anti_serialize import neighbours_anti_serialized
-from configuration.neighbour_functions.parallelize import neighbours_parallelize
-from configuration.neighbour_functions.swap import neighbours_swap
+from configuration.neighbour_functions.anti_serialize import iter_neighbours_anti_serialized
+from configuration.neighbour_functions.parallelize import iter_neighbours_parallelize
+from configuration.neighbour_functions.swap import iter_neighbours_swap
 
 
 VERIFYTA = '../UPPAAL/verifyta'
@@ -21,16 +31,136 @@ WEIGHT_STRENGTH = 1
 WEIGHT_X = 3
 WEIGHT_Y = 1
 
+# Ways of evaluating a configuration, see the backend argument of tabu_search_iter
+BACKENDS = ('verifyta', 'simulator')
 
+# Fitness of configurations that verifyta could not evaluate within the limits of a VerifytaScheduler
+PENALTY_FITNESS = float('inf')
 
-def tabu_search(recipes, modules, transport_module, iters=50, short_term_size=10, max_initial_configs=10):
-    """ Tabu Search
+
+
+def tabu_search(recipes, modules, transport_module, iters=50, short_term_size=10, max_initial_configs=10,
+                acceptance='best', candidate_list_size=None, workers=1, speculation=2, operator_selector=None,
+                checkpoint_file=None, checkpoint_every=1, resume_from=None,
+                time_limit=None, stagnation=None, target=None, callback=None, archive=None,
+                initial_configs=None, shared_cache=None, migration=None, migration_every=5,
+                instrumentation=None, rng=None, runner=None, model_cache=None, fidelity=None, backend='verifyta',
+                surrogate=None, evaluator=None, xml_file=XML_FILE, q_file=Q_FILE, guided=False,
+                schedules=None):
+    """ Tabu Search. Runs tabu_search_iter until one of its stopping criteria is met.
+    :param recipes: A list of Recipe objects
+    :param modules: A list of module objects
+    :param transport_module: The module that transport modules are copied from
+    See tabu_search_iter for the other arguments.
+    :return: Every configuration found with the best fitness, as a set of (config, fitness) tuples
+    """
+    if archive is None:
+        archive = EliteArchive()
+    for _ in tabu_search_iter(recipes, modules, transport_module, iters=iters, short_term_size=short_term_size,
+                              max_initial_configs=max_initial_configs, acceptance=acceptance,
+                              candidate_list_size=candidate_list_size, workers=workers, speculation=speculation,
+                              operator_selector=operator_selector, checkpoint_file=checkpoint_file,
+                              checkpoint_every=checkpoint_every, resume_from=resume_from, time_limit=time_limit,
+                              stagnation=stagnation, target=target, callback=callback, archive=archive,
+                              initial_configs=initial_configs, shared_cache=shared_cache, migration=migration,
+                              migration_every=migration_every, instrumentation=instrumentation, rng=rng, runner=runner,
+                              model_cache=model_cache, fidelity=fidelity, backend=backend, surrogate=surrogate,
+                              evaluator=evaluator, xml_file=xml_file, q_file=q_file, guided=guided,
+                              schedules=schedules):
+        pass
+
+    print("Total of " + str(archive.counter) + " configurations evaluated")
+    if instrumentation is not None:
+        print(instrumentation.report())
+    if surrogate is not None:
+        print(surrogate.report())
+    if evaluator is not None:
+        print(evaluator.report())
+    return archive.ties()
+
+
+def tabu_search_iter(recipes, modules, transport_module, iters=50, short_term_size=10, max_initial_configs=10,
+                     acceptance='best', candidate_list_size=None, workers=1, speculation=2, operator_selector=None,
+                     checkpoint_file=None, checkpoint_every=1, resume_from=None,
+                     time_limit=None, stagnation=None, target=None, callback=None, archive=None,
+                     initial_configs=None, shared_cache=None, migration=None, migration_every=5,
+                     instrumentation=None, rng=None, runner=None, model_cache=None, fidelity=None, backend='verifyta',
+                     surrogate=None, evaluator=None, xml_file=XML_FILE, q_file=Q_FILE, guided=False,
+                     schedules=None):
+    """ Anytime Tabu Search. A generator that yields each new best configuration as soon as the iteration that found it
+    is done, so the search can be stopped at any point with the best configuration so far in hand.
     :param recipes: A list of Recipe objects
     :param modules: A list of module objects
     :param init_func: A function that creates the initial configuration
-    :param iters: How many iterations of Tabu search
-    :return: The best configuration found by the search
+    :param iters: How many iterations of Tabu search, None for no limit
+    :param short_term_size: The initial tenure of the tabu memory, i.e. for how many iterations a move stays tabu
+    :param acceptance: 'best' evaluates the whole neighbourhood and moves to the best neighbour. 'first' moves to the
+    first neighbour that improves on the frontier, and only falls back to the best one if none do.
+    :param candidate_list_size: If given, at most this many neighbours are evaluated in each iteration
+    :param workers: How many configurations are evaluated at once. With more than one, the neighbourhoods of the most
+    promising results are generated while verifyta runs, and idle workers start evaluating them.
+    :param speculation: How many neighbourhoods may be generated ahead of time in each iteration
+    :param operator_selector: An OperatorSelector that picks the neighbour function of each iteration, based on how
+    much each has improved the search per second. If None, the fixed weight schedule is used.
+    :param checkpoint_file: If given, the state of the search is written to this file every checkpoint_every
+    iterations. The file is written in the background, and can be given as resume_from to continue the search.
+    :param checkpoint_every: How many iterations there are between checkpoints
+    :param resume_from: A checkpoint file to continue from, instead of starting with initial configurations. The other
+    arguments should be the same as for the run that wrote it.
+    :param time_limit: Seconds after which the search stops, also in the middle of an iteration
+    :param stagnation: The search stops after this many iterations without a new best
+    :param target: The search stops once a fitness of at most this is found
+    :param callback: Called with (config, fitness) the moment a new best is evaluated
+    :param archive: An EliteArchive that is kept updated with the best configurations found
+    :param initial_configs: Configuration strings to start from, instead of those of initial_configuration_generator
+    :param shared_cache: A FitnessStore that is looked in before evaluating, and that all evaluations are added to
+    :param migration: Called every migration_every iterations with a list of (config, fitness) tuples of our elites.
+    Returns a list of (config, result) tuples of elites from elsewhere, where result is as returned by get_best_time.
+    These become backtracking points, and the best of them becomes the frontier if it beats everything we have found.
+    :param migration_every: How many iterations there are between migrations
+    :param instrumentation: An Instrumentation that times the phases of the search, per neighbour function, and counts
+    cache hits and verifyta runs. It ends each iteration with instrumentation.end_iteration.
+    :param rng: A random.Random, or a seed for one, that makes every random choice of the search. With the same seed and
+    arguments, and one worker, two runs take the same path. If None, a new one is seeded from the operating system.
+    :param runner: If given, runs verifyta in place of the fixed options of run_model, e.g. a Portfolio that races
+    several option sets or a VerifytaScheduler that limits time and memory. Configurations stopped by the limits of a
+    scheduler get PENALTY_FITNESS, so they are never evaluated again nor moved to.
+    :param model_cache: A ModelCache that verifyta results are looked up in by the content of the model, which catches
+    different configurations that give the same model
+    :param fidelity: Amounts, e.g. fidelity.FIDELITY_AMOUNTS, that configurations are evaluated at instead of the full
+    amounts of the recipes. Their time is extrapolated from how it grows with the amount. Configurations whose
+    extrapolated time would be a new best are verified at the full amounts, so the best found is an exact time unless
+    the limits of the runner prevent verifying it.
+    :param backend: 'verifyta' evaluates configurations with verifyta. 'simulator' evaluates them in milliseconds with
+    simulator.simulate, whose greedy schedules are not optimal, and only runs verifyta on configurations whose
+    simulated time would be a new best. Workers are not used by the simulator.
+    :param surrogate: A Surrogate that learns every result of the search. Once it has learned enough, only the share
+    of each window of a neighbourhood that the surrogate predicts to be best is evaluated, see Surrogate.window.
+    :param evaluator: An Evaluator, e.g. a stack of layers from configuration.evaluators, that configurations are
+    evaluated with instead. workers, runner, model_cache, fidelity and backend are then not used, as they are arguments
+    of the evaluators. If its batch_size is above one, neighbours are evaluated in batches with evaluate_many. The
+    evaluator is attached to the search, but not closed by it. Configurations it prunes are never evaluated again.
+    :param xml_file: Path the model is written to when evaluating without workers
+    :param q_file: Path the query is written to when evaluating without workers
+    :param guided: If True, the neighbour functions are given the profile of the schedule of the frontier, see
+    configuration.bottlenecks, so parallelize only splits around saturated modules and swap only replaces slow modules
+    on the critical path. Frontiers without a profile, e.g. those found in a shared cache, get every neighbour.
+    :param schedules: A dict, or e.g. a shelve.Shelf to keep them on disk, that the Schedule of each configuration in
+    the archive is put in, keyed by the configuration. Those of configurations that drop out of the archive are removed
+    again, so the schedules of the elites can be analysed after the search without running verifyta again.
+    :return: A generator of (config, fitness) tuples, one for each new best configuration
     """
+    if acceptance not in ('best', 'first'):
+        raise ValueError("acceptance must be 'best' or 'first'")
+    if instrumentation is None:
+        instrumentation = NULL_INSTRUMENTATION
+    if not isinstance(rng, random.Random):
+        rng = random.Random(rng)
+    if backend not in BACKENDS:
+        raise ValueError("backend must be one of " + ', '.join(BACKENDS))
+    levels = fidelity_levels(recipes, fidelity) if fidelity and evaluator is None else []
+    # Whether new bests must be verified at full fidelity
+    screening = evaluator is None and (bool(levels) or backend == 'simulator')
 
     def evaluate_config(config):
         """ Evaluates a configuration
@@ -38,22 +168,141 @@ def tabu_search(recipes, modules, transport_module, iters=50, short_term_size=10
         :return: An integer representing the evaluation of the config.
         """
 
-        if config in config_fitness:
+        if is_cached(config):
             return config_fitness[config]
         else:
             print('Evaluating: ' + config)
-            csh.make_configuration(config)  # SIDE EFFECT: Makes loads of changes to modules
-            modules_in_config = csh.modules_in_config(config)
-            fitness, worked, transported, active = get_best_time(recipes, modules_in_config, XML_TEMPLATE, VERIFYTA)
-
-            config_fitness[config] = fitness
-            config_worked[config] = worked
-            config_active[config] = active
-            return fitness
+            try:
+                with instrumentation.phase('evaluate'):
+                    if evaluator is not None:
+                        result = evaluator.evaluate(config)
+                    else:
+                        result = evaluate_builtin(config)
+            except (VerifytaLimitExceeded, PrunedError) as e:
+                return penalise(config, e)
+            result = verify_elite(config, result)
+            share_result(config, result)
+            return store_result(config, result)
+
+    def evaluate_builtin(config):
+        """ Evaluates config as given by the arguments of the search, when there is no evaluator.
+        """
+        csh.make_configuration(config)  # SIDE EFFECT: Makes loads of changes to modules
+        modules_in_config = csh.modules_in_config(config)
+        if backend == 'simulator':
+            return simulate(recipes, modules_in_config)
+        elif levels:
+            return get_extrapolated_time(recipes, modules_in_config, levels, XML_TEMPLATE, VERIFYTA, xml_file, q_file,
+                                         instrumentation, runner, model_cache)
+        return get_best_time(recipes, modules_in_config, XML_TEMPLATE, VERIFYTA, xml_file, q_file, instrumentation,
+                             runner, model_cache)
+
+    def verify_elite(config, result):
+        """ Evaluates config with verifyta at the full amounts if its screened time, i.e. its extrapolated or
+        simulated time, would be a new best.
+        :param result: The result of screening config
+        :return: The result to keep for config
+        """
+        if not screening or result[0] >= best_fitness:
+            return result
+        print('Verifying: ' + config)
+        try:
+            with instrumentation.phase('verify_elite'):
+                csh.make_configuration(config)  # SIDE EFFECT: Makes loads of changes to modules
+                modules_in_config = csh.modules_in_config(config)
+                exact = get_best_time(recipes, modules_in_config, XML_TEMPLATE, VERIFYTA, xml_file, q_file,
+                                      instrumentation, runner, model_cache)
+        except VerifytaLimitExceeded as e:
+            print('Could not verify: ' + config + ' (' + str(e) + ')')
+            instrumentation.count('screening/unverified')
+            return result
+        instrumentation.count('screening/verified')
+        instrumentation.count('screening/absolute_error', abs(exact[0] - result[0]))
+        return exact
+
+    def penalise(config, error):
+        """ Records that config could not be evaluated within the limits of the runner.
+        """
+        print('Penalised: ' + config + ' (' + str(error) + ')')
+        instrumentation.count('penalised/' + type(error).__name__)
+        config_fitness[config] = PENALTY_FITNESS
+        return PENALTY_FITNESS
+
+    def is_cached(config):
+        """ Counts cache hits and misses.
+        :return: True if config has been evaluated, here or by someone sharing our cache
+        """
+        if config in config_fitness:
+            instrumentation.count('cache/hit')
+            return True
+        if lookup_shared(config):
+            instrumentation.count('cache/shared_hit')
+            return True
+        instrumentation.count('cache/miss')
+        return False
+
+    def lookup_shared(config):
+        """ Stores the evaluation of config from shared_cache, if it has one.
+        :return: True if it had
+        """
+        if shared_cache is None:
+            return False
+        with instrumentation.phase('shared_cache'):
+            cached = shared_cache.get(config)
+        if cached:
+            fitness, worked, active = cached
+            store_result(config, (fitness, worked, None, active, None))
+        return bool(cached)
+
+    def share_result(config, result):
+        if shared_cache is not None:
+            fitness, worked, transported, active, profile = result
+            with instrumentation.phase('shared_cache'):
+                shared_cache.put(config, fitness, worked, active)
+
+    def store_result(config, result):
+        nonlocal best_fitness
+        fitness, worked, transported, active, profile = result
+        config_fitness[config] = fitness
+        config_worked[config] = worked
+        config_active[config] = active
+        if guided and profile is not None:
+            config_profile[config] = profile
+        best_fitness = min(best_fitness, fitness)
+        if surrogate is not None:
+            with instrumentation.phase('surrogate'):
+                surrogate.learn(config, fitness, csh)
+
+        if archive.add(config, fitness):
+            incumbents.append((config, fitness))
+            if callback:
+                callback(config, fitness)
+        if schedules is not None and config in archive:
+            keep_schedule(config, profile)
+        return fitness
+
+    def keep_schedule(config, profile):
+        """ Puts the schedule of config, an elite, in schedules, and removes those of configurations no longer elite.
+        """
+        if profile is None or profile.get('schedule') is None:
+            return
+        schedules[config] = profile['schedule']
+        for c in [c for c in schedules if c not in archive]:
+            del schedules[c]
+
+    def out_of_time():
+        return deadline is not None and time.perf_counter() >= deadline
+
+    def finished():
+        if out_of_time():
+            return True
+        if target is not None and best_fitness <= target:
+            return True
+        return stagnation is not None and stagnant >= stagnation
 
     def get_neighbour_func(weighted_funcs):
 
-        result = weighted_choice(weighted_funcs)
+        result = weighted_choice(weighted_funcs, rng)
         funcs, weights = zip(*weighted_funcs)
         new_weights = [w for w in weights]
         x = WEIGHT_X * WEIGHT_STRENGTH
@@ -78,117 +327,475 @@ def tabu_search(recipes, modules, transport_module, iters=50, short_term_size=10
         weighted_funcs[2] = temp[2]
         return result
 
-    def update_short_term(config):
-        first = None
-        if len(short_term_memory) > short_term_size:
-            first = short_term_memory[0]
-            short_term_memory.remove(first)
-        short_term_memory.append(config)
-        return first
+    def choose_neighbour_func():
+        if operator_selector:
+            return operator_selector.choose()
+        return get_neighbour_func(weighted_funcs)
+
+    def is_known(config):
+        """ Neighbours that are already evaluated are never given to us by the neighbour functions, and neither are
+        those whose layout is impossible.
+        """
+        return config in config_fitness or is_invalid(config)
+
+    def is_invalid(config):
+        """ Checks the layout of a new neighbour, see layout_conflicts. Invalid ones get PENALTY_FITNESS without being
+        evaluated, so they are only checked once.
+        """
+        with instrumentation.phase('validate_layout'):
+            conflicts = layout_conflicts(config)
+        if not conflicts:
+            return False
+        print('Invalid layout: ' + config + ' (conflicts in ' + ', '.join(map(str, sorted(conflicts))) + ')')
+        instrumentation.count('layout/invalid')
+        config_fitness[config] = PENALTY_FITNESS
+        return True
+
+    def is_tabu(config):
+        """ Tabu neighbours of the frontier are put aside. They are only evaluated if nothing else is left, and can then
+        only be chosen by aspiration, i.e. by being better than anything found so far.
+        """
+        ignore = {t.m_id for t in csh.transport_modules}
+        if tabu_memory.is_tabu(move_attributes(frontier, config, ignore), i):
+            deferred.append(config)
+            return True
+        return False
+
+    def skip_neighbour(config):
+        return is_known(config) or is_tabu(config)
+
+    def rank_neighbours(neighbours):
+        """ Cuts a neighbourhood down to the neighbours the surrogate predicts to be best, once it has learned enough.
+        Neighbours are ranked a window at a time as they are generated, so the neighbourhood is still only generated
+        as far as the evaluation asks for it.
+        """
+        if surrogate is None or not surrogate.ready():
+            return neighbours
+        surrogate.forget_pending()
+        return ranked_windows(neighbours)
+
+    def ranked_windows(neighbours):
+        neighbours = iter(neighbours)
+        while True:
+            window = list(itertools.islice(neighbours, surrogate.window) if surrogate.window else neighbours)
+            if not window:
+                return
+            with instrumentation.phase('surrogate'):
+                kept = surrogate.rank(window, csh)
+            instrumentation.count('surrogate/pruned', len(window) - len(kept))
+            yield from kept
+
+    def evaluate_neighbours(neighbours, frontier_fitness):
+        """ Evaluates neighbours as they are generated, stopping as soon as the acceptance policy is satisfied.
+        :param neighbours: An iterable of configuration strings
+        :param frontier_fitness: The fitness of the current frontier
+        :return: A list of (config, fitness) tuples for the evaluated neighbours
+        """
+        results = []
+        for n in neighbours:
+            if out_of_time():
+                break
+            try:
+                fitness = evaluate_config(n)
+            except RuntimeError:
+                continue
+            if fitness == PENALTY_FITNESS:
+                continue
+            results.append((n, fitness))
+
+            if acceptance == 'first' and fitness < frontier_fitness:
+                break
+            if candidate_list_size and len(results) >= candidate_list_size:
+                break
+        return results
+
+    def evaluate_neighbours_batched(neighbours, frontier_fitness):
+        """ Like evaluate_neighbours, but gives the evaluator batch_size neighbours at a time.
+        :param neighbours: An iterator of configuration strings
+        :param frontier_fitness: The fitness of the current frontier
+        :return: A list of (config, fitness) tuples for the evaluated neighbours
+        """
+        results = []
+        while not out_of_time():
+            batch = []
+            for n in neighbours:
+                if is_cached(n):
+                    if config_fitness[n] != PENALTY_FITNESS:
+                        results.append((n, config_fitness[n]))
+                else:
+                    print('Evaluating: ' + n)
+                    batch.append(n)
+                    if len(batch) >= evaluator.batch_size:
+                        break
+            if not batch:
+                break
+
+            with instrumentation.phase('evaluate'):
+                outcomes = evaluator.evaluate_many(batch)
+            for n, (result, error) in zip(batch, outcomes):
+                if isinstance(error, (VerifytaLimitExceeded, PrunedError)):
+                    penalise(n, error)
+                if error:
+                    continue
+                share_result(n, result)
+                results.append((n, store_result(n, result)))
+
+            if acceptance == 'first' and any(fitness < frontier_fitness for _, fitness in results):
+                break
+            if candidate_list_size and len(results) >= candidate_list_size:
+                break
+        return results
+
+    def evaluate_neighbours_pipelined(neighbours, frontier_fitness):
+        """ Like evaluate_neighbours, but keeps all workers busy. While waiting on verifyta the neighbourhoods of the
+        best results so far are generated, and once the neighbourhood is exhausted idle workers evaluate those.
+        :param neighbours: An iterator of configuration strings
+        :param frontier_fitness: The fitness of the current frontier
+        :return: A list of (config, fitness) tuples for the evaluated neighbours
+        """
+        results = []
+        submitted = 0
+        stop = False
+        halted = False  # Out of time or an improvement was accepted, so no more work is started, speculative or not
+        failure = None
+
+        while True:
+            if out_of_time():
+                stop = halted = True
+            while not stop and pipeline.has_capacity():
+                try:
+                    n = next(neighbours, None)
+                except (RecursionError, KeyError) as e:
+                    failure = e
+                    n = None
+
+                if n is None:
+                    stop = True
+                elif is_cached(n):  # Evaluated ahead of time or by someone else
+                    if config_fitness[n] != PENALTY_FITNESS:
+                        results.append((n, config_fitness[n]))
+                        if acceptance == 'first' and config_fitness[n] < frontier_fitness:
+                            stop = halted = True
+                else:
+                    pipeline.submit(n)
+                    submitted += 1
+                    if candidate_list_size and submitted >= candidate_list_size:
+                        stop = True
+                if out_of_time():
+                    stop = halted = True
+
+            if stop and not halted:
+                fill_speculative(results)
+            if not pipeline.busy():
+                break
+
+            if not halted:
+                speculate(results)
+
+            for config, speculative, result, error in pipeline.completed():
+                if isinstance(error, VerifytaLimitExceeded):
+                    penalise(config, error)
+                if error:
+                    continue
+                try:
+                    result = verify_elite(config, result)
+                except RuntimeError:
+                    continue
+                share_result(config, result)
+                fitness = store_result(config, result)
+                if not speculative:
+                    results.append((config, fitness))
+                    if acceptance == 'first' and fitness < frontier_fitness:
+                        stop = halted = True
+
+        # Only raised once nothing is running, so no evaluation ends up in the next iteration
+        if failure:
+            raise failure
+        return results
+
+    def speculate(results):
+        """ Generates the neighbourhood of the best result without one, as it is likely to be the next frontier.
+        :param results: A list of (config, fitness) tuples evaluated so far in this iteration
+        """
+        nonlocal planned_func
+        if len(speculation_memory) >= speculation:
+            return
+
+        candidates = [r for r in results if r[0] not in speculation_memory]
+        if not candidates:
+            return
+        config = min(candidates, key=lambda x: x[1])[0]
+
+        # The neighbour function of the next iteration is picked now, so that it is known what to speculate on
+        if not planned_func:
+            planned_func = choose_neighbour_func()
+        try:
+            with instrumentation.phase('speculate/' + planned_func.__name__):
+                neighbours = list(planned_func(config, csh, config_active[config], skip=is_known, rng=rng,
+                                               profile=config_profile.get(config)))
+        except (RecursionError, KeyError):
+            neighbours = []
+        speculation_memory[config] = (neighbours, set())
+
+    def fill_speculative(results):
+        """ Gives idle workers neighbours of the best speculated frontier. Their results end up in config_fitness
+        either way, and are used directly if that frontier is chosen.
+        :param results: A list of (config, fitness) tuples evaluated so far in this iteration
+        """
+        candidates = [r for r in results if r[0] in speculation_memory]
+        if not candidates:
+            return
+        neighbours, evaluated = speculation_memory[min(candidates, key=lambda x: x[1])[0]]
+
+        for n in neighbours:
+            if not pipeline.has_capacity():
+                break
+            if n in evaluated or is_cached(n):
+                continue
+            pipeline.submit(n, speculative=True)
+            evaluated.add(n)
+
+    def search_state(next_iteration):
+        """ Everything needed to continue the search from the next iteration, as it would have without stopping.
+        """
+        return {'version': CHECKPOINT_VERSION,
+                'iteration': next_iteration,
+                'frontier': frontier,
+                'weighted_funcs': weighted_funcs,
+                'config_fitness': config_fitness,
+                'config_worked': config_worked,
+                'config_active': config_active,
+                'config_profile': config_profile,
+                'best_fitness': best_fitness,
+                'archive': archive,
+                'stagnant': stagnant,
+                'long_term_memory': long_term_memory,
+                'initial_memory': initial_memory,
+                'tabu_memory': tabu_memory,
+                'speculation_memory': speculation_memory,
+                'planned_func': planned_func,
+                'operator_selector': operator_selector,
+                'surrogate': surrogate,
+                'transport_state': csh.transport_state(),
+                'random_state': rng.getstate()}
+
+    def migrate():
+        """ Exchanges elites with other searches through the migration function.
+        """
+        nonlocal frontier
+        best_migrant = None
+        for config, result in migration(archive.elites()):
+            if config in config_fitness:
+                continue
+            store_result(config, result)
+            long_term_memory.append((config, weighted_funcs))
+            if best_migrant is None or result[0] < config_fitness[best_migrant]:
+                best_migrant = config
+
+        if best_migrant and config_fitness[best_migrant] <= best_fitness and config_fitness[best_migrant] < \
+                config_fitness[frontier]:
+            print("Migrated to " + best_migrant)
+            frontier = best_migrant
 
     def backtrack():
         if long_term_memory:
-            back = choice(long_term_memory)
+            back = rng.choice(long_term_memory)
             long_term_memory.remove(back)
         else:
-            back = choice(initial_memory)
+            back = rng.choice(initial_memory)
         old_frontier = back[0]
         weighted_funcs = back[1]
         return old_frontier, weighted_funcs
 
-    weighted_funcs = [(neighbours_anti_serialized, WEIGHT_START), (neighbours_parallelize, 0), (neighbours_swap, 0)]
+    weighted_funcs = [(iter_neighbours_anti_serialized, WEIGHT_START), (iter_neighbours_parallelize, 0),
+                      (iter_neighbours_swap, 0)]
     csh = ConfigStringHandler(recipes, modules, transport_module)
-    generator = initial_configuration_generator(recipes, modules, csh)
+    if evaluator is not None:
+        evaluator.attach(csh)
+    instrumentation.wrap_method(csh, 'make_configuration')
+    instrumentation.wrap_method(csh, 'configuration_str')
+    generator = instrumentation.timed_iter(initial_configuration_generator(recipes, modules, csh, rng),
+                                           'initial_configurations')
 
     # Memory used for remembering evalutations, used so we dont have to evaluate the same configuration twice.
     config_fitness = {}
     config_worked = {}
     config_active = {}
+    config_profile = {}  # Only kept when guided
+
+    best_fitness = float('inf')
+    archive = archive if archive is not None else EliteArchive()
+    incumbents = []  # New best configurations not yet yielded
+    stagnant = 0  # Iterations since the last new best
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
 
     # Tabu Search specific memories
     long_term_memory = []
-    short_term_memory = []
-
-    for i, config in enumerate(generator):
-        if i + 1 > max_initial_configs:
-            break
-        evaluate_config(config)  # Updates dynamic memory
-        long_term_memory.append((csh.configuration_str(), weighted_funcs))
+    tabu_memory = TabuMemory(tenure=short_term_size)
+    deferred = []  # Tabu neighbours of the current frontier
+
+    speculation_memory = {}  # Neighbourhoods generated ahead of time: config -> (neighbours, evaluated neighbours)
+    planned_func = None
+
+    if resume_from:
+        state = load_checkpoint(resume_from)
+        csh.restore_transport_state(state['transport_state'])
+        rng.setstate(state['random_state'])
+
+        frontier = state['frontier']
+        weighted_funcs = state['weighted_funcs']
+        config_fitness = state['config_fitness']
+        config_worked = state['config_worked']
+        config_active = state['config_active']
+        config_profile = state['config_profile']
+        best_fitness = state['best_fitness']
+        vars(archive).update(vars(state['archive']))
+        stagnant = state['stagnant']
+        long_term_memory = state['long_term_memory']
+        initial_memory = state['initial_memory']
+        tabu_memory = state['tabu_memory']
+        speculation_memory = state['speculation_memory']
+        planned_func = state['planned_func']
+        if operator_selector:
+            vars(operator_selector).update(vars(state['operator_selector']))
+        if surrogate is not None and state['surrogate'] is not None:
+            vars(surrogate).update(vars(state['surrogate']))
+        first_iteration = state['iteration']
+    else:
+        tried = 0
+        for i, config in enumerate(initial_configs if initial_configs is not None else generator):
+            if i + 1 > max_initial_configs or (i and out_of_time()):
+                break
+            tried += 1
+            if evaluate_config(config) == PENALTY_FITNESS:  # Updates dynamic memory
+                continue
+            long_term_memory.append((config, weighted_funcs))
 
+        if not long_term_memory:
+            # All are penalised alike, so there is no least bad one to start from
+            raise RuntimeError('None of the ' + str(tried) + ' initial configurations could be evaluated, e.g. because '
+                               'verifyta hit a limit of the scheduler or time_limit is too short')
 
+        # Creating the initial configuration and evalutates it
+        long_term_memory.sort(key=(lambda x: config_fitness[x[0]]))
+        initial_memory = long_term_memory.copy()
+        frontier = long_term_memory[0][0]
+        first_iteration = 0
 
-    # Creating the initial configuration and evalutates it
-    long_term_memory.sort(key=(lambda x: config_fitness[x[0]]))
-    initial_memory = long_term_memory.copy()
-    frontier = long_term_memory[0][0]
+    pipeline = EvaluationPipeline(csh, recipes, XML_TEMPLATE, VERIFYTA, workers, instrumentation, runner,
+                                  model_cache, levels) \
+        if workers > 1 and backend == 'verifyta' and evaluator is None else None
+    checkpoints = CheckpointWriter(checkpoint_file) if checkpoint_file else None
 
     nabla = 0
     # Here begins the actual search
-    for i in range(iters):  # TODO: Maybe have stopping criteria instead of iterations, or allow for both.
-        neighbour_func = get_neighbour_func(weighted_funcs)
-        args = [frontier, csh, config_active[frontier]]
-
-        print("Getting Neighbours for " + str(neighbour_func))
-
-        results = []
-
-        try:
-            neighbours = neighbour_func(*args)
-        except RecursionError:
-            frontier, weighted_funcs = backtrack()
-            continue
-        except KeyError:
-            frontier, weighted_funcs = backtrack()
-            continue
-
+    try:
+        yield from incumbents
+        incumbents.clear()
+
+        i = first_iteration
+        while (iters is None or i < iters) and not finished():
+            instrumentation.begin_iteration(i)
+            if planned_func:
+                neighbour_func = planned_func
+                planned_func = None
+            else:
+                neighbour_func = choose_neighbour_func()
+            args = [frontier, csh, config_active[frontier]]
+            name = neighbour_func.__name__
+            started = time.perf_counter()
+
+            print("Getting Neighbours for " + str(neighbour_func))
+
+            best_before = best_fitness
+            deferred = []
+            if pipeline:
+                evaluate = evaluate_neighbours_pipelined
+            elif evaluator is not None and evaluator.batch_size > 1:
+                evaluate = evaluate_neighbours_batched
+            else:
+                evaluate = evaluate_neighbours
 
-        print(str(len(neighbours)) + " to evaluate")
-        for n in neighbours:
+            # Neighbours are generated lazily, so errors from the neighbour function show up while evaluating
             try:
-                results.append((n, evaluate_config(n)))
-            except RuntimeError:
-                #print(neighbour_func)
-                #print(frontier)
-                #print(n)
-                #raise RuntimeError('Could not evalutate a configuration. Func:' + str(neighbour_func))
-                continue
+                if frontier in speculation_memory:
+                    speculated, evaluated = speculation_memory[frontier]
+                    neighbours = iter([n for n in speculated if (n in evaluated or n not in config_fitness)
+                                       and not is_tabu(n)])
+                else:
+                    neighbours = neighbour_func(*args, skip=skip_neighbour, rng=rng,
+                                                profile=config_profile.get(frontier))
+                neighbours = rank_neighbours(instrumentation.timed_iter(neighbours, 'neighbours/' + name))
+                speculation_memory = {}
+
+                with instrumentation.phase('iteration/' + name):
+                    results = evaluate(neighbours, config_fitness[frontier])
+
+                    # Aspiration: when only tabu neighbours are left, one may still be taken if it is a new best
+                    if not results and deferred:
+                        print("Trying " + str(len(deferred)) + " tabu neighbours")
+                        instrumentation.count('tabu/aspiration_tried', len(deferred))
+                        results = [r for r in evaluate(iter(deferred), best_before) if r[1] < best_before]
+            except RecursionError:
+                results = None
             except KeyError:
+                results = None
+
+            if operator_selector:
+                improvement = config_fitness[frontier] - min(r[1] for r in results) if results else 0
+                operator_selector.update(neighbour_func, improvement, time.perf_counter() - started)
+
+            instrumentation.count('evaluated/' + name, len(results or []))
+            instrumentation.count('tabu/deferred', len(deferred))
+            if results is None:
+                instrumentation.count('backtrack/error')
                 frontier, weighted_funcs = backtrack()
-                continue
+            elif results:
+                new_frontier, fitness = min(results, key=lambda x: x[1])
+                tabu_memory.make_move(frontier, new_frontier, fitness, best_before, i,
+                                      {t.m_id for t in csh.transport_modules})
+                frontier = new_frontier
+                long_term_memory.append((frontier, weighted_funcs))
+            else:
+                instrumentation.count('backtrack/exhausted')
+                frontier, weighted_funcs = backtrack()
+                print("Back traced!")
 
+            print("Iter: " + str(i) + "\n" + frontier)
 
-        print("Done with neighbours")
+            stagnant = 0 if best_fitness < best_before else stagnant + 1
+            i += 1
 
-        results.sort(key=lambda x: x[1])
-        new_frontier = None
-        for r in results:
-            if r[0] in short_term_memory:
-                continue
-            else:
-                new_frontier = r[0]
+            if migration and i % migration_every == 0:
+                with instrumentation.phase('migrate'):
+                    migrate()
 
-        if new_frontier:
-            frontier = new_frontier
-            update_short_term(frontier)
-            long_term_memory.append((frontier, weighted_funcs))
-        else:
-            frontier, weighted_funcs = backtrack()
-            print("Back traced!")
+            if checkpoints and i % checkpoint_every == 0:
+                with instrumentation.phase('checkpoint'):
+                    checkpoints.write(search_state(i))
+
+            instrumentation.end_iteration(i - 1, operator=name, evaluated=len(results or []),
+                                          frontier_fitness=config_fitness[frontier], best_fitness=best_fitness)
 
-        print("Iter: " + str(i) + "\n" + frontier)
+            yield from incumbents
+            incumbents.clear()
 
+    finally:
+        if pipeline:
+            pipeline.close()
+        if checkpoints:
+            checkpoints.close()
+        instrumentation.close()
 
-    print("Total of " + str(len(config_fitness)) + " configurations evaluated")
-    result = {(config, fitness) for config, fitness in config_fitness.items() if fitness == min(config_fitness.values())}
-    return result
 
 
 
 
-def weighted_choice(choices):
+def weighted_choice(choices, rng=None):
     """ Randomly picks a choices based on weights
     :param choices: A list of tuples, where the first element of the tuple is a potential choice and the second element
     is the weight with which the choice can be picked
+    :param rng: A random.Random, the random module if None
     :return: A randomly weighted selection of a choice, along with its weight and the index it had.
     """
     values, weights = zip(*choices)
@@ -197,7 +804,7 @@ def weighted_choice(choices):
     for w in weights:
         total += w
         cum_weights.append(total)
-    x = random.random() * total
+    x = (rng or random).random() * total
     i = bisect.bisect_left(cum_weights, x)
     return values[i]
 
@@ -94,6 +94,32 @@ class SquareModule(Module):
     # STATIC VARS
     modules_dictionary = {}
 
+    @classmethod
+    def restore(cls, m_id, wp_time, t_time, queue_length, allow_passthrough=False):
+        """ Recreates a module that was validated when it was first made, e.g. one read from a problem bundle. Skips the
+        checks of the constructor and does not add the module to modules_dictionary, so a module of the same m_id may
+        already exist in this process.
+        :param m_id: Id of the module
+        :param wp_time: A dict of processing times, key is w_type and value the processing time
+        :param t_time: A 4x4 array (list) that defines the travel time from each input to each output of the module
+        :param queue_length: An integer specifying how many recipes that can be in the queue on the module
+        :param allow_passthrough: Boolean that specifies wether a recipe can skip working on a module
+        :return: An unconnected module
+        """
+        module = cls.__new__(cls)
+        module.__up = module.__down = module.__left = module.__right = None
+        module.__in_up = module.__in_down = module.__in_left = module.__in_right = None
+        module.queue_length = queue_length
+        module.allow_passthrough = allow_passthrough
+        module.w_type = set(wp_time.keys())
+        module.shadowed = False
+        module.is_start = False
+        module.is_end = False
+        module.active_w_type = set()
+        Module.__init__(module, connections=[None, None, None, None], m_id=m_id, w_type=module.w_type, p_time=wp_time,
+                        t_time=t_time)
+        return module
+
     @property
     def connections(self):
         return [self.up, self.right, self.down, self.left]
@@ -254,6 +280,16 @@ class SquareModule(Module):
         l = [m.module_str() for m in configuration]
         return ':'.join(l)
 
+    def characteristics(self):
+        """ The properties of the module that end up in the UPPAAL model. Modules with equal characteristics can take
+        each others place without changing how a configuration performs.
+        :return: A hashable tuple
+        """
+        return (tuple(sorted(self.p_time.items())),
+                tuple(map(tuple, self.t_time)),
+                self.queue_length,
+                self.allow_passthrough)
+
 
     def traverse(self, direction, end=None):
         """
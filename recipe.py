@@ -49,10 +49,9 @@ class Recipe:
         """
         G = nx.DiGraph()
 
-        # Gets nodes
-        nodes = {item for sublist in self.values() for item in sublist}
-        nodes |= set(self.keys())
-        G.add_nodes_from(nodes)
+        # Gets nodes, in the order they appear so the graph is the same in every run
+        nodes = list(self.keys()) + [item for sublist in self.values() for item in sublist]
+        G.add_nodes_from(sorted(set(nodes), key=nodes.index))
 
         # Gets edges
         for item in self.items():